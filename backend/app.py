@@ -2,18 +2,77 @@ from flask import Flask, jsonify
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from config import Config
-from models import db, User, Service
+from models import db
 from routes.auth import auth_bp
 from routes.services import services_bp
 from routes.appointments import appointments_bp
 from routes.availability import availability_bp
 from routes.admin import admin_bp
+from routes.waitlist import waitlist_bp
 from routes.health import health_bp
+from routes.calendar import calendar_bp
+from commands import register_commands
+
+def register_blueprints(app):
+    """Register the route blueprints under their URL prefixes"""
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(services_bp, url_prefix='/api/services')
+    app.register_blueprint(appointments_bp, url_prefix='/api/appointments')
+    app.register_blueprint(availability_bp, url_prefix='/api/availability')
+    app.register_blueprint(admin_bp, url_prefix='/api/admin')
+    app.register_blueprint(waitlist_bp, url_prefix='/api/waitlist')
+    app.register_blueprint(health_bp, url_prefix='/api')
+    app.register_blueprint(calendar_bp, url_prefix='/api/calendar')
+
+def backfill_occupancy():
+    """Build the occupancy bitmaps of a database that has appointments but none yet (e.g. after an upgrade)"""
+    from models import Appointment, DayOccupancy
+    from utils.occupancy import BUSY_STATUSES, rebuild_occupancy
+    
+    # Booking conflict checks read only the bitmaps, so missing ones would let old bookings be double-booked
+    if DayOccupancy.query.first() is None and Appointment.query.filter(Appointment.status.in_(BUSY_STATUSES)).first():
+        days = rebuild_occupancy()
+        print(f"Built occupancy bitmaps for {days} days")
+
+def init_database(seed_if_empty=True):
+    """Create tables and seed demo data into an empty database (needs an app context)"""
+    from models import User, Service
+    
+    db.create_all()
+    print("Database tables created successfully")
+    
+    from utils.tenancy import ensure_default_tenant
+    ensure_default_tenant()
+    
+    # create_all never alters existing tables: add what earlier versions did not have
+    from upgrade import upgrade_schema
+    for change in upgrade_schema():
+        print(f"Schema upgrade: {change}")
+    
+    backfill_occupancy()
+    
+    if not seed_if_empty:
+        return
+    
+    user_count = User.query.count()
+    service_count = Service.query.count()
+    
+    if user_count == 0 or service_count == 0:
+        print("Database appears empty, seeding with demo data...")
+        from seed import seed_database
+        seed_database()
+        print("Database seeded successfully!")
 
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
     
+    # Behind a proxy every request comes from the proxy's address; take the client's from its headers
+    hops = app.config['TRUSTED_PROXY_HOPS']
+    if hops:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops)
+    
     db.init_app(app)
     jwt = JWTManager(app)
     CORS(app, origins=app.config['CORS_ORIGINS'], supports_credentials=True)
@@ -31,35 +90,32 @@ def create_app():
     def missing_token_callback(error):
         return jsonify({'error': 'Authorization token is missing', 'code': 'MISSING_TOKEN'}), 401
     
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header, jwt_payload):
+        from utils.revocation import is_revoked
+        return is_revoked(jwt_payload)
+    
     @jwt.revoked_token_loader
     def revoked_token_callback(jwt_header, jwt_payload):
         return jsonify({'error': 'Token has been revoked', 'code': 'TOKEN_REVOKED'}), 401
     
-    app.register_blueprint(auth_bp, url_prefix='/api/auth')
-    app.register_blueprint(services_bp, url_prefix='/api/services')
-    app.register_blueprint(appointments_bp, url_prefix='/api/appointments')
-    app.register_blueprint(availability_bp, url_prefix='/api/availability')
-    app.register_blueprint(admin_bp, url_prefix='/api/admin')
-    app.register_blueprint(health_bp, url_prefix='/api')
+    from utils import ratelimit
+    ratelimit.init_app(app)
+    
+    from utils import tenancy
+    tenancy.init_app(app)
+    
+    register_blueprints(app)
+    register_commands(app)
     
-    with app.app_context():
-        try:
-            db.create_all()
-            print("Database tables created successfully")
-            
-            user_count = User.query.count()
-            service_count = Service.query.count()
-            
-            if user_count == 0 or service_count == 0:
-                print("Database appears empty, seeding with demo data...")
-                try:
-                    from seed import seed_database
-                    seed_database()
-                    print("Database seeded successfully!")
-                except Exception as seed_error:
-                    print(f"Warning: Could not seed database: {seed_error}")
-        except Exception as e:
-            print(f"Warning: Could not create database tables: {e}")
+    # Fast boot by default: schema creation and seeding run via `flask init-db`.
+    # AUTO_INIT_DB=true restores the old create-and-seed-on-startup behaviour.
+    if app.config['AUTO_INIT_DB']:
+        with app.app_context():
+            try:
+                init_database()
+            except Exception as e:
+                print(f"Warning: Could not initialize database: {e}")
     
     return app
 
@@ -0,0 +1,271 @@
+"""
+Async serving mode for the read-heavy endpoints (ping, services, availability)
+and the live availability stream
+
+Runs next to the Flask app (app.py) and shares its models and booking logic.
+The booking logic is synchronous code written against a session, so each request
+runs it through AsyncSession.run_sync on top of an async driver (asyncpg/aiosqlite):
+a slow query yields the event loop instead of pinning a worker, and the days of a
+range request are computed concurrently, each on its own session.
+
+In multi-tenant mode requests name their tenant with the X-Tenant header (these
+endpoints are public, so there is no token to take it from); handlers run inside
+tenant_scope() so the shared booking logic is scoped exactly as in the Flask app.
+
+Run with:
+    uvicorn asgi:app --port 5001
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker --workers 2
+"""
+import asyncio
+import functools
+from contextlib import asynccontextmanager
+from datetime import datetime
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from config import Config
+from models import Service
+from routes.availability import parse_date_range
+from utils.booking_logic import get_available_slots, serialize_slot
+from utils.catalogue import get_catalogue
+from utils.events import bus, get_backend
+from utils.sse import day_topics, diff_slots, sse_keepalive, sse_message, sse_retry
+from utils.tenancy import DEFAULT_TENANT_ID, TENANT_HEADER, tenant_for_slug, tenant_scope
+
+engine = create_async_engine(Config.ASYNC_DATABASE_URI, pool_pre_ping=True)
+async_session = async_sessionmaker(engine, expire_on_commit=False)
+
+# Bounds the number of per-day queries a single range request runs at once
+day_semaphore = asyncio.Semaphore(Config.ASYNC_MAX_CONCURRENCY)
+
+async def raw_slots_for_day(date, duration_minutes, tz_name):
+    """Compute one day's slots (epoch minutes) on a dedicated session (sessions are not concurrency-safe)"""
+    async with day_semaphore:
+        async with async_session() as session:
+            return await session.run_sync(
+                lambda sync_session: get_available_slots(
+                    date, duration_minutes, session=sync_session, tz_name=tz_name
+                )
+            )
+
+async def slots_for_day(date, duration_minutes, tz_name):
+    return [serialize_slot(slot, tz_name) for slot in await raw_slots_for_day(date, duration_minutes, tz_name)]
+
+async def request_tenant(request):
+    """Tenant id named by the request (always the default one unless MULTI_TENANT), or None if unknown"""
+    if not Config.MULTI_TENANT:
+        return DEFAULT_TENANT_ID
+    slug = request.headers.get(TENANT_HEADER) or Config.DEFAULT_TENANT
+    async with async_session() as session:
+        return await session.run_sync(lambda sync_session: tenant_for_slug(slug, sync_session))
+
+def tenant_scoped(handler):
+    """Run a handler inside the tenant scope of its request (also kept in request.state.tenant_id)"""
+    @functools.wraps(handler)
+    async def wrapper(request):
+        tenant_id = await request_tenant(request)
+        if tenant_id is None:
+            return JSONResponse({'error': 'Unknown tenant', 'code': 'UNKNOWN_TENANT'}, status_code=404)
+        request.state.tenant_id = tenant_id
+        # Tasks created inside (asyncio.gather) copy the scope along with the rest of the context
+        with tenant_scope(tenant_id):
+            return await handler(request)
+    return wrapper
+
+async def ping(request):
+    """Simple ping endpoint for keep-alive"""
+    return JSONResponse({'status': 'ok', 'message': 'pong'})
+
+@tenant_scoped
+async def get_services(request):
+    """Get all services (public endpoint, served from the precomputed catalogue)"""
+    try:
+        # Usually a memory lookup; the session connects only to rebuild or revalidate, and
+        # DerivedCache holds no lock over those queries, so concurrent cold requests each
+        # await their own query instead of blocking the event loop
+        async with async_session() as session:
+            catalogue = await session.run_sync(get_catalogue)
+        encoding, body = catalogue.negotiate(request.headers.get('accept-encoding'))
+        etag = f'"{catalogue.etag}"' if encoding == 'identity' else f'"{catalogue.etag}-{encoding}"'
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+        if Config.MULTI_TENANT:
+            headers['Vary'] += f', {TENANT_HEADER}'
+        if etag in request.headers.get('if-none-match', ''):
+            return Response(status_code=304, headers=headers)
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(body, media_type='application/json', headers=headers)
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+@tenant_scoped
+async def get_service(request):
+    """Get a specific service"""
+    try:
+        async with async_session() as session:
+            service = await session.get(Service, request.path_params['service_id'])
+        if not service:
+            return JSONResponse({'error': 'Service not found'}, status_code=404)
+        return JSONResponse({'service': service.to_dict()})
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+@tenant_scoped
+async def get_availability(request):
+    """Get available time slots for a service on a specific date"""
+    try:
+        service_id = request.query_params.get('service_id')
+        date_str = request.query_params.get('date')
+
+        if not service_id:
+            return JSONResponse({'error': 'service_id is required'}, status_code=400)
+
+        if not date_str:
+            return JSONResponse({'error': 'date is required'}, status_code=400)
+
+        try:
+            date = datetime.strptime(date_str, '%Y-%m-%d').date()
+        except ValueError:
+            return JSONResponse({'error': 'Invalid date format. Use YYYY-MM-DD'}, status_code=400)
+
+        async with async_session() as session:
+            service = await session.get(Service, int(service_id))
+        if not service:
+            return JSONResponse({'error': 'Service not found'}, status_code=404)
+
+        return JSONResponse({
+            'date': date_str,
+            'service_id': int(service_id),
+            'service_duration': service.duration_minutes,
+            'timezone': service.tz_name,
+            'available_slots': await slots_for_day(date, service.duration_minutes, service.tz_name)
+        })
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+@tenant_scoped
+async def get_availability_range(request):
+    """Get available time slots for every day in a date range, one concurrent query per day"""
+    try:
+        service_id = request.query_params.get('service_id')
+        if not service_id:
+            return JSONResponse({'error': 'service_id is required'}, status_code=400)
+
+        dates, error = parse_date_range(request.query_params.get('start'), request.query_params.get('end'))
+        if error:
+            return JSONResponse({'error': error}, status_code=400)
+
+        async with async_session() as session:
+            service = await session.get(Service, int(service_id))
+        if not service:
+            return JSONResponse({'error': 'Service not found'}, status_code=404)
+
+        per_day = await asyncio.gather(*(
+            slots_for_day(date, service.duration_minutes, service.tz_name) for date in dates
+        ))
+
+        return JSONResponse({
+            'service_id': int(service_id),
+            'service_duration': service.duration_minutes,
+            'timezone': service.tz_name,
+            'days': [
+                {'date': date.isoformat(), 'available_slots': slots}
+                for date, slots in zip(dates, per_day)
+            ]
+        })
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+@tenant_scoped
+async def stream_availability(request):
+    """Server-sent events for a service and date (needs EVENTS_BACKEND=postgres to see other processes' bookings)"""
+    service_id = request.query_params.get('service_id')
+    date_str = request.query_params.get('date')
+    if not service_id or not date_str:
+        return JSONResponse({'error': 'service_id and date are required'}, status_code=400)
+
+    try:
+        date = datetime.strptime(date_str, '%Y-%m-%d').date()
+    except ValueError:
+        return JSONResponse({'error': 'Invalid date format. Use YYYY-MM-DD'}, status_code=400)
+
+    async with async_session() as session:
+        service = await session.get(Service, int(service_id))
+    if not service:
+        return JSONResponse({'error': 'Service not found'}, status_code=404)
+
+    duration, tz_name = service.duration_minutes, service.tz_name
+    tenant_id = request.state.tenant_id
+    loop = asyncio.get_running_loop()
+
+    async def current_slots():
+        # The body is iterated after the handler returned, outside its tenant scope
+        with tenant_scope(tenant_id):
+            return {slot: serialize_slot(slot, tz_name) for slot in await raw_slots_for_day(date, duration, tz_name)}
+
+    async def generate():
+        changes = asyncio.Queue()
+        # Events are dispatched on other threads (the publisher or the LISTEN thread)
+        token = bus.subscribe(
+            day_topics(date, tenant_id), lambda topic, payload: loop.call_soon_threadsafe(changes.put_nowait, payload)
+        )
+        try:
+            slots = await current_slots()
+            event_id = 1
+            yield sse_retry()
+            yield sse_message('snapshot', {
+                'date': date_str,
+                'service_id': service.id,
+                'timezone': tz_name,
+                'available_slots': list(slots.values())
+            }, event_id)
+
+            deadline = loop.time() + Config.SSE_MAX_SECONDS
+            while (remaining := deadline - loop.time()) > 0:
+                try:
+                    await asyncio.wait_for(changes.get(), timeout=min(Config.SSE_KEEPALIVE_SECONDS, remaining))
+                except asyncio.TimeoutError:
+                    yield sse_keepalive()
+                    continue
+                while not changes.empty():
+                    changes.get_nowait()
+
+                latest = await current_slots()
+                delta = diff_slots(slots, latest)
+                slots = latest
+                if delta['added'] or delta['removed']:
+                    event_id += 1
+                    yield sse_message('delta', delta, event_id)
+        finally:
+            bus.unsubscribe(token)
+
+    return StreamingResponse(generate(), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+routes = [
+    Route('/api/ping', ping, methods=['GET']),
+    Route('/api/services', get_services, methods=['GET']),
+    Route('/api/services/{service_id:int}', get_service, methods=['GET']),
+    Route('/api/availability', get_availability, methods=['GET']),
+    Route('/api/availability/range', get_availability_range, methods=['GET']),
+    Route('/api/availability/stream', stream_availability, methods=['GET']),
+]
+
+middleware = [
+    Middleware(CORSMiddleware, allow_origins=Config.CORS_ORIGINS, allow_credentials=True,
+               allow_methods=['GET'], allow_headers=['*'])
+]
+
+@asynccontextmanager
+async def lifespan(app):
+    # Start the cross-worker event listener (if any) before streams subscribe
+    get_backend()
+    yield
+    await engine.dispose()
+
+app = Starlette(routes=routes, middleware=middleware, lifespan=lifespan)
@@ -0,0 +1,113 @@
+"""
+Benchmark: month availability fan-out, sync (serial) vs async (concurrent), under I/O latency
+
+Builds a throwaway SQLite database, then computes a month of availability the way
+the Flask endpoint does (one day after another) and the way asgi.py does (all days
+concurrently on an async driver). A fixed per-query latency is injected around each
+day to stand in for a remote database round trip.
+
+Usage (from backend/):
+    python benchmarks/bench_async_availability.py [--days 31] [--latency-ms 20] [--requests 8]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, time as dtime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def setup_database(path):
+    """Create schema plus working hours and a few appointments per day"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from models import db, WorkingHours, Appointment, User, Service
+    from utils.occupancy import rebuild_occupancy
+
+    engine = create_engine(f'sqlite:///{path}')
+    db.metadata.create_all(engine)
+    with Session(engine) as session:
+        user = User(email='bench@example.com', role='client', password_hash='x')
+        service = Service(name='Bench', duration_minutes=30, price=10)
+        session.add_all([user, service])
+        session.flush()
+        for day in range(7):
+            session.add(WorkingHours(day_of_week=day, start_time=dtime(9, 0), end_time=dtime(18, 0)))
+        start = date.today() + timedelta(days=1)
+        for offset in range(62):
+            day_start = datetime.combine(start + timedelta(days=offset), dtime(10, 0))
+            for hour in range(0, 6, 2):
+                slot = day_start + timedelta(hours=hour)
+                session.add(Appointment(user_id=user.id, service_id=service.id, start_time=slot,
+                                        end_time=slot + timedelta(minutes=30), status='confirmed'))
+        session.commit()
+        # Availability reads the bitmaps, not the appointments
+        rebuild_occupancy(session=session)
+    engine.dispose()
+
+def run_sync(path, dates, latency, requests):
+    """Serial per-day computation, as a sync worker does it"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from utils.booking_logic import get_available_slots
+
+    engine = create_engine(f'sqlite:///{path}')
+    started = time.perf_counter()
+    for _ in range(requests):
+        for day in dates:
+            time.sleep(latency)
+            with Session(engine) as session:
+                get_available_slots(day, 30, session=session)
+    elapsed = time.perf_counter() - started
+    engine.dispose()
+    return elapsed
+
+async def run_async(path, dates, latency, requests):
+    """Concurrent per-day computation on an async driver, as asgi.py does it"""
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from utils.booking_logic import get_available_slots
+
+    engine = create_async_engine(f'sqlite+aiosqlite:///{path}')
+    session_factory = async_sessionmaker(engine)
+
+    async def one_day(day):
+        await asyncio.sleep(latency)
+        async with session_factory() as session:
+            return await session.run_sync(lambda s: get_available_slots(day, 30, session=s))
+
+    async def one_request():
+        return await asyncio.gather(*(one_day(day) for day in dates))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one_request() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    await engine.dispose()
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=31)
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--requests', type=int, default=8, help='concurrent month requests')
+    args = parser.parse_args()
+
+    latency = args.latency_ms / 1000.0
+    start = date.today() + timedelta(days=1)
+    dates = [start + timedelta(days=i) for i in range(args.days)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        setup_database(path)
+
+        sync_elapsed = run_sync(path, dates, latency, args.requests)
+        async_elapsed = asyncio.run(run_async(path, dates, latency, args.requests))
+
+    print(f"{args.requests} month requests x {args.days} days, {args.latency_ms:.0f} ms injected latency per query")
+    print(f"  sync  (serial days, one worker): {sync_elapsed * 1000:8.1f} ms")
+    print(f"  async (concurrent days):         {async_elapsed * 1000:8.1f} ms")
+    print(f"  speedup: {sync_elapsed / async_elapsed:.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark: memory and time to hold a busy day, ORM rows + dicts vs BusyIntervals
+
+Loads the busy appointments of a range the old way (Appointment instances in the
+identity map, copied into {'start', 'end'} dicts, as get_existing_appointments used
+to) and the new way (a column-only query into BusyIntervals' epoch-minute arrays),
+and reports the memory retained by each result (tracemalloc) and the load time.
+
+Usage (from backend/):
+    python benchmarks/bench_busy_memory.py [--appointments 2000] [--days 1] [--runs 5]
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta, time as dtime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def setup_database(path, appointments, days):
+    """Create schema and `appointments` back-to-back bookings spread over `days`"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from models import db, Appointment, User, Service
+
+    engine = create_engine(f'sqlite:///{path}')
+    db.metadata.create_all(engine)
+    with Session(engine) as session:
+        user = User(email='bench@example.com', role='client', password_hash='x')
+        service = Service(name='Bench', duration_minutes=1, price=10)
+        session.add_all([user, service])
+        session.flush()
+        start = datetime.combine(date(2030, 1, 1), dtime.min)
+        per_day = max(1, appointments // days)
+        rows = []
+        for index in range(appointments):
+            day, slot = divmod(index, per_day)
+            # Squeeze the day's bookings into 24h: one every (1440 / per_day) minutes
+            offset = timedelta(days=day, minutes=slot * 1440 / per_day)
+            rows.append({'user_id': user.id, 'service_id': service.id, 'status': 'confirmed',
+                         'start_time': start + offset, 'end_time': start + offset + timedelta(minutes=1),
+                         'version': 1})
+        session.bulk_insert_mappings(Appointment, rows)
+        session.commit()
+    engine.dispose()
+    return start, start + timedelta(days=days)
+
+def load_orm(session, start, end):
+    """The previous conflict-check path: ORM instances copied into per-row dicts"""
+    from models import Appointment
+    appointments = session.query(Appointment).filter(
+        Appointment.start_time >= start,
+        Appointment.start_time < end,
+        Appointment.status == 'confirmed'
+    ).all()
+    return appointments, [{'start': app.start_time, 'end': app.end_time} for app in appointments]
+
+def load_compact(session, start, end):
+    from utils.booking_logic import load_busy_intervals
+    return load_busy_intervals(start, end, session=session)
+
+def measure(engine, loader, start, end, runs):
+    """(retained bytes, best seconds) for one loader"""
+    from sqlalchemy.orm import Session
+
+    retained, best = None, float('inf')
+    for _ in range(runs):
+        with Session(engine) as session:
+            gc.collect()
+            tracemalloc.start()
+            baseline = tracemalloc.get_traced_memory()[0]
+            started = time.perf_counter()
+            result = loader(session, start, end)
+            elapsed = time.perf_counter() - started
+            gc.collect()
+            current = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            retained = current - baseline
+            best = min(best, elapsed)
+            del result
+    return retained, best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--appointments', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=1)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    from sqlalchemy import create_engine
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        start, end = setup_database(path, args.appointments, args.days)
+        engine = create_engine(f'sqlite:///{path}')
+
+        print(f"{args.appointments} appointments over {args.days} day(s), best of {args.runs}")
+        results = {}
+        for name, loader in (('orm + dicts', load_orm), ('BusyIntervals', load_compact)):
+            retained, seconds = measure(engine, loader, start, end, args.runs)
+            results[name] = retained
+            print(f"{name:15s} {retained / 1024:10.1f} KiB  {retained / args.appointments:8.1f} B/row  "
+                  f"{seconds * 1000:8.2f} ms")
+        print(f"memory reduction: {results['orm + dicts'] / max(1, results['BusyIntervals']):.1f}x")
+        engine.dispose()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmark: worker boot time (fresh interpreter importing app:app, as a gunicorn worker does)
+
+Compares the default fast boot with AUTO_INIT_DB=true, which creates tables and
+counts users/services on every start. Each sample is a new Python process so module
+import costs are included.
+
+Usage (from backend/):
+    python benchmarks/bench_startup.py [--runs 5] [--database-url sqlite:////tmp/bookease.db]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = (
+    "import time; started = time.perf_counter(); "
+    "import app; "
+    "print((time.perf_counter() - started) * 1000)"
+)
+
+def measure(env, runs):
+    """Boot times in milliseconds for `runs` fresh processes"""
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-c', PROBE], cwd=BACKEND_DIR, env=env,
+            capture_output=True, text=True, check=True
+        )
+        samples.append(float(result.stdout.strip().splitlines()[-1]))
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--database-url', default=None, help='defaults to a throwaway SQLite file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite:///{os.path.join(tmp, 'startup.db')}"
+        base_env = dict(os.environ, DATABASE_URL=database_url)
+
+        # Prepare the schema once so both modes start from an initialized database
+        subprocess.run(
+            [sys.executable, '-m', 'flask', '--app', 'app', 'init-db'], cwd=BACKEND_DIR,
+            env=base_env, capture_output=True, check=True
+        )
+
+        results = {
+            'fast boot (default)': measure(dict(base_env, AUTO_INIT_DB='false'), args.runs),
+            'AUTO_INIT_DB=true': measure(dict(base_env, AUTO_INIT_DB='true'), args.runs),
+        }
+
+    for label, samples in results.items():
+        print(f"{label:22s} median {statistics.median(samples):7.1f} ms  "
+              f"min {min(samples):7.1f} ms  max {max(samples):7.1f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+Flask CLI commands (run from backend/ with: python -m flask --app app <command>)
+"""
+import time
+import click
+from datetime import datetime
+
+def register_commands(app):
+    """Attach the maintenance commands to the app's CLI"""
+    
+    @app.cli.command('init-db')
+    @click.option('--seed/--no-seed', default=True, help='Seed demo data if the database is empty')
+    def init_db_command(seed):
+        """Create database tables (and seed demo data into an empty database)"""
+        from app import init_database
+        init_database(seed_if_empty=seed)
+    
+    @app.cli.command('upgrade-db')
+    def upgrade_db_command():
+        """Add the columns, indexes and constraints an existing database is missing (init-db also does this)"""
+        from app import backfill_occupancy
+        from models import db
+        from upgrade import upgrade_schema
+        from utils.tenancy import ensure_default_tenant
+        
+        db.create_all()
+        ensure_default_tenant()
+        changes = upgrade_schema()
+        for change in changes:
+            click.echo(change)
+        backfill_occupancy()
+        click.echo(f"Schema up to date ({len(changes)} changes)")
+    
+    @app.cli.command('seed')
+    @click.option('--tenant', default=None, help='Slug of the tenant to seed (default: the default tenant)')
+    def seed_command(tenant):
+        """Insert or refresh the demo users, services and working hours"""
+        from seed import seed_database
+        from utils.tenancy import DEFAULT_TENANT_ID, tenant_for_slug, tenant_scope
+        
+        tenant_id = tenant_for_slug(tenant) if tenant else DEFAULT_TENANT_ID
+        if tenant_id is None:
+            raise click.ClickException(f"Unknown tenant: {tenant}")
+        with tenant_scope(tenant_id):
+            seed_database()
+    
+    @app.cli.command('create-tenant')
+    @click.argument('slug')
+    @click.argument('name')
+    def create_tenant_command(slug, name):
+        """Add a business to a multi-tenant deployment (clients select it with the X-Tenant header)"""
+        from models import db, Tenant
+        from utils.tenancy import ensure_default_tenant
+        
+        ensure_default_tenant()
+        if Tenant.query.filter_by(slug=slug).first():
+            raise click.ClickException(f"Tenant {slug} already exists")
+        tenant = Tenant(slug=slug, name=name)
+        db.session.add(tenant)
+        db.session.commit()
+        click.echo(f"Created tenant {slug} (id {tenant.id})")
+    
+    @app.cli.command('seed-synthetic')
+    @click.option('--users', default=1000, show_default=True)
+    @click.option('--services', default=50, show_default=True)
+    @click.option('--appointments', default=100000, show_default=True)
+    @click.option('--future-days', default=60, show_default=True, help='How far ahead bookings reach')
+    @click.option('--fill-rate', default=0.75, show_default=True, help='Share of open minutes booked per day')
+    @click.option('--cancel-rate', default=0.1, show_default=True, help='Share of cancelled appointments')
+    @click.option('--batch-size', default=10000, show_default=True, help='Rows per insert/COPY batch')
+    @click.option('--seed', default=42, show_default=True, help='Random seed (also namespaces user emails)')
+    @click.option('--replace-hours', is_flag=True,
+                  help='Overwrite existing working hours with 9-18, Mon-Sat (default: only set them if none exist)')
+    def seed_synthetic_command(users, services, appointments, future_days, fill_rate,
+                               cancel_rate, batch_size, seed, replace_hours):
+        """Bulk load a synthetic dataset for capacity planning"""
+        from synthetic import SyntheticConfig, seed_synthetic
+        
+        config = SyntheticConfig(
+            users=users, services=services, appointments=appointments, future_days=future_days,
+            fill_rate=fill_rate, cancel_rate=cancel_rate, batch_size=batch_size, seed=seed,
+            replace_hours=replace_hours
+        )
+        for stat in seed_synthetic(config):
+            click.echo(f"{stat.table:15s} {stat.rows:10d} rows  {stat.seconds:8.2f} s  "
+                       f"{stat.rows_per_second:12,.0f} rows/s")
+    
+    @app.cli.command('geocode-services')
+    @click.option('--all', 'refresh_all', is_flag=True, help='Re-geocode services that already have coordinates')
+    def geocode_services_command(refresh_all):
+        """Fill in latitude/longitude for services from their address"""
+        from models import db, Service
+        from utils.geo import geocode
+        
+        query = Service.query
+        if not refresh_all:
+            query = query.filter(Service.latitude.is_(None))
+        count = 0
+        for service in query:
+            service.latitude, service.longitude = geocode(service.address) or (None, None)
+            count += 1
+        db.session.commit()
+        click.echo(f"Geocoded {count} services")
+    
+    @app.cli.command('rebuild-occupancy')
+    @click.option('--since', default=None, help='Only rebuild days from this date on (YYYY-MM-DD)')
+    def rebuild_occupancy_command(since):
+        """Regenerate the per-day occupancy bitmaps from the appointments table"""
+        from utils.occupancy import rebuild_occupancy
+        
+        start_date = datetime.strptime(since, '%Y-%m-%d').date() if since else None
+        days = rebuild_occupancy(start_date)
+        click.echo(f"Rebuilt occupancy bitmaps for {days} days")
+    
+    @app.cli.command('archive-appointments')
+    @click.option('--retention-days', type=int, default=None,
+                  help='Archive appointments older than this (default: ARCHIVE_RETENTION_DAYS)')
+    @click.option('--batch-size', default=5000, show_default=True, help='Appointments moved per transaction')
+    @click.option('--every', type=int, default=None,
+                  help='Keep running and archive every N seconds (background mode)')
+    def archive_appointments_command(retention_days, batch_size, every):
+        """Move old completed/cancelled appointments to the archive table"""
+        from utils.archive import archive_expired
+        
+        retention_days = retention_days or app.config['ARCHIVE_RETENTION_DAYS']
+        while True:
+            moved = archive_expired(retention_days, batch_size)
+            click.echo(f"Archived {moved} appointments older than {retention_days} days")
+            if not every:
+                break
+            time.sleep(every)
+    
+    @app.cli.command('complete-appointments')
+    @click.option('--grace-minutes', type=int, default=None,
+                  help='Complete bookings that ended this long ago (default: AUTO_COMPLETE_GRACE_MINUTES)')
+    @click.option('--batch-size', default=5000, show_default=True, help='Appointments updated per transaction')
+    @click.option('--every', type=int, default=None,
+                  help='Keep running and complete every N seconds (background mode)')
+    def complete_appointments_command(grace_minutes, batch_size, every):
+        """Mark past confirmed appointments as completed"""
+        from utils.completion import complete_expired
+        
+        if grace_minutes is None:
+            grace_minutes = app.config['AUTO_COMPLETE_GRACE_MINUTES']
+        while True:
+            completed = complete_expired(grace_minutes, batch_size)
+            click.echo(f"Completed {completed} appointments that ended over {grace_minutes} minutes ago")
+            if not every:
+                break
+            time.sleep(every)
+    
+    @app.cli.command('outbox-worker')
+    @click.option('--threads', default=4, show_default=True, help='Handlers run concurrently')
+    @click.option('--batch-size', default=100, show_default=True, help='Messages claimed per round trip')
+    @click.option('--poll-interval', default=1.0, show_default=True, help='Seconds to wait when nothing is due')
+    @click.option('--once', is_flag=True, help='Exit once no message is due instead of polling')
+    def outbox_worker_command(threads, batch_size, poll_interval, once):
+        """Process the outbox (notifications and other post-booking work)"""
+        from utils.outbox import run_worker
+        
+        run_worker(app, threads=threads, batch_size=batch_size, poll_interval=poll_interval,
+                   once=once, log=click.echo)
+    
+    @app.cli.command('reminder-dispatcher')
+    @click.option('--batch-size', default=200, show_default=True, help='Reminders sent per batch')
+    @click.option('--channel', default=None, help='Notification channel (default: NOTIFICATION_CHANNEL)')
+    @click.option('--once', is_flag=True, help='Send what is due now and exit')
+    def reminder_dispatcher_command(batch_size, channel, once):
+        """Send appointment reminders REMINDER_HOURS before each confirmed booking"""
+        from utils.notifications import get_channel
+        from utils.reminders import ReminderDispatcher
+        
+        with app.app_context():
+            sender = get_channel(channel) if channel else None
+        ReminderDispatcher(app, sender, batch_size, log=click.echo).run(once=once)
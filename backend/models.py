@@ -1,6 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, literal_column
+from sqlalchemy.dialects import postgresql  # registers the typed to_tsvector()/to_tsquery() functions
+from sqlalchemy.orm import declared_attr
 from datetime import datetime, time, timezone
 from werkzeug.security import generate_password_hash, check_password_hash
+from utils.tenancy import current_tenant_or_default
 
 db = SQLAlchemy()
 
@@ -8,15 +12,48 @@ def get_utc_now():
     """Helper function to get current UTC time as naive datetime"""
     return datetime.now(timezone.utc).replace(tzinfo=None)
 
-class User(db.Model):
+class Tenant(db.Model):
+    """A business hosted on this deployment (see utils/tenancy.py)"""
+    __tablename__ = 'tenants'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    slug = db.Column(db.String(64), unique=True, nullable=False)  # sent by clients in the X-Tenant header
+    name = db.Column(db.String(200), nullable=False)
+    created_at = db.Column(db.DateTime, default=get_utc_now)
+    
+    def to_dict(self):
+        """Convert tenant to dictionary"""
+        return {
+            'id': self.id,
+            'slug': self.slug,
+            'name': self.name,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+class TenantScoped:
+    """Rows belonging to one tenant: queries are scoped to the current tenant automatically"""
+    
+    @declared_attr
+    def tenant_id(cls):
+        # The server default covers raw bulk loads (COPY) into the default tenant
+        return db.Column(db.Integer, db.ForeignKey('tenants.id'), nullable=False,
+                         default=current_tenant_or_default, server_default='1')
+
+class User(TenantScoped, db.Model):
     """User model with role-based access"""
     __tablename__ = 'users'
+    # Email addresses are unique per tenant; the index also serves login lookups
+    __table_args__ = (
+        db.UniqueConstraint('tenant_id', 'email', name='uq_users_tenant_email'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(120), unique=True, nullable=False, index=True)
+    email = db.Column(db.String(120), nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
     role = db.Column(db.String(20), nullable=False, default='client')  # 'admin' or 'client'
     created_at = db.Column(db.DateTime, default=get_utc_now)
+    # Signed into the calendar feed URLs issued to the user; bumping it revokes them all
+    feed_generation = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Relationships
     appointments = db.relationship('Appointment', backref='user', lazy=True, cascade='all, delete-orphan')
@@ -42,9 +79,12 @@ class User(db.Model):
         """Check if user is admin"""
         return self.role == 'admin'
 
-class Service(db.Model):
+class Service(TenantScoped, db.Model):
     """Service model"""
     __tablename__ = 'services'
+    __table_args__ = (
+        db.Index('ix_services_tenant_created', 'tenant_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
@@ -52,12 +92,22 @@ class Service(db.Model):
     duration_minutes = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Numeric(10, 2), nullable=False)
     address = db.Column(db.String(500), nullable=True)
+    latitude = db.Column(db.Float, nullable=True)  # geocoded from address (see utils/geo.py)
+    longitude = db.Column(db.Float, nullable=True)
+    timezone = db.Column(db.String(64), nullable=True)  # IANA name of the location; None = DEFAULT_TIMEZONE
     image_url = db.Column(db.String(500), nullable=True)
     created_at = db.Column(db.DateTime, default=get_utc_now)
+    updated_at = db.Column(db.DateTime, default=get_utc_now, onupdate=get_utc_now)
     
     # Relationships
     appointments = db.relationship('Appointment', backref='service', lazy=True, cascade='all, delete-orphan')
     
+    @property
+    def tz_name(self):
+        """Timezone the service's working hours are expressed in"""
+        from utils.tz import default_timezone
+        return self.timezone or default_timezone()
+    
     def to_dict(self):
         """Convert service to dictionary"""
         return {
@@ -67,47 +117,119 @@ class Service(db.Model):
             'duration_minutes': self.duration_minutes,
             'price': float(self.price) if self.price else 0.0,
             'address': self.address,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'timezone': self.tz_name,
             'image_url': self.image_url,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
-class Appointment(db.Model):
+def service_search_vector():
+    """PostgreSQL tsvector over name, description and address (matches the GIN index below)"""
+    # coalesce/|| rather than concat_ws (index expressions must be immutable), and literals
+    # rather than bound parameters so queries repeat the indexed expression exactly
+    empty, space = literal_column("''"), literal_column("' '")
+    document = (func.coalesce(Service.name, empty) + space + func.coalesce(Service.description, empty) +
+                space + func.coalesce(Service.address, empty))
+    return func.to_tsvector(literal_column("'english'::regconfig"), document)
+
+# Expression index used by /api/services/search; other databases use the in-process index
+db.Index(
+    'ix_services_search_vector', service_search_vector(),
+    postgresql_using='gin', _table=Service.__table__
+).ddl_if(dialect='postgresql')
+
+def appointment_dict(appointment, include_user=False):
+    """Fields shared by live and archived appointments"""
+    result = {
+        'id': appointment.id,
+        'user_id': appointment.user_id,
+        'service_id': appointment.service_id,
+        'service_name': appointment.service.name if appointment.service else None,
+        'start_time': appointment.start_time.isoformat() if appointment.start_time else None,
+        'end_time': appointment.end_time.isoformat() if appointment.end_time else None,
+        'status': appointment.status,
+        'created_at': appointment.created_at.isoformat() if appointment.created_at else None
+    }
+    if include_user and appointment.user:
+        result['user'] = {'email': appointment.user.email}
+    return result
+
+class Appointment(TenantScoped, db.Model):
     """Appointment model"""
     __tablename__ = 'appointments'
+    __table_args__ = (
+        db.Index('ix_appointments_tenant_start', 'tenant_id', 'start_time'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     service_id = db.Column(db.Integer, db.ForeignKey('services.id'), nullable=False, index=True)
-    start_time = db.Column(db.DateTime, nullable=False, index=True)
+    start_time = db.Column(db.DateTime, nullable=False)
     end_time = db.Column(db.DateTime, nullable=False)
-    status = db.Column(db.String(20), nullable=False, default='confirmed')  # 'confirmed', 'cancelled', 'completed'
+    status = db.Column(db.String(20), nullable=False, default='confirmed')  # 'confirmed', 'cancelled', 'completed', 'no_show'
     created_at = db.Column(db.DateTime, default=get_utc_now)
+    updated_at = db.Column(db.DateTime, default=get_utc_now, onupdate=get_utc_now)
+    # Bumped on every UPDATE, which is issued as "... WHERE id = ? AND version = ?" so a
+    # concurrent change makes the second writer fail instead of silently overwriting
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    
+    __mapper_args__ = {'version_id_col': version}
+    
+    def etag(self):
+        """Entity tag for conditional requests (changes with every update)"""
+        return f'{self.id}-{self.version}'
     
     def to_dict(self, include_user=False):
         """Convert appointment to dictionary"""
-        result = {
-            'id': self.id,
-            'user_id': self.user_id,
-            'service_id': self.service_id,
-            'service_name': self.service.name if self.service else None,
-            'start_time': self.start_time.isoformat() if self.start_time else None,
-            'end_time': self.end_time.isoformat() if self.end_time else None,
-            'status': self.status,
-            'created_at': self.created_at.isoformat() if self.created_at else None
-        }
-        if include_user and self.user:
-            result['user'] = {'email': self.user.email}
+        result = appointment_dict(self, include_user)
+        result['version'] = self.version
         return result
 
-class WorkingHours(db.Model):
-    """Working hours model for each day of the week"""
+class AppointmentArchive(TenantScoped, db.Model):
+    """Cold storage for old completed/cancelled appointments (see utils/archive.py)
+    
+    On PostgreSQL the table is declaratively partitioned by month of start_time; the
+    archiver creates partitions as needed. There are no foreign keys so that deleting
+    a user or service never has to touch archived history.
+    """
+    __tablename__ = 'appointments_archive'
+    __table_args__ = (
+        db.Index('ix_appointments_archive_tenant_start', 'tenant_id', 'start_time'),
+        {'postgresql_partition_by': 'RANGE (start_time)'}
+    )
+    
+    # The partition key has to be part of the primary key
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    start_time = db.Column(db.DateTime, primary_key=True)
+    tenant_id = db.Column(db.Integer, nullable=False, default=current_tenant_or_default)  # no foreign key, as above
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    service_id = db.Column(db.Integer, nullable=False, index=True)
+    end_time = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=get_utc_now)
+    
+    service = db.relationship('Service', primaryjoin='foreign(AppointmentArchive.service_id) == Service.id', viewonly=True)
+    user = db.relationship('User', primaryjoin='foreign(AppointmentArchive.user_id) == User.id', viewonly=True)
+    
+    def to_dict(self, include_user=False):
+        """Convert archived appointment to dictionary (archived rows are never updated, so no version)"""
+        return appointment_dict(self, include_user)
+
+class WorkingHours(TenantScoped, db.Model):
+    """Working hours model: one row per opening interval of a weekday (several for split shifts)"""
     __tablename__ = 'working_hours'
+    __table_args__ = (
+        db.Index('ix_working_hours_tenant_day', 'tenant_id', 'day_of_week'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    day_of_week = db.Column(db.Integer, nullable=False, unique=True)  # 0-6 (Monday-Sunday)
+    day_of_week = db.Column(db.Integer, nullable=False)  # 0-6 (Monday-Sunday)
     start_time = db.Column(db.Time, nullable=False)
     end_time = db.Column(db.Time, nullable=False)
     is_available = db.Column(db.Boolean, default=True, nullable=False)
+    updated_at = db.Column(db.DateTime, default=get_utc_now, onupdate=get_utc_now)
     
     def to_dict(self):
         """Convert working hours to dictionary"""
@@ -118,3 +240,176 @@ class WorkingHours(db.Model):
             'end_time': self.end_time.strftime('%H:%M') if self.end_time else None,
             'is_available': self.is_available
         }
+
+class WorkingHoursException(TenantScoped, db.Model):
+    """Date-specific override of the weekly hours (holiday, closure or special opening)
+    
+    All exceptions of a date together replace that weekday's hours: a closed row closes
+    the whole day, otherwise the rows' intervals are the opening hours for that date.
+    """
+    __tablename__ = 'working_hours_exceptions'
+    __table_args__ = (
+        db.Index('ix_working_hours_exceptions_tenant_date', 'tenant_id', 'date'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False)
+    start_time = db.Column(db.Time, nullable=True)
+    end_time = db.Column(db.Time, nullable=True)
+    is_closed = db.Column(db.Boolean, default=False, nullable=False)
+    note = db.Column(db.String(200), nullable=True)
+    updated_at = db.Column(db.DateTime, default=get_utc_now, onupdate=get_utc_now)
+    
+    def to_dict(self):
+        """Convert exception to dictionary"""
+        return {
+            'id': self.id,
+            'date': self.date.isoformat(),
+            'start_time': self.start_time.strftime('%H:%M') if self.start_time else None,
+            'end_time': self.end_time.strftime('%H:%M') if self.end_time else None,
+            'is_closed': self.is_closed,
+            'note': self.note
+        }
+
+class DayOccupancy(TenantScoped, db.Model):
+    """Per-day booking bitmap: bit i is set when minute i of the day is taken by a confirmed appointment"""
+    __tablename__ = 'day_occupancy'
+    
+    # Each tenant has its own bitmaps; the primary key leads with the tenant
+    tenant_id = db.Column(db.Integer, db.ForeignKey('tenants.id'), primary_key=True, default=current_tenant_or_default)
+    date = db.Column(db.Date, primary_key=True)
+    bitmap = db.Column(db.LargeBinary, nullable=False)
+    updated_at = db.Column(db.DateTime, default=get_utc_now, onupdate=get_utc_now)
+
+class WaitlistEntry(TenantScoped, db.Model):
+    """A client waiting for a slot of a service on a date, optionally within a time window
+    
+    Entries are served first come, first served per (service, date): the composite index
+    below keeps each bucket's waiting entries in queue order. When a booking of the
+    service is cancelled, moved or deleted, the head of the queue whose window fits the
+    freed slot gets it (see utils/waitlist.py). Dates and windows are local to the service.
+    """
+    __tablename__ = 'waitlist_entries'
+    __table_args__ = (
+        db.Index('ix_waitlist_queue', 'tenant_id', 'service_id', 'date', 'status', 'created_at'),
+        # Open offers by expiry, for the sweep that passes lapsed ones on (waitlist.expire_offers)
+        db.Index('ix_waitlist_offers', 'status', 'offer_expires_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    service_id = db.Column(db.Integer, db.ForeignKey('services.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    window_start = db.Column(db.Time, nullable=True)  # None = from opening
+    window_end = db.Column(db.Time, nullable=True)    # None = until closing
+    auto_book = db.Column(db.Boolean, default=False, nullable=False)  # book immediately instead of offering
+    status = db.Column(db.String(20), nullable=False, default='waiting')  # 'waiting', 'offered', 'booked', 'cancelled'
+    offered_start = db.Column(db.DateTime, nullable=True)  # naive UTC start of the offered slot
+    offer_expires_at = db.Column(db.DateTime, nullable=True)
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id', ondelete='SET NULL'), nullable=True)
+    created_at = db.Column(db.DateTime, default=get_utc_now)
+    updated_at = db.Column(db.DateTime, default=get_utc_now, onupdate=get_utc_now)
+    
+    user = db.relationship('User', backref=db.backref('waitlist_entries', lazy=True, cascade='all, delete-orphan'))
+    service = db.relationship('Service', backref=db.backref('waitlist_entries', lazy=True, cascade='all, delete-orphan'))
+    
+    def to_dict(self):
+        """Convert waitlist entry to dictionary"""
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'service_id': self.service_id,
+            'service_name': self.service.name if self.service else None,
+            'date': self.date.isoformat(),
+            'window_start': self.window_start.strftime('%H:%M') if self.window_start else None,
+            'window_end': self.window_end.strftime('%H:%M') if self.window_end else None,
+            'auto_book': self.auto_book,
+            'status': self.status,
+            'offered_start': self.offered_start.isoformat() if self.offered_start else None,
+            'offer_expires_at': self.offer_expires_at.isoformat() if self.offer_expires_at else None,
+            'appointment_id': self.appointment_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+class OutboxMessage(db.Model):
+    """Side effect recorded in the same transaction as the change that caused it (see utils/outbox.py)
+    
+    The request path only inserts the row; `flask outbox-worker` claims due messages in
+    batches, runs their handlers and retries failures with exponential backoff.
+    """
+    __tablename__ = 'outbox'
+    __table_args__ = (
+        db.Index('ix_outbox_due', 'status', 'available_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)   # handler name, e.g. 'appointment.created'
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # 'pending', 'processing', 'done', 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # Next attempt for pending messages; lease expiry for processing ones
+    available_at = db.Column(db.DateTime, nullable=False, default=get_utc_now)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=get_utc_now)
+    processed_at = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self):
+        """Convert outbox message to dictionary"""
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'payload': self.payload,
+            'status': self.status,
+            'attempts': self.attempts,
+            'available_at': self.available_at.isoformat() if self.available_at else None,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'processed_at': self.processed_at.isoformat() if self.processed_at else None
+        }
+
+class ReminderLog(db.Model):
+    """Reminder already sent for an appointment (keyed by start time so a reschedule gets new ones)"""
+    __tablename__ = 'reminders_sent'
+    __table_args__ = (
+        db.UniqueConstraint('appointment_id', 'offset_minutes', 'start_time', name='uq_reminders_sent'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id', ondelete='CASCADE'), nullable=False)
+    offset_minutes = db.Column(db.Integer, nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    sent_at = db.Column(db.DateTime, default=get_utc_now)
+
+class RateLimitBucket(db.Model):
+    """Token bucket shared by all workers (RATELIMIT_BACKEND=database, see utils/ratelimit.py)"""
+    __tablename__ = 'rate_limit_buckets'
+    
+    key = db.Column(db.String(255), primary_key=True)   # '<limit name>:<client key>'
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False)      # unix time of the last refill
+
+class IdempotencyKey(db.Model):
+    """Stored result of a request sent with an Idempotency-Key header (see utils/idempotency.py)"""
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.UniqueConstraint('scope', 'key', name='uq_idempotency_keys_scope_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(64), nullable=False)         # caller the key belongs to, e.g. 'user:12'
+    key = db.Column(db.String(255), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)  # sha256 of method, path and body
+    status_code = db.Column(db.Integer, nullable=True)       # NULL while the first request is running
+    response_body = db.Column(db.JSON, nullable=True)
+    created_at = db.Column(db.DateTime, default=get_utc_now)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class RevokedToken(db.Model):
+    """JWT revoked before its expiry (logout, refresh rotation); see utils/revocation.py"""
+    __tablename__ = 'revoked_tokens'
+    
+    jti = db.Column(db.String(64), primary_key=True)
+    token_type = db.Column(db.String(10), nullable=False)   # 'access' or 'refresh'
+    user_id = db.Column(db.Integer, nullable=True)
+    revoked_at = db.Column(db.DateTime, nullable=False, default=get_utc_now, index=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)   # row can go once the token is dead
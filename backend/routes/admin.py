@@ -1,8 +1,13 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, WorkingHours, Appointment, Service, User
+from models import db, WorkingHours, WorkingHoursException, Service, User, get_utc_now
 from datetime import datetime, timedelta
 from sqlalchemy import func
+from utils.archive import appointment_rows
+from utils.cache import invalidate
+from utils import export
+from utils.analytics import BUCKETS, compute_analytics
+from utils.tz import default_timezone, local_today
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -30,25 +35,29 @@ def get_dashboard_stats():
         if not admin:
             return jsonify({'error': 'Admin access required'}), 403
         
+        # Include archived (old completed/cancelled) appointments on request
+        include_archived = request.args.get('include_archived', 'false').lower() == 'true'
+        rows = appointment_rows(include_archived)
+        
         # Total bookings
-        total_bookings = Appointment.query.count()
+        total_bookings = db.session.query(func.count()).select_from(rows).scalar()
         
         # Bookings by status
         bookings_by_status = db.session.query(
-            Appointment.status,
-            func.count(Appointment.id)
-        ).group_by(Appointment.status).all()
+            rows.c.status,
+            func.count(rows.c.id)
+        ).group_by(rows.c.status).all()
         
         status_counts = {status: count for status, count in bookings_by_status}
         
         # Bookings per day (last 7 days)
-        seven_days_ago = datetime.now() - timedelta(days=7)
+        seven_days_ago = get_utc_now() - timedelta(days=7)
         bookings_per_day = db.session.query(
-            func.date(Appointment.start_time).label('date'),
-            func.count(Appointment.id).label('count')
+            func.date(rows.c.start_time).label('date'),
+            func.count(rows.c.id).label('count')
         ).filter(
-            Appointment.start_time >= seven_days_ago
-        ).group_by(func.date(Appointment.start_time)).all()
+            rows.c.start_time >= seven_days_ago
+        ).group_by(func.date(rows.c.start_time)).all()
         
         bookings_per_day_data = [
             {'date': str(date), 'count': count}
@@ -58,11 +67,11 @@ def get_dashboard_stats():
         # Most popular service
         popular_service = db.session.query(
             Service.name,
-            func.count(Appointment.id).label('count')
+            func.count(rows.c.id).label('count')
         ).join(
-            Appointment, Service.id == Appointment.service_id
+            rows, Service.id == rows.c.service_id
         ).group_by(Service.id, Service.name).order_by(
-            func.count(Appointment.id).desc()
+            func.count(rows.c.id).desc()
         ).first()
         
         popular_service_data = None
@@ -72,16 +81,117 @@ def get_dashboard_stats():
                 'count': popular_service[1]
             }
         
+        # Utilization, revenue and rates over the same 7 days (cached per settled day)
+        today = get_utc_now().date()
+        last_7_days = compute_analytics(today - timedelta(days=6), today)['totals']
+        
         return jsonify({
             'total_bookings': total_bookings,
             'bookings_by_status': status_counts,
             'bookings_per_day': bookings_per_day_data,
-            'popular_service': popular_service_data
+            'popular_service': popular_service_data,
+            'last_7_days': last_7_days
         }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def parse_export_args():
+    """
+    Read the range and options shared by the export and analytics endpoints
+    
+    Returns:
+        (start_date, end_date, include_archived, chunk_size, error message)
+    """
+    try:
+        today = get_utc_now().date()
+        end_date = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else today
+        start_date = (datetime.strptime(request.args['start'], '%Y-%m-%d').date() if request.args.get('start')
+                      else end_date - timedelta(days=30))
+        chunk_size = min(int(request.args.get('chunk_size', 5000)), 50000)
+    except ValueError:
+        return None, None, False, None, 'Invalid date format. Use YYYY-MM-DD (chunk_size must be a number)'
+    if start_date > end_date:
+        return None, None, False, None, 'start must not be after end'
+    if chunk_size < 1:
+        return None, None, False, None, 'chunk_size must be positive'
+    include_archived = request.args.get('include_archived', 'false').lower() == 'true'
+    return start_date, end_date, include_archived, chunk_size, None
+
+@admin_bp.route('/export', methods=['GET'])
+@jwt_required()
+def export_appointments():
+    """Stream appointments with their service over a date range as csv, ndjson or columnar (admin only)"""
+    try:
+        admin = require_admin()
+        if not admin:
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        fmt = request.args.get('format', 'csv').lower()
+        if fmt not in export.FORMATS:
+            return jsonify({'error': f'format must be one of: {", ".join(export.FORMATS)}'}), 400
+        start_date, end_date, include_archived, chunk_size, error = parse_export_args()
+        if error:
+            return jsonify({'error': error}), 400
+        
+        mimetype, extension, writer = export.FORMATS[fmt]
+        
+        @stream_with_context
+        def generate():
+            try:
+                chunks = export.iter_chunks(start_date, end_date, include_archived, chunk_size)
+                yield from writer(chunks, export.ExportTotals(), start_date, end_date)
+            finally:
+                db.session.rollback()
+        
+        filename = f'appointments_{start_date.isoformat()}_{end_date.isoformat()}.{extension}'
+        return Response(generate(), mimetype=mimetype, headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'X-Accel-Buffering': 'no'
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/export/summary', methods=['GET'])
+@jwt_required()
+def export_summary():
+    """Revenue, utilization and status totals over a date range (admin only)"""
+    try:
+        admin = require_admin()
+        if not admin:
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        start_date, end_date, include_archived, chunk_size, error = parse_export_args()
+        if error:
+            return jsonify({'error': error}), 400
+        
+        return jsonify(export.summarize(start_date, end_date, include_archived, chunk_size)), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/analytics', methods=['GET'])
+@jwt_required()
+def get_analytics():
+    """Utilization, revenue and cancellation/no-show rates per day, week or month (admin only)"""
+    try:
+        admin = require_admin()
+        if not admin:
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        bucket = request.args.get('bucket', 'day').lower()
+        if bucket not in BUCKETS:
+            return jsonify({'error': f'bucket must be one of: {", ".join(BUCKETS)}'}), 400
+        start_date, end_date, _, _, error = parse_export_args()
+        if error:
+            return jsonify({'error': error}), 400
+        
+        return jsonify(compute_analytics(start_date, end_date, bucket)), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @admin_bp.route('/working-hours', methods=['GET'])
 @jwt_required()
 def get_working_hours():
@@ -91,7 +201,7 @@ def get_working_hours():
         if not admin:
             return jsonify({'error': 'Admin access required'}), 403
         
-        working_hours = WorkingHours.query.order_by(WorkingHours.day_of_week).all()
+        working_hours = WorkingHours.query.order_by(WorkingHours.day_of_week, WorkingHours.start_time).all()
         
         return jsonify({
             'working_hours': [wh.to_dict() for wh in working_hours]
@@ -100,10 +210,47 @@ def get_working_hours():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def parse_intervals(data):
+    """
+    Read opening intervals from a request body
+    
+    Accepts either "intervals": [{"start_time": "HH:MM", "end_time": "HH:MM"}, ...]
+    or a single "start_time"/"end_time" pair.
+    
+    Returns:
+        (list of (start, end) time tuples sorted by start, error message)
+    """
+    raw = data.get('intervals')
+    if raw is None:
+        if data.get('start_time') is None or data.get('end_time') is None:
+            return None, 'start_time and end_time (or intervals) are required'
+        raw = [{'start_time': data['start_time'], 'end_time': data['end_time']}]
+    
+    if not isinstance(raw, list) or not raw:
+        return None, 'intervals must be a non-empty list'
+    
+    intervals = []
+    for item in raw:
+        try:
+            start_time = datetime.strptime(item['start_time'], '%H:%M').time()
+            end_time = datetime.strptime(item['end_time'], '%H:%M').time()
+        except (KeyError, TypeError, ValueError):
+            return None, 'Invalid time format. Use HH:MM'
+        if start_time >= end_time:
+            return None, 'start_time must be before end_time'
+        intervals.append((start_time, end_time))
+    
+    intervals.sort()
+    for (_, previous_end), (next_start, _) in zip(intervals, intervals[1:]):
+        if next_start < previous_end:
+            return None, 'intervals must not overlap'
+    
+    return intervals, None
+
 @admin_bp.route('/working-hours', methods=['POST'])
 @jwt_required()
 def create_working_hours():
-    """Create or update working hours (admin only)"""
+    """Create or replace the working hours of a weekday (admin only)"""
     try:
         admin = require_admin()
         if not admin:
@@ -114,44 +261,29 @@ def create_working_hours():
         if not data:
             return jsonify({'error': 'Request body is required'}), 400
         
-        required_fields = ['day_of_week', 'start_time', 'end_time']
-        for field in required_fields:
-            if data.get(field) is None:
-                return jsonify({'error': f'{field} is required'}), 400
+        if data.get('day_of_week') is None:
+            return jsonify({'error': 'day_of_week is required'}), 400
         
         day_of_week = data['day_of_week']
-        if day_of_week < 0 or day_of_week > 6:
+        if not isinstance(day_of_week, int) or day_of_week < 0 or day_of_week > 6:
             return jsonify({'error': 'day_of_week must be between 0 and 6'}), 400
         
-        # Parse times
-        try:
-            start_time = datetime.strptime(data['start_time'], '%H:%M').time()
-            end_time = datetime.strptime(data['end_time'], '%H:%M').time()
-        except ValueError:
-            return jsonify({'error': 'Invalid time format. Use HH:MM'}), 400
-        
-        if start_time >= end_time:
-            return jsonify({'error': 'start_time must be before end_time'}), 400
-        
-        # Check if working hours already exist for this day
-        existing = WorkingHours.query.filter_by(day_of_week=day_of_week).first()
+        intervals, error = parse_intervals(data)
+        if error:
+            return jsonify({'error': error}), 400
         
-        if existing:
-            # Update existing
-            existing.start_time = start_time
-            existing.end_time = end_time
-            existing.is_available = data.get('is_available', True)
-        else:
-            # Create new
-            working_hours = WorkingHours(
+        # The given intervals replace whatever was stored for this day
+        WorkingHours.query.filter_by(day_of_week=day_of_week).delete()
+        for start_time, end_time in intervals:
+            db.session.add(WorkingHours(
                 day_of_week=day_of_week,
                 start_time=start_time,
                 end_time=end_time,
                 is_available=data.get('is_available', True)
-            )
-            db.session.add(working_hours)
+            ))
         
         db.session.commit()
+        invalidate('working_hours')
         
         return jsonify({
             'message': 'Working hours saved successfully'
@@ -161,6 +293,99 @@ def create_working_hours():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@admin_bp.route('/working-hours/exceptions', methods=['GET'])
+@jwt_required()
+def get_working_hours_exceptions():
+    """Get working-hours exceptions, upcoming only unless ?all=true (admin only)"""
+    try:
+        admin = require_admin()
+        if not admin:
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        query = WorkingHoursException.query
+        if request.args.get('all', 'false').lower() != 'true':
+            query = query.filter(WorkingHoursException.date >= local_today(default_timezone()))
+        exceptions = query.order_by(WorkingHoursException.date, WorkingHoursException.start_time).all()
+        
+        return jsonify({
+            'exceptions': [exception.to_dict() for exception in exceptions]
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/working-hours/exceptions', methods=['POST'])
+@jwt_required()
+def create_working_hours_exception():
+    """Close a date or set special hours for it, replacing earlier exceptions of that date (admin only)"""
+    try:
+        admin = require_admin()
+        if not admin:
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        data = request.get_json()
+        
+        if not data or not data.get('date'):
+            return jsonify({'error': 'date is required'}), 400
+        
+        try:
+            date = datetime.strptime(data['date'], '%Y-%m-%d').date()
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+        
+        is_closed = bool(data.get('is_closed', False))
+        note = (data.get('note') or '').strip() or None
+        
+        WorkingHoursException.query.filter_by(date=date).delete()
+        if is_closed:
+            db.session.add(WorkingHoursException(date=date, is_closed=True, note=note))
+        else:
+            intervals, error = parse_intervals(data)
+            if error:
+                db.session.rollback()
+                return jsonify({'error': error}), 400
+            for start_time, end_time in intervals:
+                db.session.add(WorkingHoursException(
+                    date=date, start_time=start_time, end_time=end_time, is_closed=False, note=note
+                ))
+        
+        db.session.commit()
+        invalidate('working_hours')
+        
+        return jsonify({
+            'message': 'Working hours exception saved successfully',
+            'exceptions': [e.to_dict() for e in WorkingHoursException.query.filter_by(date=date)]
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/working-hours/exceptions/<int:exception_id>', methods=['DELETE'])
+@jwt_required()
+def delete_working_hours_exception(exception_id):
+    """Delete a working-hours exception (admin only)"""
+    try:
+        admin = require_admin()
+        if not admin:
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        exception = WorkingHoursException.query.get(exception_id)
+        if not exception:
+            return jsonify({'error': 'Exception not found'}), 404
+        
+        db.session.delete(exception)
+        db.session.commit()
+        invalidate('working_hours')
+        
+        return jsonify({
+            'message': 'Working hours exception deleted successfully'
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @admin_bp.route('/seed', methods=['POST'])
 def seed_database():
     """Seed database with demo data (only if database is empty)"""
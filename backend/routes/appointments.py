@@ -1,11 +1,34 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, Appointment, Service
-from datetime import datetime, timedelta, timezone
-from utils.booking_logic import get_available_slots, is_slot_available, get_existing_appointments
+from models import db, Appointment, AppointmentArchive, Service, get_utc_now
+from datetime import datetime, timedelta
+from sqlalchemy.orm.exc import StaleDataError
+from utils.booking_logic import get_available_slots, load_busy_intervals
+from utils import occupancy
+from utils.tz import epoch_minute, epoch_minute_ceil, to_utc_naive
+from utils.outbox import enqueue, enqueue_notifications
+from utils.idempotency import idempotent, store_response
+from utils.ratelimit import by_user, rate_limit
+from utils.waitlist import reallocate_slot
 
 appointments_bp = Blueprint('appointments', __name__)
 
+def matches_if_match(appointment):
+    """True unless the request has an If-Match header that does not name the current version"""
+    if not request.if_match:
+        return True
+    return request.if_match.contains(appointment.etag())
+
+def precondition_failed(appointment):
+    """412 with the current state, so the client can show what changed and retry"""
+    response = jsonify({
+        'error': 'Appointment was changed since you loaded it',
+        'code': 'PRECONDITION_FAILED',
+        'appointment': appointment.to_dict()
+    })
+    response.set_etag(appointment.etag())
+    return response, 412
+
 def get_current_user():
     """Helper to get current user from JWT"""
     identity = get_jwt_identity()
@@ -26,29 +49,39 @@ def get_appointments():
         # Get query parameters
         status_filter = request.args.get('status')
         date_filter = request.args.get('date')
-        
-        # Build query
-        if user.is_admin():
-            query = Appointment.query
-        else:
-            query = Appointment.query.filter_by(user_id=user.id)
-        
-        if status_filter:
-            query = query.filter_by(status=status_filter)
+        include_archived = request.args.get('include_archived', 'false').lower() == 'true'
         
         if date_filter:
             try:
                 filter_date = datetime.strptime(date_filter, '%Y-%m-%d').date()
+            except ValueError:
+                return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+        
+        def build_query(model):
+            """Apply the listing filters to the hot table or the archive"""
+            if user.is_admin():
+                query = model.query
+            else:
+                query = model.query.filter_by(user_id=user.id)
+            
+            if status_filter:
+                query = query.filter_by(status=status_filter)
+            
+            if date_filter:
                 start_of_day = datetime.combine(filter_date, datetime.min.time())
                 end_of_day = datetime.combine(filter_date, datetime.max.time())
                 query = query.filter(
-                    Appointment.start_time >= start_of_day,
-                    Appointment.start_time <= end_of_day
+                    model.start_time >= start_of_day,
+                    model.start_time <= end_of_day
                 )
-            except ValueError:
-                return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+            
+            return query.order_by(model.start_time.desc())
         
-        appointments = query.order_by(Appointment.start_time.desc()).all()
+        appointments = build_query(Appointment).all()
+        if include_archived:
+            # Old completed/cancelled appointments live in the archive table (see utils/archive.py)
+            appointments += build_query(AppointmentArchive).all()
+            appointments.sort(key=lambda app: app.start_time, reverse=True)
         
         return jsonify({
             'appointments': [app.to_dict(include_user=user.is_admin()) for app in appointments]
@@ -58,7 +91,9 @@ def get_appointments():
         return jsonify({'error': str(e)}), 500
 
 @appointments_bp.route('', methods=['POST'])
+@rate_limit('booking', key=by_user)
 @jwt_required()
+@idempotent
 def create_appointment():
     """Create a new appointment"""
     try:
@@ -128,10 +163,8 @@ def create_appointment():
                             'received': data.get('start_time')
                         }), 400
             
-            # Convert to naive datetime (remove timezone info) for database storage
-            if start_time.tzinfo:
-                # Convert to UTC first, then remove timezone
-                start_time = start_time.astimezone(timezone.utc).replace(tzinfo=None)
+            # Store as naive UTC; a start_time without an offset is local time at the service
+            start_time = to_utc_naive(start_time, service.tz_name)
         except (ValueError, AttributeError, KeyError, TypeError) as e:
             import traceback
             print(f"Error parsing start_time: {str(e)}")
@@ -145,16 +178,12 @@ def create_appointment():
         # Calculate end time
         end_time = start_time + timedelta(minutes=service.duration_minutes)
         
-        # Check if slot is available
-        day_start = datetime.combine(start_time.date(), datetime.min.time())
-        day_end = datetime.combine(start_time.date(), datetime.max.time())
-        existing_appointments = get_existing_appointments(day_start, day_end)
-        
-        if not is_slot_available(start_time, end_time, existing_appointments):
+        # Check if slot is available (locks the day's occupancy row until commit)
+        if not occupancy.is_interval_free(start_time, end_time, for_update=True):
             return jsonify({'error': 'This time slot is no longer available'}), 400
         
         # Don't allow bookings in the past
-        if start_time < datetime.now():
+        if start_time < get_utc_now():
             return jsonify({'error': 'Cannot book appointments in the past'}), 400
         
         # Create appointment
@@ -167,12 +196,19 @@ def create_appointment():
         )
         
         db.session.add(appointment)
-        db.session.commit()
-        
-        return jsonify({
+        occupancy.book_interval(start_time, end_time)
+        db.session.flush()
+        # Confirmation and other post-booking work run in the outbox worker
+        enqueue('appointment.created', {'appointment_id': appointment.id})
+        body = {
             'message': 'Appointment created successfully',
             'appointment': appointment.to_dict()
-        }), 201
+        }
+        # Retries with the same Idempotency-Key replay this even if the worker dies after commit
+        store_response(body, 201)
+        db.session.commit()
+        
+        return jsonify(body), 201
         
     except Exception as e:
         db.session.rollback()
@@ -214,9 +250,11 @@ def get_appointment(appointment_id):
         if not user.is_admin() and appointment.user_id != user.id:
             return jsonify({'error': 'Access denied'}), 403
         
-        return jsonify({
+        response = jsonify({
             'appointment': appointment.to_dict()
-        }), 200
+        })
+        response.set_etag(appointment.etag())
+        return response.make_conditional(request)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -236,13 +274,21 @@ def update_appointment(appointment_id):
         if not user.is_admin() and appointment.user_id != user.id:
             return jsonify({'error': 'Access denied'}), 403
         
+        if not matches_if_match(appointment):
+            return precondition_failed(appointment)
+        
         data = request.get_json()
         if not data:
             return jsonify({'error': 'Request body is required'}), 400
         
+        # Remember the booked interval so its occupancy can be recomputed
+        old_start_time = appointment.start_time
+        old_end_time = appointment.end_time
+        old_status = appointment.status
+        
         # Update status
         if 'status' in data:
-            valid_statuses = ['confirmed', 'cancelled', 'completed']
+            valid_statuses = ['confirmed', 'cancelled', 'completed', 'no_show']
             if data['status'] not in valid_statuses:
                 return jsonify({'error': f'Status must be one of: {", ".join(valid_statuses)}'}), 400
             appointment.status = data['status']
@@ -250,25 +296,27 @@ def update_appointment(appointment_id):
         # Reschedule (update start_time)
         if 'start_time' in data and data['start_time']:
             try:
-                new_start_time = datetime.fromisoformat(data['start_time'].replace('Z', '+00:00'))
-                if new_start_time.tzinfo:
-                    new_start_time = new_start_time.replace(tzinfo=None)
-                
-                # Get service to calculate new end time
+                # Get service to calculate new end time (and read offset-less input in its timezone)
                 service = Service.query.get(appointment.service_id)
+                new_start_time = to_utc_naive(
+                    datetime.fromisoformat(data['start_time'].replace('Z', '+00:00')), service.tz_name
+                )
                 new_end_time = new_start_time + timedelta(minutes=service.duration_minutes)
                 
+                # Lock the affected days' occupancy rows first (as booking does), so a concurrent
+                # booking or reschedule into the same slot waits for this one to commit
+                occupancy.load_days(sorted(set(
+                    occupancy.interval_days(old_start_time, old_end_time) +
+                    occupancy.interval_days(new_start_time, new_end_time)
+                )), for_update=True)
+                
                 # Check if new slot is available (exclude current appointment)
-                day_start = datetime.combine(new_start_time.date(), datetime.min.time())
-                day_end = datetime.combine(new_start_time.date(), datetime.max.time())
-                existing_appointments = get_existing_appointments(day_start, day_end)
-                # Remove current appointment from conflicts
-                existing_appointments = [a for a in existing_appointments if a['start'] != appointment.start_time]
+                busy = load_busy_intervals(new_start_time, new_end_time, exclude_id=appointment.id)
                 
-                if not is_slot_available(new_start_time, new_end_time, existing_appointments):
+                if not busy.is_free(epoch_minute(new_start_time), epoch_minute_ceil(new_end_time)):
                     return jsonify({'error': 'This time slot is no longer available'}), 400
                 
-                if new_start_time < datetime.now():
+                if new_start_time < get_utc_now():
                     return jsonify({'error': 'Cannot reschedule to a past time'}), 400
                 
                 appointment.start_time = new_start_time
@@ -277,13 +325,32 @@ def update_appointment(appointment_id):
             except (ValueError, AttributeError):
                 return jsonify({'error': 'Invalid start_time format'}), 400
         
+        db.session.flush()
+        occupancy.refresh_days(
+            occupancy.interval_days(old_start_time, old_end_time) +
+            occupancy.interval_days(appointment.start_time, appointment.end_time)
+        )
+        
+        # A cancelled or moved booking frees its old slot for the waitlist
+        if old_status == 'confirmed' and (appointment.status != 'confirmed' or appointment.start_time != old_start_time):
+            enqueue_notifications(reallocate_slot(appointment.service, old_start_time, old_end_time))
+        if appointment.status == 'cancelled' and old_status != 'cancelled':
+            enqueue('appointment.updated', {'appointment_id': appointment.id, 'change': 'cancelled'})
+        elif appointment.start_time != old_start_time:
+            enqueue('appointment.updated', {'appointment_id': appointment.id, 'change': 'rescheduled'})
         db.session.commit()
         
-        return jsonify({
+        response = jsonify({
             'message': 'Appointment updated successfully',
             'appointment': appointment.to_dict()
-        }), 200
+        })
+        response.set_etag(appointment.etag())
+        return response, 200
         
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({'error': 'Appointment was changed by another request. Reload it and try again.',
+                        'code': 'CONFLICT'}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -303,13 +370,26 @@ def delete_appointment(appointment_id):
         if not user.is_admin() and appointment.user_id != user.id:
             return jsonify({'error': 'Access denied'}), 403
         
+        if not matches_if_match(appointment):
+            return precondition_failed(appointment)
+        
+        service = appointment.service
+        was_confirmed = appointment.status == 'confirmed'
         db.session.delete(appointment)
+        db.session.flush()
+        occupancy.refresh_interval(appointment.start_time, appointment.end_time)
+        if was_confirmed:
+            enqueue_notifications(reallocate_slot(service, appointment.start_time, appointment.end_time))
         db.session.commit()
         
         return jsonify({
             'message': 'Appointment deleted successfully'
         }), 200
         
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({'error': 'Appointment was changed by another request. Reload it and try again.',
+                        'code': 'CONFLICT'}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
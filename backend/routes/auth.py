@@ -1,11 +1,25 @@
 from flask import Blueprint, request, jsonify, current_app
-from flask_jwt_extended import create_access_token
+from flask_jwt_extended import create_access_token, create_refresh_token, decode_token, get_jwt, get_jwt_identity, jwt_required
 from models import db, User
+from utils.ratelimit import by_ip, by_ip_and_email, rate_limit
+from utils.revocation import revoke
+from utils.tenancy import token_claims
 from datetime import datetime
 
 auth_bp = Blueprint('auth', __name__)
 
+def issue_tokens(user):
+    """Short-lived access token plus the refresh token that renews it"""
+    # Identity is the user ID as a string (Flask-JWT-Extended requires string identity);
+    # the role travels in additional_claims and is re-read from the database on refresh.
+    # Both tokens carry the user's tenant, which scopes every request made with them
+    return {
+        'access_token': create_access_token(identity=str(user.id), additional_claims={'role': user.role, **token_claims(user)}),
+        'refresh_token': create_refresh_token(identity=str(user.id), additional_claims=token_claims(user))
+    }
+
 @auth_bp.route('/register', methods=['POST'])
+@rate_limit('register', key=by_ip)
 def register():
     try:
         data = request.get_json()
@@ -32,16 +46,9 @@ def register():
         db.session.add(user)
         db.session.commit()
         
-        # Create token with user ID as string (Flask-JWT-Extended requires string identity)
-        # Store role in additional_claims
-        access_token = create_access_token(
-            identity=str(user.id),
-            additional_claims={'role': user.role}
-        )
-        
         return jsonify({
             'message': 'User registered successfully',
-            'access_token': access_token,
+            **issue_tokens(user),
             'user': user.to_dict()
         }), 201
         
@@ -66,6 +73,7 @@ def register():
         }), 500
 
 @auth_bp.route('/login', methods=['POST'])
+@rate_limit('login', key=by_ip_and_email)
 def login():
     try:
         data = request.get_json()
@@ -81,18 +89,56 @@ def login():
         if not user or not user.check_password(password):
             return jsonify({'error': 'Invalid email or password'}), 401
         
-        # Create token with user ID as string (Flask-JWT-Extended requires string identity)
-        # Store role in additional_claims
-        access_token = create_access_token(
-            identity=str(user.id),
-            additional_claims={'role': user.role}
-        )
-        
         return jsonify({
             'message': 'Login successful',
-            'access_token': access_token,
+            **issue_tokens(user),
+            'user': user.to_dict()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@auth_bp.route('/refresh', methods=['POST'])
+@jwt_required(refresh=True)
+def refresh():
+    """Exchange a refresh token for a new token pair (the old refresh token is revoked)"""
+    try:
+        identity = get_jwt_identity()
+        user = User.query.get(int(identity))
+        if not user:
+            return jsonify({'error': 'User not found', 'code': 'INVALID_TOKEN'}), 401
+        
+        revoke(get_jwt())
+        
+        return jsonify({
+            'message': 'Token refreshed',
+            **issue_tokens(user),
             'user': user.to_dict()
         }), 200
         
     except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@auth_bp.route('/logout', methods=['POST'])
+@jwt_required()
+def logout():
+    """Revoke the access token (and the refresh token, if sent as refresh_token)"""
+    try:
+        revoke(get_jwt())
+        
+        data = request.get_json(silent=True) or {}
+        if data.get('refresh_token'):
+            try:
+                refresh_payload = decode_token(data['refresh_token'])
+            except Exception:
+                refresh_payload = None
+            if refresh_payload and refresh_payload.get('type') == 'refresh' and \
+                    refresh_payload.get('sub') == get_jwt_identity():
+                revoke(refresh_payload)
+        
+        return jsonify({'message': 'Logged out'}), 200
+        
+    except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -1,9 +1,40 @@
-from flask import Blueprint, request, jsonify
-from datetime import datetime, timedelta, timezone
-from utils.booking_logic import get_available_slots, format_time_slot
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
+from datetime import datetime, timedelta
+import queue
+import time
+from models import db
+from utils.booking_logic import get_available_slots, find_next_available_slots, serialize_slot
+from utils.events import bus
+from utils.ratelimit import admission_exempt
+from utils.sse import day_topics, diff_slots, sse_keepalive, sse_message, sse_retry
+from utils.tenancy import current_tenant_or_default
+from utils.tz import default_timezone
 
 availability_bp = Blueprint('availability', __name__)
 
+# Longest date range accepted by the range endpoints (one calendar month view)
+MAX_RANGE_DAYS = 62
+# Search horizon of the next-slot endpoint
+DEFAULT_NEXT_DAYS = 60
+MAX_NEXT_DAYS = 366
+
+def parse_date_range(start_str, end_str):
+    """Parse a YYYY-MM-DD range, returning (dates, error message)"""
+    try:
+        start_date = datetime.strptime(start_str, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end_str, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None, 'Invalid date format. Use YYYY-MM-DD'
+    
+    if end_date < start_date:
+        return None, 'end must not be before start'
+    
+    days = (end_date - start_date).days + 1
+    if days > MAX_RANGE_DAYS:
+        return None, f'Date range cannot exceed {MAX_RANGE_DAYS} days'
+    
+    return [start_date + timedelta(days=i) for i in range(days)], None
+
 @availability_bp.route('', methods=['GET'])
 def get_availability():
     """Get available time slots for a service on a specific date"""
@@ -29,31 +60,198 @@ def get_availability():
         if not service:
             return jsonify({'error': 'Service not found'}), 404
         
-        # Get available slots
-        available_slots = get_available_slots(date, service.duration_minutes)
-        
-        # Format slots - ensure datetime includes timezone info
-        formatted_slots = []
-        for slot in available_slots:
-            # Convert naive datetime to UTC-aware datetime for API response
-            if slot.tzinfo is None:
-                # Assume slot is in UTC (since database stores naive datetime as UTC)
-                slot_utc = slot.replace(tzinfo=timezone.utc)
-            else:
-                slot_utc = slot.astimezone(timezone.utc)
-            
-            formatted_slots.append({
-                'time': format_time_slot(slot),
-                'datetime': slot_utc.isoformat()
-            })
+        # Get available slots (the date is a local date at the service's timezone)
+        available_slots = get_available_slots(date, service.duration_minutes, tz_name=service.tz_name)
+        
+        # Format slots - local time label plus the UTC instant
+        formatted_slots = [serialize_slot(slot, service.tz_name) for slot in available_slots]
         
         return jsonify({
             'date': date_str,
             'service_id': int(service_id),
             'service_duration': service.duration_minutes,
+            'timezone': service.tz_name,
             'available_slots': formatted_slots
         }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@availability_bp.route('/range', methods=['GET'])
+def get_availability_range():
+    """Get available time slots for a service for every day in a date range"""
+    try:
+        service_id = request.args.get('service_id')
+        if not service_id:
+            return jsonify({'error': 'service_id is required'}), 400
+        
+        dates, error = parse_date_range(request.args.get('start'), request.args.get('end'))
+        if error:
+            return jsonify({'error': error}), 400
+        
+        from models import Service
+        service = Service.query.get(service_id)
+        if not service:
+            return jsonify({'error': 'Service not found'}), 404
+        
+        # Days are computed one after another here; the ASGI app (asgi.py) fans them out concurrently
+        days = [
+            {
+                'date': date.isoformat(),
+                'available_slots': [
+                    serialize_slot(slot, service.tz_name)
+                    for slot in get_available_slots(date, service.duration_minutes, tz_name=service.tz_name)
+                ]
+            }
+            for date in dates
+        ]
+        
+        return jsonify({
+            'service_id': int(service_id),
+            'service_duration': service.duration_minutes,
+            'timezone': service.tz_name,
+            'days': days
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@availability_bp.route('/next', methods=['GET'])
+def get_next_availability():
+    """Get the earliest available slot for one or many services (all services if none given)"""
+    try:
+        from models import Service
+        
+        # Accept ?service_id=1&service_id=2 as well as ?service_id=1,2
+        raw_ids = [part for value in request.args.getlist('service_id') for part in value.split(',') if part]
+        try:
+            service_ids = [int(value) for value in raw_ids]
+            max_days = min(MAX_NEXT_DAYS, max(1, int(request.args.get('max_days', DEFAULT_NEXT_DAYS))))
+        except ValueError:
+            return jsonify({'error': 'service_id and max_days must be integers'}), 400
+        
+        start_date = None
+        if request.args.get('from'):
+            try:
+                start_date = datetime.strptime(request.args['from'], '%Y-%m-%d').date()
+            except ValueError:
+                return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+        
+        query = Service.query.with_entities(Service.id, Service.duration_minutes, Service.timezone)
+        if service_ids:
+            query = query.filter(Service.id.in_(service_ids))
+        rows = query.all()
+        durations = {service_id: duration for service_id, duration, _ in rows}
+        timezones = {service_id: zone or default_timezone() for service_id, _, zone in rows}
+        
+        missing = [service_id for service_id in service_ids if service_id not in durations]
+        if missing:
+            return jsonify({'error': f'Service not found: {", ".join(map(str, missing))}'}), 404
+        
+        found, searched_days = find_next_available_slots(durations, start_date, max_days, timezones=timezones)
+        
+        return jsonify({
+            'next_available': [
+                {
+                    'service_id': service_id,
+                    'service_duration': durations[service_id],
+                    'timezone': timezones[service_id],
+                    'slot': serialize_slot(slot, timezones[service_id]) if slot is not None else None
+                }
+                for service_id, slot in found.items()
+            ],
+            'searched_days': searched_days
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@availability_bp.route('/stream', methods=['GET'])
+@admission_exempt
+def stream_availability():
+    """Server-sent events for a service and date: the slots once, then a delta after every change"""
+    # A stream holds its worker for up to SSE_MAX_SECONDS: on sync workers (one request per
+    # process, e.g. plain gunicorn) a couple of open tabs would stall the whole API.
+    # Threaded/async workers set wsgi.multithread; otherwise serve the stream from asgi.py.
+    if not request.environ.get('wsgi.multithread'):
+        return jsonify({
+            'error': 'Live availability is not served by this worker; use the async app (asgi.py)',
+            'code': 'STREAM_UNAVAILABLE'
+        }), 503
+    
+    try:
+        service_id = request.args.get('service_id')
+        date_str = request.args.get('date')
+        
+        if not service_id or not date_str:
+            return jsonify({'error': 'service_id and date are required'}), 400
+        
+        try:
+            date = datetime.strptime(date_str, '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+        
+        from models import Service
+        service = Service.query.get(service_id)
+        if not service:
+            return jsonify({'error': 'Service not found'}), 404
+        
+        duration, tz_name = service.duration_minutes, service.tz_name
+        topics = day_topics(date, current_tenant_or_default())
+        keepalive = current_app.config['SSE_KEEPALIVE_SECONDS']
+        max_seconds = current_app.config['SSE_MAX_SECONDS']
+        
+        def current_slots():
+            try:
+                return {
+                    slot: serialize_slot(slot, tz_name)
+                    for slot in get_available_slots(date, duration, tz_name=tz_name)
+                }
+            finally:
+                # End the read transaction so an idle stream does not hold a connection
+                db.session.rollback()
+        
+        @stream_with_context
+        def generate():
+            changes = queue.Queue()
+            token = bus.subscribe(topics, lambda topic, payload: changes.put(payload))
+            try:
+                slots = current_slots()
+                event_id = 1
+                yield sse_retry()
+                yield sse_message('snapshot', {
+                    'date': date_str,
+                    'service_id': service.id,
+                    'timezone': tz_name,
+                    'available_slots': list(slots.values())
+                }, event_id)
+                
+                # Streams end after SSE_MAX_SECONDS so workers are recycled; EventSource reconnects
+                deadline = time.monotonic() + max_seconds
+                while (remaining := deadline - time.monotonic()) > 0:
+                    try:
+                        changes.get(timeout=min(keepalive, remaining))
+                    except queue.Empty:
+                        yield sse_keepalive()
+                        continue
+                    # A burst of bookings becomes a single recomputation
+                    while not changes.empty():
+                        changes.get_nowait()
+                    
+                    latest = current_slots()
+                    delta = diff_slots(slots, latest)
+                    slots = latest
+                    if delta['added'] or delta['removed']:
+                        event_id += 1
+                        yield sse_message('delta', delta, event_id)
+            finally:
+                bus.unsubscribe(token)
+        
+        return Response(generate(), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # stop nginx-style proxies from buffering the stream
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
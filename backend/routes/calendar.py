@@ -0,0 +1,95 @@
+"""
+Calendar subscriptions (.ics feeds, see utils/ical.py)
+"""
+from flask import Blueprint, Response, request, jsonify, url_for
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models import db, Service
+from utils.ical import feed_token, get_feed, parse_feed_token, rotate_feed_tokens
+from utils.tenancy import tenant_scope
+
+calendar_bp = Blueprint('calendar', __name__)
+
+def get_current_user():
+    """Helper to get current user from JWT"""
+    identity = get_jwt_identity()
+    from models import User
+    # Identity is now a string (user ID), not a dictionary
+    user_id = int(identity) if isinstance(identity, str) else identity
+    return User.query.get(user_id)
+
+def feed_url_response(user):
+    """Subscription URL for the current user's bookings, or for a service's (?service_id=, admin only)"""
+    service_id = request.args.get('service_id', type=int)
+    if service_id is None:
+        token = feed_token('user', user.id, user)
+    else:
+        if not user.is_admin():
+            return jsonify({'error': 'Admin access required'}), 403
+        if not Service.query.get(service_id):
+            return jsonify({'error': 'Service not found'}), 404
+        token = feed_token('service', service_id, user)
+    
+    url = url_for('calendar.get_feed_file', token=token, _external=True)
+    return jsonify({'url': url, 'webcal_url': 'webcal://' + url.split('://', 1)[1]}), 200
+
+@calendar_bp.route('/feed-url', methods=['GET'])
+@jwt_required()
+def get_feed_url():
+    """Subscription URL for the current user's bookings, or for a service's (?service_id=, admin only)"""
+    try:
+        user = get_current_user()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        return feed_url_response(user)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@calendar_bp.route('/feed-url/rotate', methods=['POST'])
+@jwt_required()
+def rotate_feed_url():
+    """Revoke every feed URL issued to the current user and return a new one (same arguments as GET)"""
+    try:
+        user = get_current_user()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        rotate_feed_tokens(user)
+        db.session.commit()
+        return feed_url_response(user)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@calendar_bp.route('/<token>.ics', methods=['GET'])
+def get_feed_file(token):
+    """iCalendar feed named by a signed token (public; the token is the credential)"""
+    try:
+        feed = parse_feed_token(token)
+        if feed is None:
+            return jsonify({'error': 'Feed not found'}), 404
+        tenant_id, kind, owner_id = feed
+
+        # Calendar apps send no tenant header or JWT: the token decides the tenant
+        with tenant_scope(tenant_id):
+            result = get_feed(kind, owner_id)
+        if result is None:
+            return jsonify({'error': 'Feed not found'}), 404
+        etag, last_modified, body = result
+
+        response = Response(mimetype='text/calendar')
+        response.set_etag(etag)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        response.headers['Cache-Control'] = 'private, no-cache'
+        # Unchanged feeds stop here: 304 without loading a single appointment
+        response.make_conditional(request)
+        if response.status_code == 304:
+            return response
+
+        with tenant_scope(tenant_id):
+            response.set_data(body())
+        response.headers['Content-Disposition'] = 'inline; filename="bookings.ics"'
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
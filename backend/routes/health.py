@@ -2,10 +2,12 @@
 Health check endpoint for keep-alive
 """
 from flask import Blueprint, jsonify
+from utils.ratelimit import admission_exempt
 
 health_bp = Blueprint('health', __name__)
 
 @health_bp.route('/ping', methods=['GET'])
+@admission_exempt
 def ping():
     """Simple ping endpoint for keep-alive"""
     return jsonify({'status': 'ok', 'message': 'pong'}), 200
@@ -1,10 +1,36 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, Service
+from models import db, Service, Appointment
+from utils import occupancy, tenancy
+from utils.cache import invalidate
+from utils.catalogue import get_catalogue
+from utils.search import search_services, SORTS
+from utils.geo import geocode, nearest_services
+from utils.tz import is_valid_timezone
+from utils.booking_logic import find_next_available_slots, serialize_slot
 from datetime import datetime
+import time
 
 services_bp = Blueprint('services', __name__)
 
+# Largest page size accepted by the search endpoint
+MAX_PER_PAGE = 100
+# Largest k accepted by the nearby endpoint
+MAX_NEARBY = 50
+
+def parse_coordinates(data):
+    """Read optional latitude/longitude from a request body, returning (coords, error message)"""
+    latitude, longitude = data.get('latitude'), data.get('longitude')
+    if latitude is None and longitude is None:
+        return None, None
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return None, 'latitude and longitude must both be valid numbers'
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None, 'latitude/longitude out of range'
+    return (latitude, longitude), None
+
 def get_current_user():
     """Helper to get current user from JWT"""
     identity = get_jwt_identity()
@@ -15,11 +41,89 @@ def get_current_user():
 
 @services_bp.route('', methods=['GET'])
 def get_services():
-    """Get all services (public endpoint)"""
+    """Get all services (public endpoint, served from the precomputed catalogue)"""
+    try:
+        catalogue = get_catalogue()
+        encoding, body = catalogue.negotiate(request.headers.get('Accept-Encoding'))
+        
+        response = Response(body, mimetype='application/json')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.set_etag(catalogue.etag if encoding == 'identity' else f'{catalogue.etag}-{encoding}')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Accept-Encoding')
+        if tenancy.enabled():
+            response.vary.add(tenancy.TENANT_HEADER)
+        return response.make_conditional(request)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@services_bp.route('/search', methods=['GET'])
+def search():
+    """Search services by text with price/duration filters, facets, sorting and pagination (public)"""
+    try:
+        args = request.args
+        try:
+            min_price = args.get('min_price', type=float)
+            max_price = args.get('max_price', type=float)
+            min_duration = args.get('min_duration', type=int)
+            max_duration = args.get('max_duration', type=int)
+            page = max(1, int(args.get('page', 1)))
+            per_page = min(MAX_PER_PAGE, max(1, int(args.get('per_page', 20))))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'page and per_page must be integers'}), 400
+        
+        sort = args.get('sort')
+        if sort and sort not in SORTS:
+            return jsonify({'error': f'sort must be one of: {", ".join(SORTS)}'}), 400
+        
+        return jsonify(search_services(
+            query=args.get('q', ''),
+            min_price=min_price, max_price=max_price,
+            min_duration=min_duration, max_duration=max_duration,
+            sort=sort, page=page, per_page=per_page
+        )), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@services_bp.route('/nearby', methods=['GET'])
+def nearby():
+    """Get the k services nearest to a point, with their next available slot (public)"""
     try:
-        services = Service.query.order_by(Service.created_at.desc()).all()
+        coords, error = parse_coordinates({'latitude': request.args.get('lat'), 'longitude': request.args.get('lng')})
+        if error or not coords:
+            return jsonify({'error': error or 'lat and lng are required'}), 400
+        
+        try:
+            k = min(MAX_NEARBY, max(1, int(request.args.get('k', 5))))
+            radius_km = request.args.get('radius_km', type=float)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'k must be an integer'}), 400
+        
+        started = time.perf_counter()
+        hits = nearest_services(coords[0], coords[1], k, radius_km)
+        index_time_ms = (time.perf_counter() - started) * 1000
+        
+        services = {s.id: s for s in Service.query.filter(Service.id.in_([sid for sid, _ in hits]))} if hits else {}
+        next_slots, _ = find_next_available_slots(
+            {sid: s.duration_minutes for sid, s in services.items()},
+            timezones={sid: s.tz_name for sid, s in services.items()}
+        )
+        results = []
+        for service_id, distance_km in hits:
+            service = services.get(service_id)
+            if not service:
+                continue
+            next_slot = next_slots[service_id]
+            results.append(dict(
+                service.to_dict(),
+                distance_km=round(distance_km, 3),
+                next_available_slot=serialize_slot(next_slot, service.tz_name) if next_slot is not None else None
+            ))
+        
         return jsonify({
-            'services': [service.to_dict() for service in services]
+            'services': results,
+            'index_time_ms': round(index_time_ms, 3)
         }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -55,18 +159,33 @@ def create_service():
         except (ValueError, TypeError):
             return jsonify({'error': 'price must be a valid number'}), 400
         
+        # Explicit coordinates win; otherwise geocode the address
+        coords, error = parse_coordinates(data)
+        if error:
+            return jsonify({'error': error}), 400
+        address = data.get('address', '').strip()
+        coords = coords or geocode(address)
+        
+        timezone = data.get('timezone') or None
+        if timezone is not None and not is_valid_timezone(timezone):
+            return jsonify({'error': f'Unknown timezone: {timezone}'}), 400
+        
         # Create service
         service = Service(
             name=data['name'].strip(),
             description=data.get('description', '').strip(),
             duration_minutes=data['duration_minutes'],
             price=price,
-            address=data.get('address', '').strip(),
+            address=address,
+            latitude=coords[0] if coords else None,
+            longitude=coords[1] if coords else None,
+            timezone=timezone.strip() if timezone else None,
             image_url=data.get('image_url', '').strip()
         )
         
         db.session.add(service)
         db.session.commit()
+        invalidate('services')
         
         return jsonify({
             'message': 'Service created successfully',
@@ -125,12 +244,23 @@ def update_service(service_id):
                 service.price = price
             except (ValueError, TypeError):
                 return jsonify({'error': 'price must be a valid number'}), 400
+        coords, error = parse_coordinates(data)
+        if error:
+            return jsonify({'error': error}), 400
         if 'address' in data:
             service.address = data['address'].strip()
+            coords = coords or geocode(service.address) or (None, None)
+        if coords:
+            service.latitude, service.longitude = coords
+        if 'timezone' in data:
+            if data['timezone'] and not is_valid_timezone(data['timezone']):
+                return jsonify({'error': f'Unknown timezone: {data["timezone"]}'}), 400
+            service.timezone = data['timezone'].strip() if data['timezone'] else None
         if 'image_url' in data:
             service.image_url = data['image_url'].strip()
         
         db.session.commit()
+        invalidate('services')
         
         return jsonify({
             'message': 'Service updated successfully',
@@ -154,8 +284,17 @@ def delete_service(service_id):
         if not service:
             return jsonify({'error': 'Service not found'}), 404
         
+        # Appointments are deleted with the service, so their days must be recomputed
+        booked = db.session.query(Appointment.start_time, Appointment.end_time).filter(
+            Appointment.service_id == service.id,
+            Appointment.status.in_(occupancy.BUSY_STATUSES)
+        ).all()
+        
         db.session.delete(service)
+        db.session.flush()
+        occupancy.refresh_days([day for start, end in booked for day in occupancy.interval_days(start, end)])
         db.session.commit()
+        invalidate('services')
         
         return jsonify({
             'message': 'Service deleted successfully'
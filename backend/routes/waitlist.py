@@ -0,0 +1,180 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models import db, Service, WaitlistEntry
+from datetime import datetime, timedelta
+from utils.outbox import enqueue, enqueue_notifications
+from utils.tz import local_today
+from utils.waitlist import accept_offer, reallocate_slot
+
+waitlist_bp = Blueprint('waitlist', __name__)
+
+def get_current_user():
+    """Helper to get current user from JWT"""
+    identity = get_jwt_identity()
+    from models import User
+    # Identity is now a string (user ID), not a dictionary
+    user_id = int(identity) if isinstance(identity, str) else identity
+    return User.query.get(user_id)
+
+@waitlist_bp.route('', methods=['GET'])
+@jwt_required()
+def get_waitlist():
+    """Get waitlist entries (all for admin, own for client)"""
+    try:
+        user = get_current_user()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        query = WaitlistEntry.query if user.is_admin() else WaitlistEntry.query.filter_by(user_id=user.id)
+        if request.args.get('status'):
+            query = query.filter_by(status=request.args['status'])
+        if request.args.get('service_id'):
+            query = query.filter_by(service_id=request.args.get('service_id', type=int))
+        if request.args.get('date'):
+            try:
+                query = query.filter_by(date=datetime.strptime(request.args['date'], '%Y-%m-%d').date())
+            except ValueError:
+                return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+        
+        entries = query.order_by(WaitlistEntry.date, WaitlistEntry.created_at).all()
+        return jsonify({
+            'waitlist': [entry.to_dict() for entry in entries]
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@waitlist_bp.route('', methods=['POST'])
+@jwt_required()
+def join_waitlist():
+    """Join the waitlist for a service on a date, optionally within a time window"""
+    try:
+        user = get_current_user()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'Request body is required'}), 400
+        
+        if data.get('service_id') is None or not data.get('date'):
+            return jsonify({'error': 'service_id and date are required'}), 400
+        
+        try:
+            service_id = int(data['service_id'])
+        except (ValueError, TypeError):
+            return jsonify({'error': 'service_id must be a valid integer'}), 400
+        
+        service = Service.query.get(service_id)
+        if not service:
+            return jsonify({'error': f'Service with id {service_id} not found'}), 404
+        
+        try:
+            date = datetime.strptime(data['date'], '%Y-%m-%d').date()
+            window_start = datetime.strptime(data['window_start'], '%H:%M').time() if data.get('window_start') else None
+            window_end = datetime.strptime(data['window_end'], '%H:%M').time() if data.get('window_end') else None
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Invalid format. Use YYYY-MM-DD for date and HH:MM for the window'}), 400
+        
+        # Dates and windows are local to the service
+        if date < local_today(service.tz_name):
+            return jsonify({'error': 'Cannot join the waitlist for a past date'}), 400
+        
+        if window_start and window_end and window_end <= window_start:
+            return jsonify({'error': 'window_end must be after window_start'}), 400
+        
+        existing = WaitlistEntry.query.filter(
+            WaitlistEntry.user_id == user.id,
+            WaitlistEntry.service_id == service.id,
+            WaitlistEntry.date == date,
+            WaitlistEntry.status.in_(['waiting', 'offered'])
+        ).first()
+        if existing:
+            return jsonify({'error': 'You are already on the waitlist for this service and date'}), 400
+        
+        entry = WaitlistEntry(
+            user_id=user.id,
+            service_id=service.id,
+            date=date,
+            window_start=window_start,
+            window_end=window_end,
+            auto_book=bool(data.get('auto_book', False))
+        )
+        db.session.add(entry)
+        db.session.commit()
+        
+        return jsonify({
+            'message': 'Added to the waitlist',
+            'entry': entry.to_dict()
+        }), 201
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@waitlist_bp.route('/<int:entry_id>/accept', methods=['POST'])
+@jwt_required()
+def accept_waitlist_offer(entry_id):
+    """Book the slot offered to a waitlist entry"""
+    try:
+        user = get_current_user()
+        entry = WaitlistEntry.query.get(entry_id)
+        
+        if not entry:
+            return jsonify({'error': 'Waitlist entry not found'}), 404
+        
+        if entry.user_id != user.id:
+            return jsonify({'error': 'Access denied'}), 403
+        
+        appointment, error = accept_offer(entry)
+        if appointment:
+            enqueue('appointment.created', {'appointment_id': appointment.id})
+        db.session.commit()
+        if error:
+            return jsonify({'error': error, 'entry': entry.to_dict()}), 409
+        
+        return jsonify({
+            'message': 'Appointment created successfully',
+            'appointment': appointment.to_dict(),
+            'entry': entry.to_dict()
+        }), 201
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@waitlist_bp.route('/<int:entry_id>', methods=['DELETE'])
+@jwt_required()
+def leave_waitlist(entry_id):
+    """Leave the waitlist (declines any open offer, which goes to the next waiter)"""
+    try:
+        user = get_current_user()
+        entry = WaitlistEntry.query.get(entry_id)
+        
+        if not entry:
+            return jsonify({'error': 'Waitlist entry not found'}), 404
+        
+        if not user.is_admin() and entry.user_id != user.id:
+            return jsonify({'error': 'Access denied'}), 403
+        
+        if entry.status not in ('waiting', 'offered'):
+            return jsonify({'error': f'Waitlist entry is already {entry.status}'}), 400
+        
+        offered_start = entry.offered_start if entry.status == 'offered' else None
+        entry.status = 'cancelled'
+        db.session.flush()
+        
+        if offered_start is not None:
+            service = entry.service
+            enqueue_notifications(reallocate_slot(
+                service, offered_start, offered_start + timedelta(minutes=service.duration_minutes)
+            ))
+        db.session.commit()
+        
+        return jsonify({
+            'message': 'Removed from the waitlist'
+        }), 200
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
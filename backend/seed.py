@@ -1,32 +1,39 @@
-from app import create_app
+from contextlib import nullcontext
+from flask import has_app_context
 from models import db, User, Service, WorkingHours
+from utils.geo import geocode
 from datetime import time
 
 def seed_database():
-    app = create_app()
+    # Reuse the caller's app (CLI, admin endpoint, startup); only build one when run as a script
+    if has_app_context():
+        context = nullcontext()
+    else:
+        from app import create_app
+        context = create_app().app_context()
     
-    with app.app_context():
-        # Create admin user
-        admin = User.query.filter_by(email='admin@bookease.com').first()
-        if not admin:
-            admin = User(email='admin@bookease.com', role='admin')
-            admin.set_password('admin123')
-            db.session.add(admin)
-            db.session.commit()
-            print("Created admin user: admin@bookease.com / admin123")
-        else:
-            print("Admin user already exists")
+    with context:
+        from utils.tenancy import ensure_default_tenant
+        ensure_default_tenant()
         
-        # Create demo client
-        client = User.query.filter_by(email='client@example.com').first()
-        if not client:
-            client = User(email='client@example.com', role='client')
-            client.set_password('client123')
-            db.session.add(client)
-            db.session.commit()
-            print("Created client user: client@example.com / client123")
-        else:
-            print("Client user already exists")
+        # Create demo users (one lookup for both accounts, committed together with the rest)
+        demo_users = [
+            ('admin@bookease.com', 'admin', 'admin123'),
+            ('client@example.com', 'client', 'client123')
+        ]
+        existing_emails = {
+            email for (email,) in db.session.query(User.email).filter(
+                User.email.in_([email for email, _, _ in demo_users])
+            )
+        }
+        for email, role, password in demo_users:
+            if email in existing_emails:
+                print(f"{role.capitalize()} user already exists")
+                continue
+            user = User(email=email, role=role)
+            user.set_password(password)
+            db.session.add(user)
+            print(f"Created {role} user: {email} / {password}")
         
         # Create services with addresses and images
         services_data = [
@@ -128,51 +135,41 @@ def seed_database():
             }
         ]
         
+        existing_services = {
+            service.name: service for service in Service.query.filter(
+                Service.name.in_([service_data['name'] for service_data in services_data])
+            )
+        }
         for service_data in services_data:
-            existing = Service.query.filter_by(name=service_data['name']).first()
+            existing = existing_services.get(service_data['name'])
             if not existing:
                 service = Service(**service_data)
+                service.latitude, service.longitude = geocode(service.address) or (None, None)
                 db.session.add(service)
             else:
-                # Update existing service with address and image if missing
+                # Update existing service with address, coordinates and image if missing
                 if not existing.address:
                     existing.address = service_data.get('address')
+                if existing.latitude is None:
+                    existing.latitude, existing.longitude = geocode(existing.address) or (None, None)
                 if not existing.image_url:
                     existing.image_url = service_data.get('image_url')
         
-        db.session.commit()
         print(f"Created/Updated {len(services_data)} services")
         
-        # Create working hours (Monday to Friday, 9 AM - 6 PM)
-        days = [
-            (0, 'Monday'),
-            (1, 'Tuesday'),
-            (2, 'Wednesday'),
-            (3, 'Thursday'),
-            (4, 'Friday')
-        ]
+        # Create working hours (Monday to Friday 9 AM - 6 PM, Saturday 10 AM - 4 PM)
+        default_hours = [(day_num, time(9, 0), time(18, 0)) for day_num in range(5)]
+        default_hours.append((5, time(10, 0), time(16, 0)))
         
-        for day_num, day_name in days:
-            existing = WorkingHours.query.filter_by(day_of_week=day_num).first()
-            if not existing:
-                working_hours = WorkingHours(
+        existing_days = {day for (day,) in db.session.query(WorkingHours.day_of_week)}
+        for day_num, start_time, end_time in default_hours:
+            if day_num not in existing_days:
+                db.session.add(WorkingHours(
                     day_of_week=day_num,
-                    start_time=time(9, 0),
-                    end_time=time(18, 0),
+                    start_time=start_time,
+                    end_time=end_time,
                     is_available=True
-                )
-                db.session.add(working_hours)
-        
-        # Saturday (10 AM - 4 PM)
-        saturday = WorkingHours.query.filter_by(day_of_week=5).first()
-        if not saturday:
-            working_hours = WorkingHours(
-                day_of_week=5,
-                start_time=time(10, 0),
-                end_time=time(16, 0),
-                is_available=True
-            )
-            db.session.add(working_hours)
+                ))
         
         db.session.commit()
         print("Created working hours")
@@ -184,4 +181,7 @@ def seed_database():
         print(f"\nTotal services available: {len(services_data)}")
 
 if __name__ == '__main__':
-    seed_database()
+    from app import app, init_database
+    with app.app_context():
+        init_database(seed_if_empty=False)
+        seed_database()
@@ -0,0 +1,232 @@
+"""
+Synthetic data generator for capacity planning
+
+Generates users, services, working hours and appointment histories and writes them
+in large batches: COPY on PostgreSQL, executemany (INSERT with many parameter sets)
+elsewhere. Rows are produced lazily, so a million appointments never sit in memory
+at once. Run through the CLI:
+
+    python -m flask --app app seed-synthetic --appointments 1000000
+"""
+import csv
+import io
+import random
+import time as timer
+from dataclasses import dataclass, field
+from datetime import datetime, time, timedelta
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+from models import db, User, Service, Appointment, WorkingHours, get_utc_now
+from utils.geo import geocode
+
+SERVICE_NAMES = [
+    'Haircut', 'Haircut & Styling', 'Beard Trim', 'Full Service', 'Hair Color',
+    'Hair Wash & Style', 'Kids Haircut', 'Hair Treatment', 'Consultation',
+    'Wedding Package', 'Hair Extensions', 'Hair Perm', 'Manicure', 'Pedicure',
+    'Massage', 'Facial', 'Eyebrow Shaping', 'Makeup'
+]
+STREETS = ['Main Street', 'Oak Avenue', 'Market Square', 'River Road', 'Station Lane', 'Park Boulevard']
+DISTRICTS = ['Downtown', 'Old Town', 'Harbor', 'University', 'Riverside', 'Hillside']
+
+@dataclass
+class SyntheticConfig:
+    """Sizes and distributions for a synthetic dataset"""
+    users: int = 1000
+    services: int = 50
+    appointments: int = 100000
+    future_days: int = 60                   # appointments are laid out backwards from today + future_days
+    fill_rate: float = 0.75                 # share of open minutes that get booked
+    cancel_rate: float = 0.1                # share of appointments that end up cancelled
+    gap_choices: list = field(default_factory=lambda: [0, 0, 0, 15, 30, 60])
+    durations: list = field(default_factory=lambda: [15, 20, 30, 45, 60, 90, 120])
+    open_time: time = time(9, 0)
+    close_time: time = time(18, 0)
+    closed_days: tuple = (6,)               # weekday numbers without working hours
+    replace_hours: bool = False             # overwrite existing working hours (else only fill an empty table)
+    batch_size: int = 10000
+    seed: int = 42
+
+@dataclass
+class TableStats:
+    table: str
+    rows: int
+    seconds: float
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else float('inf')
+
+def _batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _copy_rows(table, columns, batch):
+    """Load one batch through PostgreSQL COPY on the session's connection"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in batch:
+        writer.writerow(['' if row[column] is None else row[column] for column in columns])
+    buffer.seek(0)
+    raw = db.session.connection().connection.dbapi_connection
+    with raw.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer
+        )
+
+def bulk_load(model, rows, batch_size, use_copy=None):
+    """
+    Insert an iterable of row dicts in batches and report throughput
+
+    Args:
+        model: mapped class to insert into
+        rows: iterable of dicts keyed by column name
+        batch_size: rows per round trip
+        use_copy: force COPY on/off (default: COPY on PostgreSQL only)
+
+    Returns:
+        TableStats
+    """
+    table = model.__table__
+    if use_copy is None:
+        use_copy = db.session.get_bind().dialect.name == 'postgresql'
+
+    count = 0
+    started = timer.perf_counter()
+    for batch in _batches(rows, batch_size):
+        if use_copy:
+            _copy_rows(table, list(batch[0].keys()), batch)
+        else:
+            db.session.execute(insert(table), batch)
+        count += len(batch)
+    db.session.commit()
+    return TableStats(table.name, count, timer.perf_counter() - started)
+
+def generate_users(config, rng, password_hash):
+    now = get_utc_now()
+    for i in range(config.users):
+        yield {
+            'email': f'synthetic{config.seed}-{i}@example.com',
+            'password_hash': password_hash,
+            'role': 'client',
+            'created_at': now - timedelta(days=rng.randint(0, 3 * 365))
+        }
+
+def generate_services(config, rng):
+    now = get_utc_now()
+    for i in range(config.services):
+        duration = rng.choice(config.durations)
+        address = f'{rng.randint(1, 400)} {rng.choice(STREETS)}, {rng.choice(DISTRICTS)} District'
+        latitude, longitude = geocode(address)
+        yield {
+            'name': f'{rng.choice(SERVICE_NAMES)} #{i + 1}',
+            'description': f'Synthetic service {i + 1}',
+            'duration_minutes': duration,
+            # Longer services cost more, with some noise
+            'price': round(duration * rng.uniform(0.4, 1.2), 2),
+            'address': address,
+            'latitude': latitude,
+            'longitude': longitude,
+            'image_url': None,
+            'created_at': now,
+            'updated_at': now
+        }
+
+def generate_appointments(config, rng, user_ids, services):
+    """
+    Lay appointments out day by day, backwards from today + future_days
+
+    Appointments never overlap within a day (the booking logic treats the shop as a
+    single resource), so the number of appointments determines how far back the
+    history reaches.
+    """
+    now = get_utc_now()
+    open_minutes = (config.close_time.hour * 60 + config.close_time.minute) - \
+        (config.open_time.hour * 60 + config.open_time.minute)
+    day = now.date() + timedelta(days=config.future_days)
+    remaining = config.appointments
+
+    while remaining > 0:
+        if day.weekday() not in config.closed_days:
+            cursor = datetime.combine(day, config.open_time)
+            closing = datetime.combine(day, config.close_time)
+            booked = 0
+            while remaining > 0 and booked < open_minutes * config.fill_rate:
+                service_id, duration = rng.choice(services)
+                cursor += timedelta(minutes=rng.choice(config.gap_choices))
+                end = cursor + timedelta(minutes=duration)
+                if end > closing:
+                    break
+                if rng.random() < config.cancel_rate:
+                    status = 'cancelled'
+                else:
+                    status = 'completed' if end < now else 'confirmed'
+                yield {
+                    'user_id': rng.choice(user_ids),
+                    'service_id': service_id,
+                    'start_time': cursor,
+                    'end_time': end,
+                    'status': status,
+                    'created_at': cursor - timedelta(days=rng.randint(0, 30))
+                }
+                booked += duration
+                remaining -= 1
+                cursor = end
+        day -= timedelta(days=1)
+
+def seed_synthetic(config):
+    """
+    Generate and bulk load a synthetic dataset (needs an app context)
+
+    Returns:
+        List of TableStats, one per table written
+    """
+    from utils.occupancy import rebuild_occupancy
+    from utils.tenancy import current_tenant_or_default, ensure_default_tenant
+
+    ensure_default_tenant()
+    rng = random.Random(config.seed)
+    stats = []
+
+    # Hash once: per-user hashing would dominate the run and adds nothing to the data
+    password_hash = generate_password_hash('synthetic')
+    stats.append(bulk_load(User, generate_users(config, rng, password_hash), config.batch_size))
+    user_ids = [user_id for (user_id,) in db.session.query(User.id).filter(
+        User.email.like(f'synthetic{config.seed}-%')
+    )]
+
+    first_service_id = (db.session.query(db.func.max(Service.id)).scalar() or 0) + 1
+    stats.append(bulk_load(Service, generate_services(config, rng), config.batch_size))
+    services = db.session.query(Service.id, Service.duration_minutes).filter(
+        Service.id >= first_service_id
+    ).all()
+
+    # Working hours are real configuration: only replaced when asked, and only the target tenant's
+    hours = WorkingHours.query.filter(WorkingHours.tenant_id == current_tenant_or_default())
+    if config.replace_hours:
+        hours.delete(synchronize_session=False)
+    if config.replace_hours or hours.first() is None:
+        stats.append(bulk_load(WorkingHours, (
+            {
+                'day_of_week': day_num,
+                'start_time': config.open_time,
+                'end_time': config.close_time,
+                'is_available': True
+            }
+            for day_num in range(7) if day_num not in config.closed_days
+        ), config.batch_size, use_copy=False))
+
+    stats.append(bulk_load(
+        Appointment, generate_appointments(config, rng, user_ids, services), config.batch_size
+    ))
+
+    # Bulk loads bypass the per-booking bitmap maintenance
+    started = timer.perf_counter()
+    days = rebuild_occupancy()
+    stats.append(TableStats('day_occupancy', days, timer.perf_counter() - started))
+    return stats
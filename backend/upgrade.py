@@ -0,0 +1,157 @@
+"""
+In-place upgrade of a database created by an earlier version (flask upgrade-db)
+
+Tables come from db.create_all(), which adds missing tables but never alters the ones
+that exist. upgrade_schema() brings existing tables in line with the models:
+
+- adds missing columns; new NOT NULL columns all have a server default, so existing
+  rows get tenant 1 (tenant_id) and version 1
+- adds missing indexes and unique constraints, and recreates indexes whose columns changed
+- drops the uniques and indexes that tenant-leading ones replaced (global unique email
+  and weekday, start_time alone)
+- recreates derived tables whose primary key changed (day_occupancy; init-db rebuilds
+  the bitmaps afterwards)
+
+Every step checks the live schema first, so it is safe to run on every deploy (init-db
+runs it). SQLite cannot drop a constraint, so a table with an obsolete inline unique
+is rebuilt there (rows copied into a fresh table) instead.
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import AddConstraint, CreateColumn, UniqueConstraint
+from models import db
+
+# Indexes replaced by tenant-leading ones
+OBSOLETE_INDEXES = {
+    'users': ('ix_users_email',),
+    'appointments': ('ix_appointments_start_time',),
+}
+# Columns that used to be unique on their own and now are unique per tenant (or not at all)
+OBSOLETE_UNIQUES = {
+    'users': (['email'],),
+    'working_hours': (['day_of_week'],),
+}
+# Derived from other tables: recreated instead of altered
+DERIVED_TABLES = ('day_occupancy',)
+
+def _quote(connection, name):
+    return connection.dialect.identifier_preparer.quote(name)
+
+def _add_columns(connection, table):
+    present = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    changes = []
+    for column in table.columns:
+        if column.name in present:
+            continue
+        ddl = CreateColumn(column).compile(dialect=connection.dialect)
+        connection.execute(text(f'ALTER TABLE {_quote(connection, table.name)} ADD COLUMN {ddl}'))
+        # SQLite cannot add a foreign key to an existing table
+        if connection.dialect.name != 'sqlite':
+            for foreign_key in column.foreign_keys:
+                connection.execute(AddConstraint(foreign_key.constraint))
+        changes.append(f'added {table.name}.{column.name}')
+    return changes
+
+def _rebuild_sqlite_table(connection, table):
+    """Recreate a table from its model, keeping its rows (SQLite cannot drop constraints)"""
+    old_name = f'{table.name}_old'
+    present = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    columns = ', '.join(_quote(connection, column.name) for column in table.columns if column.name in present)
+    # Index names are global in SQLite, so the old table's go before the new ones are created
+    for index in inspect(connection).get_indexes(table.name):
+        connection.execute(text(f'DROP INDEX {_quote(connection, index["name"])}'))
+    # Legacy mode keeps other tables' foreign keys pointing at the name, not the renamed table
+    connection.execute(text('PRAGMA legacy_alter_table = ON'))
+    connection.execute(text(f'ALTER TABLE {_quote(connection, table.name)} RENAME TO {_quote(connection, old_name)}'))
+    connection.execute(text('PRAGMA legacy_alter_table = OFF'))
+    table.create(connection)
+    connection.execute(text(
+        f'INSERT INTO {_quote(connection, table.name)} ({columns}) '
+        f'SELECT {columns} FROM {_quote(connection, old_name)}'
+    ))
+    connection.execute(text(f'DROP TABLE {_quote(connection, old_name)}'))
+
+def _drop_obsolete(connection, table):
+    inspector = inspect(connection)
+    changes = []
+    indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+    for name in OBSOLETE_INDEXES.get(table.name, ()):
+        if name in indexes:
+            connection.execute(text(f'DROP INDEX {_quote(connection, name)}'))
+            changes.append(f'dropped index {name}')
+    for columns in OBSOLETE_UNIQUES.get(table.name, ()):
+        for unique in inspector.get_unique_constraints(table.name):
+            if unique['column_names'] != columns:
+                continue
+            if connection.dialect.name == 'sqlite':
+                _rebuild_sqlite_table(connection, table)
+                changes.append(f'rebuilt {table.name} without unique ({", ".join(columns)})')
+                return changes
+            connection.execute(text(
+                f'ALTER TABLE {_quote(connection, table.name)} DROP CONSTRAINT {_quote(connection, unique["name"])}'
+            ))
+            changes.append(f'dropped unique {unique["name"]}')
+    return changes
+
+def _sync_indexes(connection, table):
+    existing = {index['name']: index['column_names'] for index in inspect(connection).get_indexes(table.name)}
+    changes = []
+    for index in table.indexes:
+        columns = [column.name for column in index.columns]
+        if index.name in existing:
+            # Expression indexes (no plain columns) are only checked for presence
+            if not columns or existing[index.name] == columns:
+                continue
+            connection.execute(text(f'DROP INDEX {_quote(connection, index.name)}'))
+        # Dialect-specific indexes (ddl_if) are skipped on other databases
+        index.create(connection)
+        if index.name in {found['name'] for found in inspect(connection).get_indexes(table.name)}:
+            changes.append(f'created index {index.name}')
+    return changes
+
+def _add_uniques(connection, table):
+    inspector = inspect(connection)
+    present = {unique['name'] for unique in inspector.get_unique_constraints(table.name)}
+    present |= {index['name'] for index in inspector.get_indexes(table.name)}
+    changes = []
+    for constraint in table.constraints:
+        if not isinstance(constraint, UniqueConstraint) or not constraint.name or constraint.name in present:
+            continue
+        if connection.dialect.name == 'sqlite':
+            # SQLite cannot add constraints; a unique index enforces the same rule
+            columns = ', '.join(_quote(connection, column.name) for column in constraint.columns)
+            connection.execute(text(
+                f'CREATE UNIQUE INDEX {_quote(connection, constraint.name)} '
+                f'ON {_quote(connection, table.name)} ({columns})'
+            ))
+        else:
+            connection.execute(AddConstraint(constraint))
+        changes.append(f'added unique {constraint.name}')
+    return changes
+
+def upgrade_schema(engine=None):
+    """
+    Alter existing tables to match the models (call after create_all and ensure_default_tenant,
+    whose tenant row the new tenant_id foreign keys point to)
+
+    Returns:
+        List of human-readable changes made (empty when the schema was up to date)
+    """
+    engine = engine if engine is not None else db.engine
+    changes = []
+    with engine.begin() as connection:
+        existing = set(inspect(connection).get_table_names())
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing:
+                continue
+            if table.name in DERIVED_TABLES:
+                primary_key = inspect(connection).get_pk_constraint(table.name)['constrained_columns']
+                if sorted(primary_key) != sorted(column.name for column in table.primary_key):
+                    table.drop(connection)
+                    table.create(connection)
+                    changes.append(f'recreated {table.name}')
+                    continue
+            changes += _add_columns(connection, table)
+            changes += _drop_obsolete(connection, table)
+            changes += _sync_indexes(connection, table)
+            changes += _add_uniques(connection, table)
+    return changes
@@ -0,0 +1,218 @@
+"""
+Utilization and revenue analytics over time buckets
+
+Everything is derived from one daily rollup: per (UTC date, service, status) the
+number of appointments, their booked minutes and their revenue, produced by a single
+GROUP BY over the hot and archived appointments. Day, week and month buckets, per
+service totals and the rates are then folded from a few rows per day instead of from
+appointments, and open minutes come from the compiled schedule.
+
+Closed days (ended longer ago than the completion grace, so their statuses have
+settled) are cached per process and tenant: a dashboard over a year only queries the days it
+has not seen before plus the last couple of days. A cached day is dropped when an
+appointment on it is written through the ORM (the 'appointments' event) and at the
+latest after ANALYTICS_CACHE_SECONDS, which bounds staleness from writes made in other
+processes.
+
+Definitions:
+
+- bookings: appointments that held their time (occupancy.BUSY_STATUSES)
+- revenue: Service.price of confirmed and completed appointments
+- utilization: booked minutes / open minutes
+- cancellation_rate: cancelled / all appointments
+- no_show_rate: no-shows / (completed + no-shows)
+"""
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from flask import current_app, has_app_context
+from models import db, Service, get_utc_now
+from utils.archive import appointment_rows
+from utils.events import APPOINTMENTS_TOPIC, bus
+from utils.occupancy import BUSY_STATUSES
+from utils.schedule import get_schedule
+from utils.tenancy import current_tenant_id
+
+REVENUE_STATUSES = ('confirmed', 'completed')
+BUCKETS = ('day', 'week', 'month')
+
+def _session(session):
+    return session if session is not None else db.session
+
+def _config(key, default):
+    return current_app.config.get(key, default) if has_app_context() else default
+
+def _minutes_between(start, end, dialect):
+    """SQL expression for the minutes between two timestamp columns"""
+    if dialect == 'postgresql':
+        return db.func.extract('epoch', end - start) / 60
+    return (db.func.julianday(end) - db.func.julianday(start)) * 1440
+
+def _as_date(value):
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+def query_rollup(start_date, end_date, session=None):
+    """
+    Daily rollup for [start_date, end_date] straight from the database
+
+    Returns:
+        Dict of date -> list of (service_id, status, appointments, minutes, revenue)
+    """
+    session = _session(session)
+    rows = appointment_rows(include_archived=True)
+    day = db.func.date(rows.c.start_time)
+    query = session.query(
+        day, rows.c.service_id, rows.c.status, db.func.count(),
+        db.func.sum(_minutes_between(rows.c.start_time, rows.c.end_time, session.get_bind().dialect.name)),
+        db.func.sum(Service.price)
+    ).join(Service, Service.id == rows.c.service_id).filter(
+        rows.c.start_time >= datetime.combine(start_date, datetime.min.time()),
+        rows.c.start_time < datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+    ).group_by(day, rows.c.service_id, rows.c.status)
+
+    rollup = {}
+    for day_value, service_id, status, count, minutes, revenue in query:
+        rollup.setdefault(_as_date(day_value), []).append(
+            (service_id, status, count, int(round(minutes or 0)), Decimal(revenue or 0))
+        )
+    return rollup
+
+class RollupCache:
+    """Daily rollups of closed days, kept per process and tenant"""
+
+    def __init__(self, max_days=4000):
+        self.max_days = max_days
+        self._lock = threading.Lock()
+        self._days = {}   # (tenant id, date) -> (rows, cached_at)
+
+    def invalidate(self, day=None, tenant_id=None):
+        with self._lock:
+            if day is None:
+                self._days.clear()
+            else:
+                # Rollups computed outside any tenant (None) include every tenant's rows
+                self._days.pop((tenant_id, day), None)
+                self._days.pop((None, day), None)
+
+    def closed_before(self):
+        """First date that may still change (statuses settle after the completion grace)"""
+        grace = timedelta(minutes=_config('AUTO_COMPLETE_GRACE_MINUTES', 60))
+        return (get_utc_now() - grace - timedelta(days=1)).date()
+
+    def get(self, start_date, end_date, session=None):
+        """Rollup for [start_date, end_date]: cached closed days plus one query for the rest"""
+        ttl = _config('ANALYTICS_CACHE_SECONDS', 3600)
+        now = time.monotonic()
+        closed_before = self.closed_before()
+        tenant_id = current_tenant_id()
+        days = [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+
+        result, missing = {}, []
+        with self._lock:
+            for day in days:
+                cached = self._days.get((tenant_id, day))
+                if cached is not None and now - cached[1] < ttl:
+                    result[day] = cached[0]
+                else:
+                    missing.append(day)
+
+        if missing:
+            fresh = query_rollup(missing[0], missing[-1], session)
+            with self._lock:
+                for day in missing:
+                    result[day] = fresh.get(day, [])
+                    if day < closed_before:
+                        self._days[tenant_id, day] = (result[day], now)
+                if len(self._days) > self.max_days:
+                    # Oldest days first, whichever tenant they belong to
+                    for key in sorted(self._days, key=lambda key: key[1])[:len(self._days) - self.max_days]:
+                        del self._days[key]
+        return result
+
+rollup_cache = RollupCache()
+
+def _on_appointment(topic, payload):
+    if payload.get('start_time'):
+        rollup_cache.invalidate(datetime.fromisoformat(payload['start_time']).date(), payload.get('tenant_id'))
+
+bus.subscribe([APPOINTMENTS_TOPIC], _on_appointment)
+
+def bucket_start(day, bucket):
+    """First date of the day/week (Monday)/month bucket holding `day`"""
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+class Totals:
+    """Counters folded from rollup rows"""
+
+    def __init__(self):
+        self.by_status = {}
+        self.bookings = 0
+        self.booked_minutes = 0
+        self.revenue = Decimal(0)
+        self.open_minutes = 0
+
+    def add(self, status, count, minutes, revenue):
+        self.by_status[status] = self.by_status.get(status, 0) + count
+        if status in BUSY_STATUSES:
+            self.bookings += count
+            self.booked_minutes += minutes
+        if status in REVENUE_STATUSES:
+            self.revenue += revenue
+
+    def to_dict(self, with_capacity=True):
+        total = sum(self.by_status.values())
+        attended = self.by_status.get('completed', 0) + self.by_status.get('no_show', 0)
+        result = {
+            'appointments': total,
+            'bookings': self.bookings,
+            'by_status': self.by_status,
+            'revenue': float(self.revenue),
+            'booked_minutes': self.booked_minutes,
+            'cancellation_rate': round(self.by_status.get('cancelled', 0) / total, 4) if total else 0.0,
+            'no_show_rate': round(self.by_status.get('no_show', 0) / attended, 4) if attended else 0.0
+        }
+        if with_capacity:
+            result['open_minutes'] = self.open_minutes
+            result['utilization'] = round(self.booked_minutes / self.open_minutes, 4) if self.open_minutes else None
+        return result
+
+def compute_analytics(start_date, end_date, bucket='day', session=None):
+    """
+    Utilization, revenue and rates over [start_date, end_date] (UTC dates)
+
+    Returns:
+        Dict with 'totals', 'buckets' (one entry per day/week/month) and 'services'
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f'bucket must be one of: {", ".join(BUCKETS)}')
+    rollup = rollup_cache.get(start_date, end_date, session)
+    schedule = get_schedule(session)
+    names = dict(_session(session).query(Service.id, Service.name))
+
+    totals, buckets, services = Totals(), {}, {}
+    for day in sorted(rollup):
+        open_minutes = schedule.open_minutes(day)
+        period = buckets.setdefault(bucket_start(day, bucket), Totals())
+        period.open_minutes += open_minutes
+        totals.open_minutes += open_minutes
+        for service_id, status, count, minutes, revenue in rollup[day]:
+            totals.add(status, count, minutes, revenue)
+            period.add(status, count, minutes, revenue)
+            services.setdefault(service_id, Totals()).add(status, count, minutes, revenue)
+
+    return {
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'bucket': bucket,
+        'totals': totals.to_dict(),
+        'buckets': [dict(period.to_dict(), start=key.isoformat()) for key, period in sorted(buckets.items())],
+        'services': sorted((
+            dict(service.to_dict(with_capacity=False), service_id=service_id, name=names.get(service_id))
+            for service_id, service in services.items()
+        ), key=lambda item: item['revenue'], reverse=True)
+    }
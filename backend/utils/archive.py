@@ -0,0 +1,107 @@
+"""
+Hot/cold split for appointments
+
+Old completed/cancelled appointments are moved in batches from `appointments` (the
+table the booking path scans) to `appointments_archive`. On PostgreSQL the archive
+is partitioned by month and partitions are created on demand; elsewhere it is a
+plain table. Listings and stats can read both through appointment_rows(), which is
+also where Core statements get their tenant filter (utils/tenancy.py).
+"""
+from datetime import date, timedelta
+from sqlalchemy import insert, select, text, union_all
+from models import db, Appointment, AppointmentArchive, get_utc_now
+from utils.tenancy import tenant_filter
+
+ARCHIVABLE_STATUSES = ('completed', 'cancelled', 'no_show')
+ARCHIVE_COLUMNS = ('id', 'tenant_id', 'user_id', 'service_id', 'start_time', 'end_time', 'status', 'created_at')
+
+def _session(session):
+    return session if session is not None else db.session
+
+def _month_start(value):
+    return date(value.year, value.month, 1)
+
+def _next_month(value):
+    return date(value.year + (value.month == 12), value.month % 12 + 1, 1)
+
+def ensure_partitions(start, end, session=None):
+    """Create the monthly archive partitions covering [start, end] (PostgreSQL only)"""
+    session = _session(session)
+    if session.get_bind().dialect.name != 'postgresql':
+        return
+
+    month = _month_start(start)
+    while month <= end.date():
+        upper = _next_month(month)
+        session.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {AppointmentArchive.__tablename__}_{month:%Y_%m} "
+            f"PARTITION OF {AppointmentArchive.__tablename__} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+        ))
+        month = upper
+
+def archive_appointments(older_than, batch_size=5000, session=None):
+    """
+    Move completed/cancelled appointments that ended before `older_than` to the archive
+
+    Each batch is copied and deleted in its own transaction, so locks stay short and an
+    interrupted run can simply be restarted.
+
+    Args:
+        older_than: naive UTC datetime retention horizon
+        batch_size: appointments moved per transaction
+        session: optional SQLAlchemy session (defaults to db.session)
+
+    Returns:
+        Number of appointments archived
+    """
+    session = _session(session)
+    hot = Appointment.__table__
+    columns = [hot.c[name] for name in ARCHIVE_COLUMNS]
+    moved = 0
+
+    while True:
+        rows = session.execute(
+            select(*columns).where(
+                hot.c.end_time < older_than,
+                hot.c.status.in_(ARCHIVABLE_STATUSES),
+                tenant_filter(hot.c.tenant_id)
+            ).order_by(hot.c.id).limit(batch_size)
+        ).mappings().all()
+        if not rows:
+            break
+
+        ensure_partitions(
+            min(row['start_time'] for row in rows), max(row['start_time'] for row in rows), session
+        )
+        archived_at = get_utc_now()
+        session.execute(insert(AppointmentArchive.__table__), [
+            dict(row, archived_at=archived_at) for row in rows
+        ])
+        session.execute(hot.delete().where(hot.c.id.in_([row['id'] for row in rows])))
+        session.commit()
+        moved += len(rows)
+
+    return moved
+
+def archive_expired(retention_days, batch_size=5000, session=None):
+    """Archive everything older than the retention horizon (in days)"""
+    horizon = get_utc_now() - timedelta(days=retention_days)
+    return archive_appointments(horizon, batch_size, session)
+
+def appointment_rows(include_archived=False):
+    """
+    Selectable with the appointment columns from the hot table, optionally unioned with the archive
+
+    Use its `.c` columns in aggregates, e.g. query(rows.c.status, func.count()).group_by(rows.c.status).
+    Rows are limited to the current tenant, if any.
+    """
+    hot = Appointment.__table__
+    cold = AppointmentArchive.__table__
+    hot_rows = select(*[hot.c[name] for name in ARCHIVE_COLUMNS]).where(tenant_filter(hot.c.tenant_id))
+    if not include_archived:
+        return hot_rows.subquery('appointments')
+    return union_all(
+        hot_rows,
+        select(*[cold.c[name] for name in ARCHIVE_COLUMNS]).where(tenant_filter(cold.c.tenant_id))
+    ).subquery('all_appointments')
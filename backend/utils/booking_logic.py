@@ -1,18 +1,16 @@
 """
 Booking logic utilities for calculating available time slots
 """
-from datetime import datetime, timedelta, time
-from models import WorkingHours, Appointment
-
-def get_working_hours_for_day(day_of_week):
-    """Get working hours for a specific day of week (0-6)"""
-    working_hours = WorkingHours.query.filter_by(day_of_week=day_of_week, is_available=True).first()
-    if not working_hours:
-        return None
-    return {
-        'start': working_hours.start_time,
-        'end': working_hours.end_time
-    }
+from array import array
+from bisect import bisect_left
+from datetime import timedelta, timezone
+from models import db, Appointment, get_utc_now
+from utils import occupancy, tz
+from utils.schedule import get_schedule
+
+def _session(session):
+    """Use the given session (e.g. an async run_sync session) or the Flask one"""
+    return session if session is not None else db.session
 
 def generate_time_slots(start_time, end_time, slot_duration_minutes, buffer_minutes=0):
     """
@@ -36,29 +34,34 @@ def generate_time_slots(start_time, end_time, slot_duration_minutes, buffer_minu
     
     return slots
 
-def get_existing_appointments(start_date, end_date):
+def get_existing_appointments(start_date, end_date, session=None, exclude_id=None):
     """
     Get all existing appointments between start_date and end_date
     
     Args:
         start_date: datetime object
         end_date: datetime object
+        session: optional SQLAlchemy session (defaults to db.session)
+        exclude_id: leave this appointment out (e.g. the one being rescheduled)
     
     Returns:
-        List of appointment dictionaries with start_time and end_time
+        List of appointment dictionaries with id, start and end
     """
-    appointments = Appointment.query.filter(
+    query = _session(session).query(Appointment.id, Appointment.start_time, Appointment.end_time).filter(
         Appointment.start_time >= start_date,
         Appointment.start_time < end_date,
-        Appointment.status == 'confirmed'
-    ).all()
+        Appointment.status.in_(occupancy.BUSY_STATUSES)
+    )
+    if exclude_id is not None:
+        query = query.filter(Appointment.id != exclude_id)
     
     return [
         {
-            'start': app.start_time,
-            'end': app.end_time
+            'id': appointment_id,
+            'start': start,
+            'end': end
         }
-        for app in appointments
+        for appointment_id, start, end in query
     ]
 
 def is_slot_available(slot_start, slot_end, existing_appointments):
@@ -79,53 +82,222 @@ def is_slot_available(slot_start, slot_end, existing_appointments):
             return False
     return True
 
-def get_available_slots(date, service_duration_minutes, buffer_minutes=15):
+class BusyIntervals:
+    """
+    Busy appointments as parallel arrays of epoch minutes, sorted by start
+
+    Three machine integers per appointment instead of an ORM instance (with its
+    identity-map state) plus a dict, and an overlap test is a bisect instead of a scan.
+    """
+    __slots__ = ('ids', 'starts', 'ends', '_max_ends')
+
+    def __init__(self, rows=()):
+        """
+        Args:
+            rows: (id, start_minute, end_minute) tuples sorted by start_minute
+        """
+        self.ids, self.starts, self.ends = array('q'), array('q'), array('q')
+        self._max_ends = array('q')  # running max of ends, for overlaps with long appointments
+        for appointment_id, start, end in rows:
+            self.ids.append(appointment_id)
+            self.starts.append(start)
+            self.ends.append(end)
+            self._max_ends.append(max(end, self._max_ends[-1]) if self._max_ends else end)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def is_free(self, start_minute, end_minute):
+        """True if no interval overlaps [start_minute, end_minute)"""
+        before_end = bisect_left(self.starts, end_minute)
+        return before_end == 0 or self._max_ends[before_end - 1] <= start_minute
+
+def load_busy_intervals(start, end, session=None, exclude_id=None):
+    """
+    Busy appointments overlapping [start, end) (naive UTC) as BusyIntervals
+
+    A column-only query: no Appointment instances are built. Partial minutes are
+    rounded outwards, as in the occupancy bitmaps.
+    """
+    query = _session(session).query(Appointment.id, Appointment.start_time, Appointment.end_time).filter(
+        Appointment.start_time < end,
+        Appointment.end_time > start,
+        Appointment.status.in_(occupancy.BUSY_STATUSES)
+    ).order_by(Appointment.start_time)
+    if exclude_id is not None:
+        query = query.filter(Appointment.id != exclude_id)
+    return BusyIntervals(
+        (appointment_id, tz.epoch_minute(busy_start), tz.epoch_minute_ceil(busy_end))
+        for appointment_id, busy_start, busy_end in query
+    )
+
+def current_minute():
+    """First whole UTC epoch minute that is not in the past"""
+    return tz.epoch_minute_ceil(get_utc_now())
+
+def _utc_dates(windows):
+    """Consecutive UTC dates covered by epoch-minute windows (the occupancy rows they need)"""
+    first = tz.epoch_minute_date(min(start for start, _ in windows))
+    last = tz.epoch_minute_date(max(end for _, end in windows) - 1)
+    return [first + timedelta(days=i) for i in range((last - first).days + 1)]
+
+def get_available_slots(date, service_duration_minutes, buffer_minutes=15, session=None, tz_name=None):
     """
     Get all available time slots for a specific date and service duration
     
     Args:
-        date: datetime.date object
+        date: datetime.date object (a local date at tz_name)
         service_duration_minutes: duration of the service in minutes
         buffer_minutes: buffer time between appointments (default 15 minutes)
+        session: optional SQLAlchemy session (defaults to db.session)
+        tz_name: IANA timezone of the service (defaults to DEFAULT_TIMEZONE)
     
     Returns:
-        List of available datetime objects
+        List of available slot start times as UTC epoch minutes (see serialize_slot)
     """
-    # Get day of week (0=Monday, 6=Sunday)
-    day_of_week = date.weekday()
+    tz_name = tz_name or tz.default_timezone()
     
-    # Get working hours for this day
-    working_hours = get_working_hours_for_day(day_of_week)
-    if not working_hours:
+    # Opening intervals for this date from the in-memory schedule (weekly hours + exceptions),
+    # mapped to UTC through the cached offset table of the local day
+    windows = tz.utc_windows(tz_name, date, get_schedule(session).intervals_for(date))
+    if not windows:
         return []
     
-    # Create datetime objects for start and end of working hours
-    start_datetime = datetime.combine(date, working_hours['start'])
-    end_datetime = datetime.combine(date, working_hours['end'])
+    # Occupied minutes for the UTC days the local day overlaps (one bitmap row per day)
+    dates = _utc_dates(windows)
+    busy = occupancy.load_days(dates, session)
     
-    # Get existing appointments for this date
-    day_start = datetime.combine(date, time.min)
-    day_end = datetime.combine(date, time.max)
-    existing_appointments = get_existing_appointments(day_start, day_end)
+    return compute_available_slots(
+        windows, occupancy.join_days(busy, dates), tz.date_epoch_minute(dates[0]),
+        service_duration_minutes, buffer_minutes
+    )
+
+def compute_available_slots(windows, busy_bits, base_minute,
+                            service_duration_minutes, buffer_minutes=15, now=None, limit=None):
+    """
+    Compute available slots from already loaded data (no database access)
+    
+    Args:
+        windows: opening windows as (open, close) UTC epoch minutes (see utils.tz.utc_windows)
+        busy_bits: occupancy integer whose bit 0 is base_minute (see utils.occupancy.join_days)
+        base_minute: epoch minute of bit 0 of busy_bits
+        service_duration_minutes: duration of the service in minutes
+        buffer_minutes: buffer time between appointments
+        now: epoch minute before which slots are excluded (defaults to current_minute())
+        limit: stop after this many slots (e.g. 1 when only the earliest is needed)
     
-    # Generate all possible slots
-    all_slots = generate_time_slots(start_datetime, end_datetime, service_duration_minutes, buffer_minutes)
+    Returns:
+        List of available slot start times as UTC epoch minutes
+    """
+    now = current_minute() if now is None else now
+    step = service_duration_minutes + buffer_minutes
     
-    # Filter out slots that conflict with existing appointments
+    # Every window (e.g. before and after a lunch break) starts its own slot grid;
+    # each candidate is a single mask test on the occupancy integer
     available_slots = []
-    for slot_start in all_slots:
-        slot_end = slot_start + timedelta(minutes=service_duration_minutes)
-        
-        # Don't allow bookings in the past
-        if slot_start < datetime.now():
-            continue
-        
-        if is_slot_available(slot_start, slot_end, existing_appointments):
-            available_slots.append(slot_start)
+    for open_minute, close_minute in windows:
+        minute = open_minute
+        while minute + step <= close_minute:
+            offset = minute - base_minute
+            
+            # Don't allow bookings in the past
+            if minute >= now and occupancy.is_range_free(busy_bits, offset, offset + service_duration_minutes):
+                available_slots.append(minute)
+                if limit and len(available_slots) >= limit:
+                    return available_slots
+            minute += step
     
     return available_slots
 
+def find_next_available_slots(service_durations, start_date=None, max_days=60,
+                              buffer_minutes=15, batch_days=7, session=None, timezones=None):
+    """
+    Earliest available slot for each service, searching forward from start_date
+    
+    Opening hours come from the compiled schedule and occupancy is loaded one week (batch_days) at a time; the
+    search stops as soon as every service has a slot, so it only reads the days it
+    actually needs. Slots only depend on the duration and timezone, so services
+    sharing both are resolved together.
+    
+    Args:
+        service_durations: dict of service_id -> duration in minutes
+        start_date: first local date to search (default: today at the earliest timezone)
+        max_days: search horizon in days
+        buffer_minutes: buffer time between appointments
+        batch_days: days of occupancy loaded per query
+        session: optional SQLAlchemy session (defaults to db.session)
+        timezones: optional dict of service_id -> IANA timezone (default: DEFAULT_TIMEZONE)
+    
+    Returns:
+        (dict of service_id -> UTC epoch minute or None, number of days searched)
+    """
+    timezones = timezones or {}
+    default_zone = tz.default_timezone()
+    
+    pending = {}
+    for service_id, duration in service_durations.items():
+        pending.setdefault((duration, timezones.get(service_id) or default_zone), []).append(service_id)
+    found = {service_id: None for service_id in service_durations}
+    if not pending:
+        return found, 0
+    
+    start_date = start_date or min(tz.local_today(zone) for _, zone in pending)
+    now = current_minute()
+    schedule = get_schedule(session)
+    
+    searched = 0
+    while pending and searched < max_days:
+        dates = [start_date + timedelta(days=searched + i) for i in range(min(batch_days, max_days - searched))]
+        windows = {
+            (zone, date): tz.utc_windows(zone, date, schedule.intervals_for(date))
+            for zone in {zone for _, zone in pending} for date in dates
+        }
+        busy = occupancy.load_days(sorted({
+            day for day_windows in windows.values() if day_windows for day in _utc_dates(day_windows)
+        }), session)
+        for date in dates:
+            searched += 1
+            for duration, zone in list(pending):
+                day_windows = windows[(zone, date)]
+                if not day_windows:
+                    continue
+                span = _utc_dates(day_windows)
+                slots = compute_available_slots(
+                    day_windows, occupancy.join_days(busy, span), tz.date_epoch_minute(span[0]),
+                    duration, buffer_minutes, now, limit=1
+                )
+                if slots:
+                    for service_id in pending.pop((duration, zone)):
+                        found[service_id] = slots[0]
+            if not pending:
+                break
+    
+    return found, searched
+
+def find_next_available_slot(service_duration_minutes, start_date=None, max_days=60,
+                             buffer_minutes=15, session=None, tz_name=None):
+    """Earliest available slot for a single duration (see find_next_available_slots)"""
+    found, _ = find_next_available_slots(
+        {None: service_duration_minutes}, start_date, max_days, buffer_minutes,
+        session=session, timezones={None: tz_name}
+    )
+    return found[None]
+
 def format_time_slot(dt):
     """Format datetime to readable time string"""
     return dt.strftime('%H:%M')
 
+def serialize_slot(minute, tz_name=None):
+    """
+    Format a slot (UTC epoch minute) for API responses
+    
+    'time' is the local wall-clock time at the service, 'datetime' the UTC instant
+    (what clients send back when booking) and 'local_datetime' the same instant with
+    the local offset.
+    """
+    local = tz.to_local(minute, tz_name or tz.default_timezone())
+    return {
+        'time': format_time_slot(local),
+        'datetime': tz.from_epoch_minute(minute).replace(tzinfo=timezone.utc).isoformat(),
+        'local_datetime': local.isoformat()
+    }
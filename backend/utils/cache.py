@@ -0,0 +1,112 @@
+"""
+In-process caches for values derived from rarely changing tables
+
+A DerivedCache holds something expensive to build (a search index, a serialized
+payload, a compiled schedule). It is rebuilt when:
+
+- the endpoint that changed the underlying rows calls invalidate(group) after commit
+  (immediate in this worker), or
+- a cheap signature query (e.g. row count + max(updated_at)) returns something new;
+  it runs at most once every CACHE_REVALIDATE_SECONDS so other gunicorn workers
+  pick up changes without checking the database on every request.
+
+Values are kept per tenant (utils/tenancy.py): get() and invalidate() act on the
+current tenant's entry, so one tenant's edits never rebuild another tenant's caches.
+"""
+import threading
+import time
+from collections import defaultdict
+from utils.tenancy import current_tenant_id
+
+_groups = defaultdict(list)
+
+def invalidate(group):
+    """Drop every cache registered under `group` for the current tenant (call after committing a change)"""
+    for cache in _groups[group]:
+        cache.invalidate()
+
+def table_signature(model, session=None):
+    """Cheap change fingerprint for a table with an updated_at column: (row count, max(updated_at))"""
+    from models import db
+    session = session if session is not None else db.session
+    return tuple(session.query(db.func.count(), db.func.max(model.updated_at)).select_from(model).one())
+
+def clear_all():
+    """Drop every registered cache"""
+    for caches in _groups.values():
+        for cache in caches:
+            cache.invalidate(all_tenants=True)
+
+class _Entry:
+    """One tenant's cached value"""
+    __slots__ = ('value', 'signature', 'checked_at')
+
+    def __init__(self, value, signature, checked_at):
+        self.value = value
+        self.signature = signature
+        self.checked_at = checked_at
+
+class DerivedCache:
+    """Lazily built value per tenant, rebuilt on invalidation or when its signature changes"""
+
+    def __init__(self, group, build, signature=None, revalidate_seconds=None):
+        """
+        Args:
+            group: invalidation group name (e.g. 'services')
+            build: callable returning the cached value (receives the arguments given to get())
+            signature: optional callable returning a cheap fingerprint of the source rows
+                (receives the arguments given to get())
+            revalidate_seconds: how often the signature is checked (default: app config)
+        """
+        self.group = group
+        self._build = build
+        self._signature = signature
+        self._revalidate_seconds = revalidate_seconds
+        self._lock = threading.Lock()
+        self._entries = {}   # tenant id (None outside any tenant) -> _Entry
+        self._generation = 0   # bumped by invalidate(), so a build that raced it is not stored
+        _groups[group].append(self)
+
+    def _interval(self):
+        if self._revalidate_seconds is not None:
+            return self._revalidate_seconds
+        from flask import current_app, has_app_context
+        if has_app_context():
+            return current_app.config.get('CACHE_REVALIDATE_SECONDS', 5)
+        return 5
+
+    def invalidate(self, all_tenants=False):
+        tenant_id = current_tenant_id()
+        with self._lock:
+            self._generation += 1
+            if all_tenants or tenant_id is None:
+                self._entries.clear()
+            else:
+                # The unscoped entry covers every tenant's rows, so it is stale too
+                self._entries.pop(tenant_id, None)
+                self._entries.pop(None, None)
+
+    def get(self, *args):
+        """Return the cached value, rebuilding it if needed (args, e.g. a session, go to build/signature)"""
+        now = time.monotonic()
+        tenant_id = current_tenant_id()
+        with self._lock:
+            entry = self._entries.get(tenant_id)
+            generation = self._generation
+        if entry is not None and (self._signature is None or now - entry.checked_at < self._interval()):
+            return entry.value
+
+        # The queries run without the lock held: asgi.py calls this from the event loop thread
+        # (through run_sync), where waiting on another request's query would never end.
+        # Concurrent misses may each build; the last one to finish is kept.
+        signature = self._signature(*args) if self._signature else None
+        if entry is not None and signature == entry.signature:
+            with self._lock:
+                entry.checked_at = now
+            return entry.value
+
+        fresh = _Entry(self._build(*args), signature, now)
+        with self._lock:
+            if self._generation == generation:
+                self._entries[tenant_id] = fresh
+        return fresh.value
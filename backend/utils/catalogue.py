@@ -0,0 +1,80 @@
+"""
+Precomputed payload of the public services catalogue (GET /api/services)
+
+The catalogue is read by every visitor and changes a few times a week, so the whole
+response body is serialized once and kept in memory, together with its gzip (and,
+when the brotli package is installed, brotli) compressed forms and an ETag. Serving
+it is a lookup of the encoding the client accepts; no query runs and nothing is
+serialized per request.
+
+It is a DerivedCache in the 'services' group, so it is rebuilt after the admin
+endpoints commit a change (invalidate('services')), per tenant; other workers notice
+the change through the table signature, checked at most every CACHE_REVALIDATE_SECONDS.
+"""
+import gzip
+import hashlib
+import json
+from models import db, Service
+from utils.cache import DerivedCache, table_signature
+
+try:
+    import brotli
+except ImportError:   # optional: only gzip is offered without it
+    brotli = None
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 512
+
+class Catalogue:
+    """Serialized catalogue: body per content encoding ('identity', 'gzip', 'br') and its ETag"""
+    __slots__ = ('bodies', 'etag')
+
+    def __init__(self, body):
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.bodies = {'identity': body}
+        if len(body) >= MIN_COMPRESS_BYTES:
+            # mtime=0 keeps the gzip bytes identical across rebuilds and workers
+            self.bodies['gzip'] = gzip.compress(body, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.bodies['br'] = brotli.compress(body)
+
+    def negotiate(self, accept_encoding):
+        """
+        Pick the smallest body the client accepts
+
+        Args:
+            accept_encoding: Accept-Encoding request header (may be None)
+
+        Returns:
+            (encoding, body); identity is always acceptable as the fallback
+        """
+        accepted = {}
+        for item in (accept_encoding or '').split(','):
+            coding, _, params = item.strip().lower().partition(';')
+            quality = 1.0
+            if params.strip().startswith('q='):
+                try:
+                    quality = float(params.strip()[2:])
+                except ValueError:
+                    quality = 0.0
+            if coding:
+                accepted[coding] = quality
+        for encoding in ('br', 'gzip'):
+            if encoding in self.bodies and accepted.get(encoding, accepted.get('*', 0)) > 0:
+                return encoding, self.bodies[encoding]
+        return 'identity', self.bodies['identity']
+
+def build_catalogue(session=None):
+    """Serialize every service, newest first, as the {'services': [...]} response body"""
+    session = session if session is not None else db.session
+    services = session.query(Service).order_by(Service.created_at.desc()).all()
+    payload = {'services': [service.to_dict() for service in services]}
+    return Catalogue(json.dumps(payload, separators=(',', ':')).encode())
+
+catalogue_cache = DerivedCache(
+    'services', build_catalogue, signature=lambda session=None: table_signature(Service, session)
+)
+
+def get_catalogue(session=None):
+    """Current tenant's catalogue (built on first use and after changes)"""
+    return catalogue_cache.get(session)
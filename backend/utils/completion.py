@@ -0,0 +1,61 @@
+"""
+Automatic 'completed' status for past appointments
+
+Confirmed appointments that ended more than AUTO_COMPLETE_GRACE_MINUTES ago are
+marked completed by `python -m flask --app app complete-appointments`, in chunks of
+set-based UPDATE statements (one short transaction each) rather than loading rows.
+On PostgreSQL each chunk locks its rows with SKIP LOCKED, so it never waits behind
+a request that is editing one of them.
+
+Nothing derived has to be rebuilt afterwards:
+
+- occupancy bitmaps count completed appointments as busy (occupancy.BUSY_STATUSES),
+  so availability and conflict checks see exactly the same minutes
+- the dashboard stats are aggregated from the appointments table on each request
+- reminders and waitlist offers only concern appointments that have not started
+
+Bulk updates bypass the ORM, so no 'appointments' events are published for them.
+"""
+from datetime import timedelta
+from sqlalchemy import select, update
+from models import db, Appointment, get_utc_now
+
+def _session(session):
+    return session if session is not None else db.session
+
+def complete_appointments(ended_before, batch_size=5000, session=None):
+    """
+    Mark confirmed appointments that ended before `ended_before` as completed
+
+    Args:
+        ended_before: naive UTC datetime
+        batch_size: appointments updated per transaction
+        session: optional SQLAlchemy session (defaults to db.session)
+
+    Returns:
+        Number of appointments completed
+    """
+    session = _session(session)
+    table = Appointment.__table__
+    due = (table.c.status == 'confirmed', table.c.end_time < ended_before)
+    chunk = select(table.c.id).where(*due).order_by(table.c.id).limit(batch_size)
+    if session.get_bind().dialect.name == 'postgresql':
+        chunk = chunk.with_for_update(skip_locked=True)
+    # Re-check the condition in the UPDATE itself in case a row changed since it was picked
+    statement = update(table).where(table.c.id.in_(chunk.scalar_subquery()), *due).values(
+        status='completed', version=table.c.version + 1, updated_at=get_utc_now()
+    )
+
+    completed = 0
+    while True:
+        updated = session.execute(statement).rowcount
+        session.commit()
+        completed += updated
+        if updated < batch_size:
+            break
+    return completed
+
+def complete_expired(grace_minutes, batch_size=5000, session=None):
+    """Complete everything that ended more than grace_minutes ago"""
+    horizon = get_utc_now() - timedelta(minutes=grace_minutes)
+    return complete_appointments(horizon, batch_size, session)
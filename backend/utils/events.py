@@ -0,0 +1,208 @@
+"""
+Change events for availability and appointments (in-process pub/sub with a
+pluggable cross-worker backend)
+
+Every occupancy write records the tenant and UTC dates it touched on the session
+(occupancy._store); when that session commits, one event per date is published on
+the topic 'occupancy:<tenant id>:<date>'. Subscribers (the SSE streams in routes/availability.py
+and asgi.py) get a callback per event and recompute their slots. Appointment rows
+written through the ORM are likewise published on 'appointments' (id, tenant_id,
+start_time, status), which the reminder dispatcher uses to keep its queue current.
+
+The backend decides how far an event travels (EVENTS_BACKEND):
+
+- 'memory' (default): subscribers in the same process only; enough for a single
+  worker or for development
+- 'postgres': NOTIFY on publish and a LISTEN thread per process that dispatches to
+  the local subscribers, so every gunicorn/uvicorn worker sees every change
+
+Other backends (e.g. Redis pub/sub) register with register_backend() and implement
+publish(topic, payload); they call bus.dispatch() for messages they receive.
+"""
+import itertools
+import json
+import select
+import threading
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from models import Appointment
+
+CHANGED_DATES_KEY = 'occupancy_changed'
+CHANGED_APPOINTMENTS_KEY = 'appointments_changed'
+# Topic with one event per committed appointment insert/update/delete
+APPOINTMENTS_TOPIC = 'appointments'
+
+def date_topic(day, tenant_id):
+    return f'occupancy:{tenant_id}:{day.isoformat()}'
+
+class EventBus:
+    """Topic -> callbacks registry for the subscribers of this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._ids = itertools.count(1)
+
+    def subscribe(self, topics, callback):
+        """
+        Call callback(topic, payload) for every event on any of `topics`
+
+        The callback runs on the publishing thread and must not block (put the event
+        on a queue). Returns a token for unsubscribe().
+        """
+        token = next(self._ids)
+        with self._lock:
+            for topic in topics:
+                self._subscribers.setdefault(topic, {})[token] = callback
+        return token
+
+    def unsubscribe(self, token):
+        with self._lock:
+            for topic in [topic for topic, callbacks in self._subscribers.items() if token in callbacks]:
+                del self._subscribers[topic][token]
+                if not self._subscribers[topic]:
+                    del self._subscribers[topic]
+
+    def subscriber_count(self):
+        with self._lock:
+            return len({token for callbacks in self._subscribers.values() for token in callbacks})
+
+    def dispatch(self, topic, payload):
+        """Deliver an event to the local subscribers"""
+        with self._lock:
+            callbacks = list(self._subscribers.get(topic, {}).values())
+        for callback in callbacks:
+            try:
+                callback(topic, payload)
+            except Exception as e:
+                print(f"Event subscriber failed on {topic}: {e}")
+
+bus = EventBus()
+
+class MemoryBackend:
+    """Deliver events to this process only"""
+
+    def publish(self, topic, payload):
+        bus.dispatch(topic, payload)
+
+class PostgresBackend:
+    """Fan events out to every process through PostgreSQL LISTEN/NOTIFY"""
+
+    channel = 'bookease_events'
+
+    def __init__(self, database_url):
+        # libpq understands plain postgresql:// URLs, not SQLAlchemy driver suffixes
+        self.dsn = database_url.replace('postgresql+psycopg2://', 'postgresql://').replace('postgres://', 'postgresql://', 1)
+        self._publisher = None
+        self._lock = threading.Lock()
+        threading.Thread(target=self._listen, name='events-listener', daemon=True).start()
+
+    def _connect(self):
+        import psycopg2
+        connection = psycopg2.connect(self.dsn)
+        connection.autocommit = True
+        return connection
+
+    def publish(self, topic, payload):
+        message = json.dumps({'topic': topic, 'payload': payload})
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._publisher is None or self._publisher.closed:
+                        self._publisher = self._connect()
+                    with self._publisher.cursor() as cursor:
+                        cursor.execute('SELECT pg_notify(%s, %s)', (self.channel, message))
+                    return
+                except Exception:
+                    # Reconnect once (e.g. the server closed an idle connection)
+                    self._publisher = None
+                    if attempt:
+                        raise
+
+    def _listen(self):
+        import time
+        while True:
+            try:
+                connection = self._connect()
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN {self.channel}')
+                while True:
+                    if select.select([connection], [], [], 30) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        message = json.loads(connection.notifies.pop(0).payload)
+                        bus.dispatch(message['topic'], message['payload'])
+            except Exception as e:
+                print(f"Event listener disconnected, retrying: {e}")
+                time.sleep(5)
+
+_factories = {
+    'memory': lambda config: MemoryBackend(),
+    'postgres': lambda config: PostgresBackend(config['SQLALCHEMY_DATABASE_URI']),
+}
+_backend = None
+
+def register_backend(name, factory):
+    """Make a backend available under EVENTS_BACKEND=name (factory receives the app config)"""
+    _factories[name] = factory
+
+def get_backend():
+    """The configured backend (created once per process)"""
+    global _backend
+    if _backend is None:
+        from flask import current_app, has_app_context
+        if has_app_context():
+            config = current_app.config
+        else:
+            from config import Config
+            config = {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+        name = config.get('EVENTS_BACKEND', 'memory')
+        if name not in _factories:
+            raise ValueError(f'Unknown events backend: {name}')
+        _backend = _factories[name](config)
+    return _backend
+
+def publish(topic, payload):
+    try:
+        get_backend().publish(topic, payload)
+    except Exception as e:
+        # Live updates are best effort; the committed change stands either way
+        print(f"Failed to publish {topic}: {e}")
+
+def record_changed_dates(session, dates, tenant_id):
+    """Remember occupancy dates written in this transaction (published on commit)"""
+    session.info.setdefault(CHANGED_DATES_KEY, set()).update((tenant_id, day) for day in dates)
+
+def _record_appointment(target, deleted=False):
+    session = object_session(target)
+    if session is None:
+        return
+    session.info.setdefault(CHANGED_APPOINTMENTS_KEY, {})[target.id] = {
+        'id': target.id,
+        'tenant_id': target.tenant_id,
+        'start_time': target.start_time.isoformat() if target.start_time else None,
+        'status': 'deleted' if deleted else target.status
+    }
+
+@event.listens_for(Appointment, 'after_insert')
+@event.listens_for(Appointment, 'after_update')
+def _appointment_written(mapper, connection, target):
+    _record_appointment(target)
+
+@event.listens_for(Appointment, 'after_delete')
+def _appointment_deleted(mapper, connection, target):
+    _record_appointment(target, deleted=True)
+
+@event.listens_for(Session, 'after_commit')
+def _publish_committed(session):
+    for tenant_id, day in sorted(session.info.pop(CHANGED_DATES_KEY, ())):
+        publish(date_topic(day, tenant_id), {'tenant_id': tenant_id, 'date': day.isoformat()})
+    for payload in session.info.pop(CHANGED_APPOINTMENTS_KEY, {}).values():
+        publish(APPOINTMENTS_TOPIC, payload)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_rolled_back(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop(CHANGED_DATES_KEY, None)
+        session.info.pop(CHANGED_APPOINTMENTS_KEY, None)
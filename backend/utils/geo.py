@@ -0,0 +1,120 @@
+"""
+Geocoding stub and nearest-service spatial index
+
+geocode() is an offline stand-in for a real geocoder: it returns a stable point
+within GEOCODER_RADIUS_KM of GEOCODER_ORIGIN derived from the address text, so the
+same address always lands on the same coordinates. Swap it for a real provider by
+replacing geocode(); everything else only relies on Service.latitude/longitude.
+
+The index is a k-d tree over 3D unit vectors. Straight-line (chord) distance between
+unit vectors grows monotonically with great-circle distance, so plain Euclidean k-d
+tree search returns the exact k nearest points on the sphere without any special
+handling for the poles or the antimeridian.
+"""
+import hashlib
+import heapq
+import math
+from models import db, Service
+from utils.cache import DerivedCache, table_signature
+
+EARTH_RADIUS_KM = 6371.0088
+
+def _origin():
+    from flask import current_app, has_app_context
+    if has_app_context():
+        return current_app.config['GEOCODER_ORIGIN'], current_app.config['GEOCODER_RADIUS_KM']
+    return (41.3275, 19.8187), 10.0
+
+def geocode(address):
+    """
+    Offline geocoder stub
+
+    Returns:
+        (latitude, longitude) tuple, or None for an empty address
+    """
+    if not address or not address.strip():
+        return None
+    (origin_lat, origin_lng), radius_km = _origin()
+    digest = hashlib.sha256(address.strip().lower().encode('utf-8')).digest()
+    bearing = int.from_bytes(digest[:4], 'big') / 2 ** 32 * 2 * math.pi
+    distance = math.sqrt(int.from_bytes(digest[4:8], 'big') / 2 ** 32) * radius_km
+    latitude = origin_lat + (distance * math.cos(bearing)) / 111.32
+    longitude = origin_lng + (distance * math.sin(bearing)) / (111.32 * math.cos(math.radians(origin_lat)))
+    return round(latitude, 6), round(longitude, 6)
+
+def to_unit_vector(latitude, longitude):
+    lat, lng = math.radians(latitude), math.radians(longitude)
+    return (math.cos(lat) * math.cos(lng), math.cos(lat) * math.sin(lng), math.sin(lat))
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+def km_to_chord(km):
+    return 2 * math.sin(min(math.pi, km / EARTH_RADIUS_KM) / 2)
+
+class KDTree:
+    """Static 3-d tree of (point, payload) pairs, stored as nested tuples"""
+
+    def __init__(self, items):
+        self.size = len(items)
+        self.root = self._build(list(items), 0)
+
+    def _build(self, items, depth):
+        if not items:
+            return None
+        axis = depth % 3
+        items.sort(key=lambda item: item[0][axis])
+        middle = len(items) // 2
+        return (items[middle], axis,
+                self._build(items[:middle], depth + 1),
+                self._build(items[middle + 1:], depth + 1))
+
+    def nearest(self, point, k, max_distance=None):
+        """
+        k nearest items to `point`
+
+        Returns:
+            List of (distance, payload), closest first
+        """
+        heap = []  # max-heap via negated squared distances
+        limit = max_distance * max_distance if max_distance is not None else float('inf')
+
+        def visit(node):
+            if node is None:
+                return
+            (item_point, payload), axis, left, right = node
+            squared = sum((a - b) ** 2 for a, b in zip(point, item_point))
+            if squared <= limit:
+                if len(heap) < k:
+                    heapq.heappush(heap, (-squared, payload))
+                elif squared < -heap[0][0]:
+                    heapq.heapreplace(heap, (-squared, payload))
+
+            delta = point[axis] - item_point[axis]
+            near, far = (left, right) if delta < 0 else (right, left)
+            visit(near)
+            bound = -heap[0][0] if len(heap) == k else limit
+            if delta * delta <= bound:
+                visit(far)
+
+        visit(self.root)
+        return [(math.sqrt(-negated), payload) for negated, payload in sorted(heap, reverse=True)]
+
+def _build_index():
+    rows = db.session.query(Service.id, Service.latitude, Service.longitude).filter(
+        Service.latitude.isnot(None), Service.longitude.isnot(None)
+    )
+    return KDTree([(to_unit_vector(lat, lng), service_id) for service_id, lat, lng in rows])
+
+geo_index = DerivedCache('services', _build_index, signature=lambda: table_signature(Service))
+
+def nearest_services(latitude, longitude, k=5, radius_km=None):
+    """
+    Ids of the k services closest to a point
+
+    Returns:
+        List of (service_id, distance_km), closest first
+    """
+    max_chord = km_to_chord(radius_km) if radius_km is not None else None
+    hits = geo_index.get().nearest(to_unit_vector(latitude, longitude), k, max_chord)
+    return [(service_id, chord_to_km(chord)) for chord, service_id in hits]
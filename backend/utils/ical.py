@@ -0,0 +1,281 @@
+"""
+iCalendar (.ics) feeds of appointments for external calendar apps
+
+Calendar apps poll a subscribed feed every few minutes, so a poll has to be cheap
+when nothing changed:
+
+- every feed request first runs one aggregate query over the feed's appointments
+  (count, max(updated_at) and the max(updated_at) of their services); that
+  signature is the feed's ETag and Last-Modified, so an unchanged feed is answered
+  with 304 (or, for apps that do not send validators, with the body cached for
+  that signature) without loading any appointment
+- when it did change, rows are read column-only and each VEVENT is taken from a
+  per-appointment fragment cache keyed by (version, service updated_at); only
+  appointments that were created or changed since the last render are formatted
+  again. Fragments are dropped on the 'appointments' event of their appointment.
+
+Feeds are addressed by a signed token (feed_token()) instead of the JWT, because
+calendar apps cannot send an Authorization header: 'user' feeds list a client's own
+bookings, 'service' feeds (for staff) every booking of a service with the client.
+The token also names the tenant, which scopes the feed's queries, and the user it was
+issued to with their feed_generation: it stops working when that user rotates their
+feed URLs (rotate_feed_tokens()), is deleted, or, for service feeds, is no longer an admin.
+Appointments that ended more than CALENDAR_FEED_PAST_DAYS ago are left out.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from flask import current_app, has_app_context
+from itsdangerous import BadSignature, URLSafeSerializer
+from models import db, Appointment, Service, User, get_utc_now
+from utils.events import APPOINTMENTS_TOPIC, bus
+from utils.tenancy import current_tenant_or_default, tenant_scope
+
+FEED_KINDS = ('user', 'service')
+PRODID = '-//BookEase//Appointments//EN'
+# Appointment status -> VEVENT STATUS
+EVENT_STATUS = {'cancelled': 'CANCELLED'}
+
+def _session(session):
+    return session if session is not None else db.session
+
+def _config(key, default):
+    return current_app.config.get(key, default) if has_app_context() else default
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['JWT_SECRET_KEY'], salt='calendar-feed')
+
+def feed_token(kind, owner_id, issuer):
+    """Signed, URL-safe token naming a feed of the current tenant (kind is 'user' or 'service'), issued to a User"""
+    return _serializer().dumps([current_tenant_or_default(), kind, owner_id, issuer.id, issuer.feed_generation])
+
+def parse_feed_token(token, session=None):
+    """
+    Check a token made by feed_token() against its issuer (one primary-key lookup)
+
+    Returns:
+        (tenant_id, kind, owner_id), or None if the token is not valid or was revoked
+    """
+    try:
+        payload = _serializer().loads(token)
+    except BadSignature:
+        return None
+    if not isinstance(payload, list):
+        return None
+    if len(payload) == 3 and payload[1] == 'user':
+        # Issued before rotation existed: generation 0 of the feed's owner
+        payload = payload + [payload[2], 0]
+    if len(payload) != 5:
+        return None
+    tenant_id, kind, owner_id, issuer_id, generation = payload
+    if kind not in FEED_KINDS or not all(isinstance(value, int) for value in (tenant_id, owner_id, issuer_id, generation)):
+        return None
+    if kind == 'user' and issuer_id != owner_id:
+        return None
+
+    with tenant_scope(tenant_id):
+        issuer = _session(session).get(User, issuer_id)
+    if issuer is None or issuer.feed_generation != generation:
+        return None
+    if kind == 'service' and not issuer.is_admin():
+        return None
+    return tenant_id, kind, owner_id
+
+def rotate_feed_tokens(user):
+    """Revoke every feed URL issued to a user so far (call before commit)"""
+    user.feed_generation = (user.feed_generation or 0) + 1
+
+def escape_text(value):
+    """Escape a TEXT property value (RFC 5545 3.3.11)"""
+    return (value or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+def fold(line):
+    """Fold a content line at 75 octets (RFC 5545 3.1) and terminate it with CRLF"""
+    data = line.encode()
+    if len(data) <= 75:
+        return line + '\r\n'
+    parts, start = [], 0
+    while start < len(data):
+        end = min(start + (75 if not parts else 74), len(data))
+        # Never split a multi-byte character
+        while end < len(data) and (data[end] & 0xC0) == 0x80:
+            end -= 1
+        parts.append(data[start:end].decode())
+        start = end
+    return '\r\n '.join(parts) + '\r\n'
+
+def format_utc(value):
+    """Naive UTC datetime as an iCalendar UTC DATE-TIME"""
+    return value.strftime('%Y%m%dT%H%M%SZ')
+
+def _feed_filter(kind, owner_id, since):
+    owner = Appointment.user_id if kind == 'user' else Appointment.service_id
+    return owner == owner_id, Appointment.end_time >= since
+
+def _since():
+    """Start of the feed window, at day granularity so it does not change the ETag on every poll"""
+    days = _config('CALENDAR_FEED_PAST_DAYS', 90)
+    return (get_utc_now() - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+def feed_signature(kind, owner_id, since, session=None):
+    """
+    Cheap change fingerprint of a feed: one aggregate query, no rows loaded
+
+    Returns:
+        (etag, last_modified) where last_modified is a naive UTC datetime or None
+    """
+    count, appointments_changed, services_changed = _session(session).query(
+        db.func.count(Appointment.id), db.func.max(Appointment.updated_at), db.func.max(Service.updated_at)
+    ).select_from(Appointment).join(Service, Service.id == Appointment.service_id).filter(
+        *_feed_filter(kind, owner_id, since)
+    ).one()
+    stamps = [stamp for stamp in (appointments_changed, services_changed) if stamp is not None]
+    last_modified = max(stamps) if stamps else None
+    key = f'{kind}:{owner_id}:{since.isoformat()}:{count}:{appointments_changed}:{services_changed}'
+    return hashlib.sha256(key.encode()).hexdigest()[:32], last_modified
+
+def render_event(kind, row):
+    """VEVENT for one feed row (see _feed_rows)"""
+    summary = row.service_name if kind == 'user' else f'{row.service_name} - {row.email}'
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:appointment-{row.id}@bookease',
+        f'DTSTAMP:{format_utc(row.updated_at or row.created_at or row.start_time)}',
+        f'DTSTART:{format_utc(row.start_time)}',
+        f'DTEND:{format_utc(row.end_time)}',
+        # Calendar apps replace an event when its SEQUENCE goes up
+        f'SEQUENCE:{row.version - 1}',
+        f'SUMMARY:{escape_text(summary)}',
+        f'STATUS:{EVENT_STATUS.get(row.status, "CONFIRMED")}',
+    ]
+    if row.address:
+        lines.append(f'LOCATION:{escape_text(row.address)}')
+    if kind == 'service':
+        lines.append(f'DESCRIPTION:{escape_text(f"Status: {row.status}")}')
+    lines.append('END:VEVENT')
+    return ''.join(fold(line) for line in lines)
+
+class FragmentCache:
+    """Rendered VEVENTs per (feed kind, appointment), LRU-bounded"""
+
+    def __init__(self, max_entries=20000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._fragments = OrderedDict()   # (kind, appointment id) -> (stamp, text)
+        self.hits = self.misses = 0
+
+    def get(self, kind, row):
+        key = (kind, row.id)
+        stamp = (row.version, row.service_updated_at)
+        with self._lock:
+            cached = self._fragments.get(key)
+            if cached is not None and cached[0] == stamp:
+                self._fragments.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+        text = render_event(kind, row)
+        with self._lock:
+            self.misses += 1
+            self._fragments[key] = (stamp, text)
+            self._fragments.move_to_end(key)
+            while len(self._fragments) > self.max_entries:
+                self._fragments.popitem(last=False)
+        return text
+
+    def invalidate(self, appointment_id=None):
+        with self._lock:
+            if appointment_id is None:
+                self._fragments.clear()
+                return
+            for kind in FEED_KINDS:
+                self._fragments.pop((kind, appointment_id), None)
+
+fragment_cache = FragmentCache()
+
+class FeedCache:
+    """Whole rendered feeds by their signature, for apps that poll without validators"""
+
+    def __init__(self, max_feeds=1000):
+        self.max_feeds = max_feeds
+        self._lock = threading.Lock()
+        self._feeds = OrderedDict()   # (kind, owner id) -> (etag, body)
+
+    def get(self, feed, etag):
+        with self._lock:
+            cached = self._feeds.get(feed)
+            if cached is None or cached[0] != etag:
+                return None
+            self._feeds.move_to_end(feed)
+            return cached[1]
+
+    def put(self, feed, etag, body):
+        with self._lock:
+            self._feeds[feed] = (etag, body)
+            self._feeds.move_to_end(feed)
+            while len(self._feeds) > self.max_feeds:
+                self._feeds.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._feeds.clear()
+
+feed_cache = FeedCache()
+
+def _on_appointment(topic, payload):
+    if payload.get('id') is not None:
+        fragment_cache.invalidate(payload['id'])
+
+bus.subscribe([APPOINTMENTS_TOPIC], _on_appointment)
+
+def _feed_rows(kind, owner_id, since, session=None):
+    """Column-only rows of a feed, ordered by start"""
+    return _session(session).query(
+        Appointment.id, Appointment.start_time, Appointment.end_time, Appointment.status,
+        Appointment.version, Appointment.created_at, Appointment.updated_at,
+        Service.name.label('service_name'), Service.address,
+        Service.updated_at.label('service_updated_at'), User.email
+    ).join(Service, Service.id == Appointment.service_id).join(User, User.id == Appointment.user_id).filter(
+        *_feed_filter(kind, owner_id, since)
+    ).order_by(Appointment.start_time, Appointment.id)
+
+def feed_name(kind, owner_id, session=None):
+    """Calendar display name, or None if the owner does not exist"""
+    if kind == 'user':
+        return 'My appointments' if _session(session).get(User, owner_id) else None
+    service = _session(session).get(Service, owner_id)
+    return f'{service.name} bookings' if service else None
+
+def render_feed(kind, owner_id, name, since, session=None):
+    """Complete VCALENDAR text for a feed"""
+    parts = [fold(line) for line in (
+        'BEGIN:VCALENDAR', 'VERSION:2.0', f'PRODID:{PRODID}', 'CALSCALE:GREGORIAN', 'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{escape_text(name)}',
+        f'REFRESH-INTERVAL;VALUE=DURATION:PT{_config("CALENDAR_FEED_REFRESH_MINUTES", 15)}M'
+    )]
+    parts.extend(fragment_cache.get(kind, row) for row in _feed_rows(kind, owner_id, since, session))
+    parts.append(fold('END:VCALENDAR'))
+    return ''.join(parts)
+
+def get_feed(kind, owner_id, session=None):
+    """
+    Validators and body of a feed
+
+    Returns:
+        (etag, last_modified, body) where body is a callable producing the feed bytes
+        (only called when the client's copy is stale), or None if the owner does not exist
+    """
+    name = feed_name(kind, owner_id, session)
+    if name is None:
+        return None
+    since = _since()
+    etag, last_modified = feed_signature(kind, owner_id, since, session)
+
+    def body():
+        cached = feed_cache.get((kind, owner_id), etag)
+        if cached is None:
+            cached = render_feed(kind, owner_id, name, since, session).encode()
+            feed_cache.put((kind, owner_id), etag, cached)
+        return cached
+
+    return etag, last_modified, body
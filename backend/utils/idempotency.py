@@ -0,0 +1,130 @@
+"""
+Idempotency-Key support for POST endpoints
+
+A client that retries a booking after a timeout cannot tell whether the first
+attempt went through. If it sends the same Idempotency-Key header on every attempt,
+@idempotent makes the retries safe:
+
+1. the key is inserted into idempotency_keys in the request's own transaction, before
+   the view runs; a concurrent duplicate blocks on the unique (scope, key) index and
+   then finds the row
+2. the view runs and commits its change together with the key row; views that call
+   store_response() before their commit write the response onto the row in that same
+   transaction, so a booking is never committed without the response to replay
+3. otherwise a successful (2xx) response is stored on the row afterwards; any other
+   outcome removes it, so the request can simply be retried
+
+A repeat of a stored request gets the stored response (with Idempotent-Replayed:
+true) without running the view. Reusing a key for a different request body is a 422;
+a repeat while the first attempt is still running is a 409. Keys expire after
+IDEMPOTENCY_TTL_HOURS and are purged by the outbox worker.
+"""
+import hashlib
+from datetime import timedelta
+from functools import wraps
+from flask import current_app, g, jsonify, make_response, request
+from sqlalchemy.exc import IntegrityError
+from models import db, IdempotencyKey, get_utc_now
+
+HEADER = 'Idempotency-Key'
+
+def _scope():
+    from flask_jwt_extended import get_jwt_identity
+    identity = get_jwt_identity()
+    return f'user:{identity}' if identity is not None else f'ip:{request.remote_addr}'
+
+def _fingerprint():
+    digest = hashlib.sha256()
+    digest.update(f'{request.method} {request.path}\n'.encode())
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+def _lookup(scope, key):
+    """The live record for a key (an expired one is deleted so the key can be reused)"""
+    record = IdempotencyKey.query.filter_by(scope=scope, key=key).first()
+    if record is not None and record.expires_at <= get_utc_now():
+        db.session.delete(record)
+        db.session.commit()
+        return None
+    return record
+
+def _replay(record, fingerprint):
+    if record.request_hash != fingerprint:
+        return jsonify({'error': f'{HEADER} was already used for a different request'}), 422
+    if record.status_code is None:
+        return jsonify({'error': 'A request with this Idempotency-Key is still being processed'}), 409
+    response = make_response(jsonify(record.response_body), record.status_code)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def store_response(body, status_code):
+    """
+    Record a view's response on its idempotency key in the view's own transaction
+
+    Call just before the commit that makes the change; does nothing when the request
+    has no Idempotency-Key.
+    """
+    record = g.get('idempotency_record')
+    if record is not None:
+        record.status_code = status_code
+        record.response_body = body
+
+def idempotent(view):
+    """Honour the Idempotency-Key header on a view (apply below @jwt_required)"""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > 255:
+            return jsonify({'error': f'{HEADER} must be at most 255 characters'}), 400
+
+        scope, fingerprint = _scope(), _fingerprint()
+        record = _lookup(scope, key)
+        if record is not None:
+            return _replay(record, fingerprint)
+
+        ttl = timedelta(hours=current_app.config.get('IDEMPOTENCY_TTL_HOURS', 24))
+        record = IdempotencyKey(scope=scope, key=key, request_hash=fingerprint, expires_at=get_utc_now() + ttl)
+        db.session.add(record)
+        try:
+            db.session.flush()
+        except IntegrityError:
+            # Another request with this key got there first (and has finished now)
+            db.session.rollback()
+            record = _lookup(scope, key)
+            if record is None:
+                return jsonify({'error': 'Please retry the request'}), 409
+            return _replay(record, fingerprint)
+
+        g.idempotency_record = record
+        try:
+            response = make_response(view(*args, **kwargs))
+        finally:
+            g.pop('idempotency_record', None)
+        # A no-op when the view already stored its response with store_response()
+        unfinished = IdempotencyKey.query.filter_by(scope=scope, key=key, status_code=None)
+        try:
+            if 200 <= response.status_code < 300 and response.is_json:
+                unfinished.update({
+                    'status_code': response.status_code,
+                    'response_body': response.get_json()
+                }, synchronize_session=False)
+            else:
+                db.session.rollback()
+                unfinished.delete(synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Failed to store idempotent response for {key!r}: {e}")
+        return response
+    return wrapped
+
+def purge_expired(session=None):
+    """Delete expired keys; returns the number deleted"""
+    session = session if session is not None else db.session
+    deleted = session.query(IdempotencyKey).filter(
+        IdempotencyKey.expires_at < get_utc_now()
+    ).delete(synchronize_session=False)
+    session.commit()
+    return deleted
@@ -0,0 +1,48 @@
+"""
+Outbox handlers (run by the outbox worker, see utils/outbox.py)
+
+Each handler receives the message payload, runs inside an app context with its own
+session (committed on success) and raises to have the message retried.
+"""
+from models import Appointment
+from utils.notifications import Notification, get_channel
+from utils.outbox import handler
+from utils.tz import format_local
+
+def _when(appointment):
+    service = appointment.service
+    return f"{service.name} on {format_local(appointment.start_time, service.tz_name)}"
+
+@handler('notification')
+def send_notification(payload):
+    """Deliver a queued Notification through the configured channel"""
+    get_channel().send(Notification(**payload))
+
+@handler('appointment.created')
+def appointment_created(payload):
+    """Booking confirmation"""
+    appointment = Appointment.query.get(payload['appointment_id'])
+    if appointment is None or appointment.status != 'confirmed':
+        return  # deleted or cancelled before the worker got to it
+    get_channel().send(Notification(
+        appointment.user.email, 'appointment_confirmed', 'Your booking is confirmed',
+        f"You are booked for {_when(appointment)}.",
+        {'appointment_id': appointment.id}
+    ))
+
+@handler('appointment.updated')
+def appointment_updated(payload):
+    """Reschedule/cancellation notice"""
+    appointment = Appointment.query.get(payload['appointment_id'])
+    if appointment is None:
+        return
+    if payload.get('change') == 'cancelled':
+        subject, body = 'Your booking was cancelled', f"Your booking for {_when(appointment)} was cancelled."
+    elif payload.get('change') == 'rescheduled':
+        subject, body = 'Your booking was moved', f"Your booking is now {_when(appointment)}."
+    else:
+        return
+    get_channel().send(Notification(
+        appointment.user.email, f"appointment_{payload['change']}", subject, body,
+        {'appointment_id': appointment.id}
+    ))
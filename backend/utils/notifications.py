@@ -0,0 +1,87 @@
+"""
+Pluggable notification channels
+
+Code that needs to tell a user something builds Notification objects and queues
+them with outbox.enqueue_notifications() in the transaction that caused them; the
+outbox worker sends them (deliver() sends directly). Where they go is decided by the
+NOTIFICATION_CHANNEL setting:
+
+- 'log' (default): print to stdout, which ends up in the server log
+- 'file': append one JSON line per notification to NOTIFICATION_FILE (for testing)
+- 'null': drop them
+
+Other channels (email, SMS, push) register themselves with register_channel() and
+only need a send(notification) method.
+"""
+import json
+import threading
+from dataclasses import asdict, dataclass, field
+
+@dataclass
+class Notification:
+    recipient: str           # email address of the user
+    kind: str                # e.g. 'waitlist_offer', 'waitlist_booked'
+    subject: str
+    body: str
+    data: dict = field(default_factory=dict)
+
+class LogChannel:
+    """Print notifications to stdout"""
+
+    def send(self, notification):
+        print(f"[notification] {json.dumps(asdict(notification), default=str)}")
+
+class FileChannel:
+    """Append notifications as JSON lines to a file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, notification):
+        line = json.dumps(asdict(notification), default=str)
+        with self._lock, open(self.path, 'a', encoding='utf-8') as handle:
+            handle.write(line + '\n')
+
+def _file_channel():
+    from flask import current_app, has_app_context
+    path = current_app.config.get('NOTIFICATION_FILE') if has_app_context() else None
+    return FileChannel(path or 'notifications.log')
+
+class NullChannel:
+    """Discard notifications"""
+
+    def send(self, notification):
+        pass
+
+_factories = {
+    'log': LogChannel,
+    'file': _file_channel,
+    'null': NullChannel,
+}
+_channels = {}
+
+def register_channel(name, factory):
+    """Make a channel available under NOTIFICATION_CHANNEL=name (factory takes no arguments)"""
+    _factories[name] = factory
+    _channels.pop(name, None)
+
+def get_channel(name=None):
+    """The configured channel instance (created once per process)"""
+    if name is None:
+        from flask import current_app, has_app_context
+        name = current_app.config.get('NOTIFICATION_CHANNEL', 'log') if has_app_context() else 'log'
+    if name not in _channels:
+        if name not in _factories:
+            raise ValueError(f'Unknown notification channel: {name}')
+        _channels[name] = _factories[name]()
+    return _channels[name]
+
+def deliver(notifications, channel=None):
+    """Send notifications; a failing send is logged and does not affect the others"""
+    channel = channel or get_channel()
+    for notification in notifications:
+        try:
+            channel.send(notification)
+        except Exception as e:
+            print(f"Failed to send {notification.kind} notification to {notification.recipient}: {e}")
@@ -0,0 +1,206 @@
+"""
+Per-day occupancy bitmaps (one DayOccupancy row per date, one bit per minute)
+
+Availability reads a single 180-byte row per day and checks candidate slots with
+integer masks instead of loading and comparing appointment rows. The bitmaps are
+maintained in the same transaction as the appointment writes:
+
+- book_interval() ORs the new appointment into the affected days
+- refresh_interval() recomputes the affected days from the appointments table
+  (used whenever an appointment is cancelled, moved or deleted)
+
+Confirmed, completed and no-show appointments all occupy their minutes, so the periodic
+completion job (utils/completion.py) changes no bitmap.
+
+Every write also records its date on the session so an availability event is
+published once the transaction commits (see utils/events.py).
+
+rebuild_occupancy() regenerates every bitmap from scratch (flask rebuild-occupancy).
+
+Bitmaps are per tenant (DayOccupancy is keyed by tenant and date); reads and writes
+use the current tenant (utils/tenancy.py), so one tenant's bookings never touch
+another's rows or locks.
+"""
+from datetime import datetime, timedelta, time
+from models import db, Appointment, DayOccupancy
+from utils.events import record_changed_dates
+from utils.tenancy import current_tenant_or_default
+
+MINUTES_PER_DAY = 24 * 60
+BITMAP_BYTES = MINUTES_PER_DAY // 8
+# Appointment statuses that hold their time
+BUSY_STATUSES = ('confirmed', 'completed', 'no_show')
+
+def _session(session):
+    return session if session is not None else db.session
+
+def to_bytes(bits):
+    """Serialize an occupancy integer (bit i = minute i) to its column value"""
+    return bits.to_bytes(BITMAP_BYTES, 'little')
+
+def from_bytes(bitmap):
+    """Deserialize a bitmap column value to an integer"""
+    return int.from_bytes(bitmap, 'little') if bitmap else 0
+
+def range_mask(start_minute, end_minute):
+    """Integer mask with bits [start_minute, end_minute) set"""
+    if end_minute <= start_minute:
+        return 0
+    return ((1 << (end_minute - start_minute)) - 1) << start_minute
+
+def is_range_free(bits, start_minute, end_minute):
+    """True if no minute in [start_minute, end_minute) is booked"""
+    return bits & range_mask(start_minute, end_minute) == 0
+
+def split_by_day(start, end):
+    """
+    Split a datetime interval into per-day minute ranges
+
+    Partial minutes are rounded outwards so a booked second always blocks its minute.
+
+    Returns:
+        List of (date, start_minute, end_minute) tuples
+    """
+    pieces = []
+    current = start
+    while current < end:
+        day = current.date()
+        next_midnight = datetime.combine(day + timedelta(days=1), time.min)
+        piece_end = min(end, next_midnight)
+        day_start = datetime.combine(day, time.min)
+        start_minute = int((current - day_start).total_seconds() // 60)
+        end_seconds = (piece_end - day_start).total_seconds()
+        end_minute = min(MINUTES_PER_DAY, int(-(-end_seconds // 60)))
+        pieces.append((day, start_minute, end_minute))
+        current = piece_end
+    return pieces
+
+def interval_days(start, end):
+    """Dates touched by a datetime interval"""
+    return [day for day, _, _ in split_by_day(start, end)]
+
+def load_days(dates, session=None, for_update=False):
+    """
+    Load occupancy for several dates in one query
+
+    Args:
+        dates: iterable of datetime.date
+        session: optional SQLAlchemy session (defaults to db.session)
+        for_update: lock the rows (SELECT ... FOR UPDATE) to serialize concurrent writers
+
+    Returns:
+        Dict of date -> occupancy integer (0 for days without a row)
+    """
+    dates = list(dates)
+    if not dates:
+        return {}
+    query = _session(session).query(DayOccupancy).filter(DayOccupancy.date.in_(dates))
+    if for_update:
+        query = query.with_for_update()
+    loaded = {row.date: from_bytes(row.bitmap) for row in query}
+    return {day: loaded.get(day, 0) for day in dates}
+
+def load_day(date, session=None):
+    """Occupancy integer for a single date"""
+    return load_days([date], session)[date]
+
+def join_days(busy, dates):
+    """
+    Concatenate the bitmaps of consecutive dates into one integer
+
+    Bit i is minute i counted from midnight of dates[0], so an interval crossing
+    midnight is still a single mask test.
+    """
+    bits = 0
+    for offset, day in enumerate(dates):
+        bits |= busy.get(day, 0) << (offset * MINUTES_PER_DAY)
+    return bits
+
+def is_interval_free(start, end, session=None, for_update=False):
+    """Check a datetime interval against the stored bitmaps"""
+    pieces = split_by_day(start, end)
+    bits = load_days([day for day, _, _ in pieces], session, for_update)
+    return all(is_range_free(bits[day], lo, hi) for day, lo, hi in pieces)
+
+def _store(day, bits, session):
+    tenant_id = current_tenant_or_default()
+    record_changed_dates(session, [day], tenant_id)
+    row = session.get(DayOccupancy, (tenant_id, day))
+    if row is None:
+        session.add(DayOccupancy(tenant_id=tenant_id, date=day, bitmap=to_bytes(bits)))
+    else:
+        row.bitmap = to_bytes(bits)
+
+def book_interval(start, end, session=None):
+    """Mark a newly confirmed appointment as occupied (call before commit)"""
+    session = _session(session)
+    pieces = split_by_day(start, end)
+    bits = load_days([day for day, _, _ in pieces], session, for_update=True)
+    for day, lo, hi in pieces:
+        _store(day, bits[day] | range_mask(lo, hi), session)
+
+def compute_day_bits(day, session=None):
+    """Recompute one day's occupancy from the busy appointments overlapping it"""
+    session = _session(session)
+    day_start = datetime.combine(day, time.min)
+    day_end = day_start + timedelta(days=1)
+    rows = session.query(Appointment.start_time, Appointment.end_time).filter(
+        Appointment.status.in_(BUSY_STATUSES),
+        Appointment.start_time < day_end,
+        Appointment.end_time > day_start
+    )
+    bits = 0
+    for start, end in rows:
+        for piece_day, lo, hi in split_by_day(max(start, day_start), min(end, day_end)):
+            if piece_day == day:
+                bits |= range_mask(lo, hi)
+    return bits
+
+def refresh_days(dates, session=None):
+    """Recompute and store the bitmaps for the given dates (call after flush, before commit)"""
+    session = _session(session)
+    dates = sorted(set(dates))
+    load_days(dates, session, for_update=True)
+    for day in dates:
+        _store(day, compute_day_bits(day, session), session)
+
+def refresh_interval(start, end, session=None):
+    """Recompute the bitmaps of every day an interval touches"""
+    refresh_days(interval_days(start, end), session)
+
+def rebuild_occupancy(start_date=None, session=None, batch_size=5000):
+    """
+    Regenerate bitmaps from the appointments table (of the current tenant, or of every
+    tenant when none is current)
+
+    Args:
+        start_date: only rebuild days from this date on (default: all days)
+        session: optional SQLAlchemy session (defaults to db.session)
+        batch_size: rows fetched per round trip while streaming appointments
+
+    Returns:
+        Number of days written
+    """
+    session = _session(session)
+    query = session.query(Appointment.tenant_id, Appointment.start_time, Appointment.end_time).filter(
+        Appointment.status.in_(BUSY_STATUSES)
+    )
+    stale = session.query(DayOccupancy)
+    if start_date is not None:
+        floor = datetime.combine(start_date, time.min)
+        query = query.filter(Appointment.end_time > floor)
+        stale = stale.filter(DayOccupancy.date >= start_date)
+
+    days = {}
+    for tenant_id, start, end in query.yield_per(batch_size):
+        for day, lo, hi in split_by_day(start, end):
+            if start_date is None or day >= start_date:
+                days[tenant_id, day] = days.get((tenant_id, day), 0) | range_mask(lo, hi)
+
+    stale.delete(synchronize_session=False)
+    session.bulk_insert_mappings(DayOccupancy, [
+        {'tenant_id': tenant_id, 'date': day, 'bitmap': to_bytes(bits)}
+        for (tenant_id, day), bits in sorted(days.items())
+    ])
+    session.commit()
+    return len(days)
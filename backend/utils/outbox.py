@@ -0,0 +1,195 @@
+"""
+Transactional outbox and its worker
+
+Side effects of a booking change (confirmation emails, waitlist notifications,
+calendar sync, stats rollups) are not run in the request. The request adds an
+OutboxMessage row in the same transaction as the appointment, so the message exists
+exactly when the change is committed, and the only cost on the request path is that
+one insert.
+
+`python -m flask --app app outbox-worker` drains the table:
+
+1. claim a batch of due messages (FOR UPDATE SKIP LOCKED on PostgreSQL, so several
+   workers can run side by side) and mark them processing with a lease
+2. run their handlers on a thread pool, each in its own app context and session
+3. mark successes done; reschedule failures with exponential backoff and give up
+   after OUTBOX_MAX_ATTEMPTS (status 'failed')
+
+A worker that dies mid-batch leaves its messages processing until the lease runs
+out; another worker then claims them again. Handlers should therefore be idempotent.
+
+Handlers register with @handler('kind') and receive the message payload.
+"""
+import random
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from datetime import timedelta
+from models import db, OutboxMessage, get_utc_now
+
+_handlers = {}
+
+def _session(session):
+    return session if session is not None else db.session
+
+def handler(kind):
+    """Register the function that processes messages of `kind`"""
+    def register(func):
+        _handlers[kind] = func
+        return func
+    return register
+
+def enqueue(kind, payload=None, session=None, delay_seconds=0):
+    """Add a message to the outbox in the current transaction (committed with it)"""
+    message = OutboxMessage(
+        kind=kind,
+        payload=payload or {},
+        available_at=get_utc_now() + timedelta(seconds=delay_seconds)
+    )
+    _session(session).add(message)
+    return message
+
+def enqueue_notifications(notifications, session=None):
+    """Queue Notification objects for delivery once the transaction commits"""
+    for notification in notifications:
+        enqueue('notification', asdict(notification), session)
+
+def backoff_seconds(attempts, base_seconds, max_seconds=3600):
+    """Delay before retry number `attempts`: exponential with +-20% jitter, capped"""
+    delay = min(max_seconds, base_seconds * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+def claim_batch(batch_size, lease_seconds, session=None):
+    """
+    Lock up to batch_size due messages for this worker and commit the claim
+
+    Returns:
+        List of (id, kind, payload, attempts) tuples
+    """
+    session = _session(session)
+    now = get_utc_now()
+    query = session.query(OutboxMessage).filter(
+        OutboxMessage.status.in_(['pending', 'processing']),
+        OutboxMessage.available_at <= now
+    ).order_by(OutboxMessage.available_at, OutboxMessage.id).limit(batch_size)
+    if session.get_bind().dialect.name == 'postgresql':
+        query = query.with_for_update(skip_locked=True)
+
+    claimed = []
+    for message in query.all():
+        message.status = 'processing'
+        message.attempts += 1
+        message.available_at = now + timedelta(seconds=lease_seconds)
+        claimed.append((message.id, message.kind, message.payload, message.attempts))
+    session.commit()
+    return claimed
+
+def _run(app, kind, payload):
+    """Run one handler in its own app context; returns an error string or None"""
+    with app.app_context():
+        try:
+            func = _handlers.get(kind)
+            if func is None:
+                raise LookupError(f'No outbox handler for {kind!r}')
+            func(payload)
+            db.session.commit()
+            return None
+        except Exception:
+            db.session.rollback()
+            return traceback.format_exc(limit=5)
+
+def process_batch(app, executor, batch_size=100, lease_seconds=300, session=None):
+    """
+    Claim one batch, run it on the executor and record the outcomes
+
+    Returns:
+        (number processed, number failed)
+    """
+    session = _session(session)
+    config = app.config
+    claimed = claim_batch(batch_size, lease_seconds, session)
+    if not claimed:
+        return 0, 0
+
+    futures = [(message_id, attempts, executor.submit(_run, app, kind, payload))
+               for message_id, kind, payload, attempts in claimed]
+
+    failed = 0
+    now = get_utc_now()
+    done_ids = []
+    for message_id, attempts, future in futures:
+        error = future.result()
+        if error is None:
+            done_ids.append(message_id)
+            continue
+        failed += 1
+        message = session.get(OutboxMessage, message_id)
+        message.last_error = error
+        if attempts >= config['OUTBOX_MAX_ATTEMPTS']:
+            message.status = 'failed'
+        else:
+            message.status = 'pending'
+            message.available_at = now + timedelta(
+                seconds=backoff_seconds(attempts, config['OUTBOX_BACKOFF_SECONDS'])
+            )
+
+    if done_ids:
+        session.query(OutboxMessage).filter(OutboxMessage.id.in_(done_ids)).update(
+            {'status': 'done', 'processed_at': now, 'last_error': None}, synchronize_session=False
+        )
+    session.commit()
+    return len(claimed), failed
+
+def purge_done(retention_days, session=None):
+    """Delete processed messages older than retention_days; returns the number deleted"""
+    session = _session(session)
+    horizon = get_utc_now() - timedelta(days=retention_days)
+    deleted = session.query(OutboxMessage).filter(
+        OutboxMessage.status == 'done',
+        OutboxMessage.processed_at < horizon
+    ).delete(synchronize_session=False)
+    session.commit()
+    return deleted
+
+def run_worker(app, threads=4, batch_size=100, poll_interval=1.0, once=False, log=print):
+    """
+    Drain the outbox until interrupted (or until it is empty with once=True)
+
+    Full batches are followed immediately by the next claim; the worker only sleeps
+    (poll_interval) when there was nothing due.
+    """
+    import utils.jobs  # noqa: F401  (registers the handlers)
+    from utils.idempotency import purge_expired
+    from utils.revocation import purge_expired as purge_revoked
+    from utils.waitlist import expire_offers
+
+    lease_seconds = app.config['OUTBOX_LEASE_SECONDS']
+    retention_days = app.config['OUTBOX_RETENTION_DAYS']
+    last_purge = 0.0
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='outbox') as executor:
+        while True:
+            with app.app_context():
+                # Lapsed waitlist offers queue notifications for the next waiters, sent below
+                lapsed = expire_offers()
+                if lapsed:
+                    log(f"Passed on {lapsed} expired waitlist offers")
+                processed, failed = process_batch(app, executor, batch_size, lease_seconds)
+                if processed:
+                    log(f"Processed {processed} outbox messages ({failed} failed)")
+                elif time.monotonic() - last_purge > 3600:
+                    purged = purge_done(retention_days)
+                    if purged:
+                        log(f"Purged {purged} processed outbox messages")
+                    expired = purge_expired()
+                    if expired:
+                        log(f"Purged {expired} expired idempotency keys")
+                    revoked = purge_revoked()
+                    if revoked:
+                        log(f"Purged {revoked} revocations of expired tokens")
+                    last_purge = time.monotonic()
+            if processed:
+                continue
+            if once:
+                break
+            time.sleep(poll_interval)
@@ -0,0 +1,213 @@
+"""
+Rate limiting and admission control
+
+Rate limits: endpoints that are expensive to abuse (login and register hash
+passwords, booking scans and locks occupancy rows) are wrapped in @rate_limit(name,
+key). Each (limit name, client key) has a token bucket holding up to N tokens that
+refills at N per period (RATELIMIT_<NAME> = 'N/period'); a request takes one token
+or is answered 429 with Retry-After. Where buckets live is decided by
+RATELIMIT_BACKEND:
+
+- 'memory' (default): per process; with several gunicorn workers a client gets up
+  to N per worker
+- 'database': one row per bucket in rate_limit_buckets, refilled and decremented by
+  a single conditional upsert, so all workers share the limit
+
+A backend that fails lets the request through: throttling must never take the API
+down with it.
+
+Admission control: init_app() counts the requests this process is serving. Once
+MAX_IN_FLIGHT_REQUESTS are in flight, new ones are answered 429 immediately instead of
+queueing behind them, which keeps latency bounded under overload. Only meaningful
+with threaded workers (gunicorn --threads); long-lived views such as the SSE stream
+are marked @admission_exempt.
+"""
+import math
+import random
+import threading
+import time
+from functools import wraps
+from flask import current_app, g, jsonify, request
+from models import db, RateLimitBucket
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+def parse_limit(value):
+    """'10/minute' -> (capacity 10, refill rate in tokens per second)"""
+    count, _, period = value.partition('/')
+    count = int(count)
+    seconds = PERIODS[period.strip().rstrip('s') or 'second']
+    return count, count / seconds
+
+class MemoryBackend:
+    """Token buckets in this process"""
+
+    max_keys = 100000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}   # key -> (tokens, updated_at, full_at)
+
+    def consume(self, key, capacity, rate, cost=1):
+        """Take `cost` tokens; returns (allowed, tokens left)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at, _ = self._buckets.get(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            if len(self._buckets) > self.max_keys:
+                # A bucket that has refilled completely is the same as a missing one
+                for full in [key for key, (_, _, full_at) in self._buckets.items() if full_at <= now]:
+                    del self._buckets[full]
+        return allowed, tokens
+
+class DatabaseBackend:
+    """Token buckets in the rate_limit_buckets table (shared by every worker)"""
+
+    def consume(self, key, capacity, rate, cost=1):
+        """Take `cost` tokens; returns (allowed, tokens left)"""
+        table = RateLimitBucket.__table__
+        now = time.time()
+        engine = db.engine
+        if engine.dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+            least = db.func.least
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+            least = db.func.min
+        refilled = least(capacity, table.c.tokens + (now - table.c.updated_at) * rate)
+        # The conditional upsert returns a row only when a token was taken
+        statement = insert(table).values(key=key[:255], tokens=capacity - cost, updated_at=now)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.key],
+            set_={'tokens': refilled - cost, 'updated_at': now},
+            where=refilled >= cost
+        ).returning(table.c.tokens)
+        with engine.begin() as connection:
+            tokens = connection.execute(statement).scalar()
+            if random.random() < 0.001:
+                self._purge(connection, now)
+        return tokens is not None, tokens or 0.0
+
+    def _purge(self, connection, now):
+        # Buckets idle for a day have refilled under any configured limit
+        table = RateLimitBucket.__table__
+        connection.execute(table.delete().where(table.c.updated_at < now - PERIODS['day']))
+
+_factories = {
+    'memory': MemoryBackend,
+    'database': DatabaseBackend,
+}
+_backend = None
+
+def register_backend(name, factory):
+    """Make a backend available under RATELIMIT_BACKEND=name (factory takes no arguments)"""
+    _factories[name] = factory
+
+def get_backend():
+    """The configured backend (created once per process)"""
+    global _backend
+    if _backend is None:
+        name = current_app.config.get('RATELIMIT_BACKEND', 'memory')
+        if name not in _factories:
+            raise ValueError(f'Unknown rate limit backend: {name}')
+        _backend = _factories[name]()
+    return _backend
+
+def by_ip():
+    return request.remote_addr or 'unknown'
+
+def by_ip_and_email():
+    """Client address plus the email being tried (login: stops both sprays and guessing)"""
+    data = request.get_json(silent=True) or {}
+    return f"{by_ip()}:{str(data.get('email', '')).strip().lower()}"
+
+def by_user():
+    """JWT identity of the caller, or its address for anonymous requests"""
+    from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except Exception:
+        identity = None
+    return f'user:{identity}' if identity is not None else by_ip()
+
+def _too_many(retry_after):
+    response = jsonify({'error': 'Too many requests, please try again later', 'code': 'RATE_LIMITED'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+def rate_limit(name, key=by_ip):
+    """
+    Throttle a view with the token bucket configured as RATELIMIT_<NAME>
+
+    Args:
+        name: limit name, e.g. 'login' reads RATELIMIT_LOGIN
+        key: function returning the client key for the current request
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            config = current_app.config
+            limit = config.get(f'RATELIMIT_{name.upper()}')
+            if not config.get('RATELIMIT_ENABLED', True) or not limit:
+                return view(*args, **kwargs)
+            capacity, rate = parse_limit(limit)
+            try:
+                allowed, tokens = get_backend().consume(f'{name}:{key()}', capacity, rate)
+            except Exception as e:
+                print(f"Rate limiter unavailable, allowing request: {e}")
+                allowed = True
+            if not allowed:
+                return _too_many((1 - tokens) / rate)
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
+
+def admission_exempt(view):
+    """Leave a view out of the in-flight count (streams, health checks)"""
+    view.admission_exempt = True
+    return view
+
+class AdmissionController:
+    """Counts in-flight requests of this process and sheds new ones above a threshold"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    def try_enter(self, limit):
+        with self._lock:
+            if limit and self.in_flight >= limit:
+                return False
+            self.in_flight += 1
+            return True
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+admission = AdmissionController()
+
+def init_app(app):
+    """Install admission control on the app (rate limits are per view, see rate_limit)"""
+
+    @app.before_request
+    def admit_request():
+        limit = app.config.get('MAX_IN_FLIGHT_REQUESTS', 0)
+        view = app.view_functions.get(request.endpoint)
+        if not limit or view is None or getattr(view, 'admission_exempt', False):
+            return None
+        if not admission.try_enter(limit):
+            return _too_many(1)
+        g.admitted = True
+        return None
+
+    @app.teardown_request
+    def release_request(error=None):
+        if g.pop('admitted', False):
+            admission.leave()
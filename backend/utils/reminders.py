@@ -0,0 +1,243 @@
+"""
+Reminder dispatcher
+
+Reminders go out REMINDER_HOURS before each confirmed appointment. Instead of
+re-scanning the appointments table every minute, `python -m flask --app app
+reminder-dispatcher` keeps the appointments starting within the next
+max(REMINDER_HOURS) + REMINDER_WINDOW_HOURS in a min-heap keyed by fire time:
+
+- the window slides forward by loading the newly covered slice of start times,
+  plus the appointments inside the window created or changed since the previous
+  slide (updated_at; an index range scan over the window's start times)
+- appointment changes arrive as 'appointments' events (utils/events.py) and
+  reschedule or drop entries in place; stale heap entries are skipped lazily
+- due reminders are fired in batches: one query re-checks the appointments (so a
+  change the dispatcher missed never produces a wrong reminder), one records them
+  in reminders_sent, and they go out through the notification channel
+
+With EVENTS_BACKEND=memory the dispatcher sees bookings made by the web workers at
+its next slide (within SLIDE_SECONDS); use 'postgres' so changes are picked up
+immediately. reminders_sent makes sending idempotent across restarts and concurrent
+dispatchers.
+"""
+import heapq
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from models import db, Appointment, ReminderLog, get_utc_now
+from utils.events import APPOINTMENTS_TOPIC, bus, get_backend
+from utils.notifications import Notification, deliver, get_channel
+from utils.tz import format_local
+
+# How often the window slides and how long the loop sleeps at most
+SLIDE_SECONDS = 60
+# Changed rows are re-read from this long before the previous slide, so a transaction
+# that set updated_at before that slide but committed after it is not missed
+RESCAN_OVERLAP = timedelta(minutes=5)
+
+class ReminderQueue:
+    """Min-heap of pending reminders with lazy deletion (thread-safe)"""
+
+    def __init__(self, offsets):
+        """
+        Args:
+            offsets: minutes before the start at which reminders fire
+        """
+        self.offsets = sorted(set(offsets))
+        self._heap = []            # (fire_at, appointment_id, offset_minutes, start_time)
+        self._scheduled = {}       # appointment_id -> start_time its heap entries are valid for
+        self._lock = threading.Lock()
+        self.changed = threading.Event()
+
+    def __len__(self):
+        return len(self._scheduled)
+
+    def schedule(self, appointment_id, start_time, now):
+        """
+        (Re)schedule an appointment's reminders
+
+        Reminders whose time has already passed are dropped except the most recent
+        one, so an appointment booked (or seen) late still gets a single reminder.
+
+        Returns:
+            False if the appointment was already scheduled for this start (nothing changed)
+        """
+        entries = []
+        for offset in self.offsets:
+            fire_at = start_time - timedelta(minutes=offset)
+            entries.append((fire_at, appointment_id, offset, start_time))
+            if fire_at <= now:
+                break  # offsets ascend, so every larger one has passed too
+        with self._lock:
+            if start_time <= now:
+                self._scheduled.pop(appointment_id, None)
+                return True
+            if self._scheduled.get(appointment_id) == start_time:
+                return False
+            self._scheduled[appointment_id] = start_time
+            for entry in entries:
+                heapq.heappush(self._heap, entry)
+        self.changed.set()
+        return True
+
+    def cancel(self, appointment_id):
+        with self._lock:
+            self._scheduled.pop(appointment_id, None)
+
+    def _drop_stale(self):
+        while self._heap and self._scheduled.get(self._heap[0][1]) != self._heap[0][3]:
+            heapq.heappop(self._heap)
+
+    def next_fire_time(self):
+        with self._lock:
+            self._drop_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now, limit):
+        """
+        Remove and return up to `limit` reminders due at `now`
+
+        Returns:
+            List of (appointment_id, offset_minutes, start_time)
+        """
+        due = []
+        with self._lock:
+            while len(due) < limit:
+                self._drop_stale()
+                if not self._heap or self._heap[0][0] > now:
+                    break
+                _, appointment_id, offset, start_time = heapq.heappop(self._heap)
+                key = (appointment_id, offset, start_time)
+                if key not in due:
+                    due.append(key)
+        return due
+
+def _until_label(start_time, now):
+    """'in about N hours/minutes' (from now, since a late reminder is closer than its offset)"""
+    minutes = max(1, round((start_time - now).total_seconds() / 60))
+    if minutes < 90:
+        return f"{minutes} minute{'s' if minutes != 1 else ''}"
+    return f'{round(minutes / 60)} hours'
+
+class ReminderDispatcher:
+    """Sliding-window reminder scheduler (run() blocks; needs the Flask app)"""
+
+    def __init__(self, app, channel=None, batch_size=200, log=print):
+        self.app = app
+        self.channel = channel
+        self.batch_size = batch_size
+        self.log = log
+        offsets = [int(hours * 60) for hours in app.config['REMINDER_HOURS']]
+        self.queue = ReminderQueue(offsets)
+        self.horizon = timedelta(minutes=max(offsets, default=0), hours=app.config['REMINDER_WINDOW_HOURS'])
+        self.loaded_until = None
+        self.scanned_at = None
+
+    def load_window(self, now):
+        """
+        Load confirmed appointments whose start entered the window since the last call,
+        and those already inside it that were booked or changed since then
+
+        Returns:
+            Number of appointments newly scheduled or rescheduled
+        """
+        end = max(now + self.horizon, self.loaded_until or now)
+        query = db.session.query(Appointment.id, Appointment.start_time).filter(
+            Appointment.status == 'confirmed',
+            Appointment.start_time > now,
+            Appointment.start_time <= end
+        )
+        if self.loaded_until is not None:
+            query = query.filter(or_(
+                Appointment.start_time > self.loaded_until,
+                Appointment.updated_at >= self.scanned_at - RESCAN_OVERLAP
+            ))
+        count = 0
+        for appointment_id, start_time in query:
+            count += self.queue.schedule(appointment_id, start_time, now)
+        self.loaded_until = end
+        self.scanned_at = now
+        db.session.rollback()
+        return count
+
+    def on_change(self, topic, payload):
+        """'appointments' event: keep the queue in line with the committed row"""
+        start_time = datetime.fromisoformat(payload['start_time']) if payload.get('start_time') else None
+        if payload.get('status') != 'confirmed' or start_time is None:
+            self.queue.cancel(payload['id'])
+        elif self.loaded_until is not None and start_time <= self.loaded_until:
+            self.queue.schedule(payload['id'], start_time, get_utc_now())
+        else:
+            # Outside the window (or moved out of it): loaded when the window reaches it
+            self.queue.cancel(payload['id'])
+
+    def fire_due(self, now):
+        """Send one batch of due reminders; returns how many were sent"""
+        due = self.queue.pop_due(now, self.batch_size)
+        if not due:
+            return 0
+
+        ids = {appointment_id for appointment_id, _, _ in due}
+        appointments = {
+            appointment.id: appointment
+            for appointment in Appointment.query.options(
+                joinedload(Appointment.user), joinedload(Appointment.service)
+            ).filter(Appointment.id.in_(ids))
+        }
+        already_sent = set(db.session.query(
+            ReminderLog.appointment_id, ReminderLog.offset_minutes, ReminderLog.start_time
+        ).filter(ReminderLog.appointment_id.in_(ids)))
+
+        notifications = []
+        for appointment_id, offset, start_time in due:
+            appointment = appointments.get(appointment_id)
+            if (appointment is None or appointment.status != 'confirmed' or
+                    appointment.start_time != start_time or start_time <= now or
+                    (appointment_id, offset, start_time) in already_sent):
+                continue
+            db.session.add(ReminderLog(appointment_id=appointment_id, offset_minutes=offset, start_time=start_time))
+            service = appointment.service
+            notifications.append(Notification(
+                appointment.user.email, 'appointment_reminder', f'Reminder: {service.name}',
+                f"Your booking for {service.name} is on {format_local(start_time, service.tz_name)} "
+                f"(in about {_until_label(start_time, now)}).",
+                {'appointment_id': appointment_id, 'offset_minutes': offset}
+            ))
+
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another dispatcher recorded some of them first; its copy goes out instead
+            db.session.rollback()
+            return 0
+        deliver(notifications, self.channel)
+        return len(notifications)
+
+    def run(self, once=False):
+        """Dispatch until interrupted (with once=True: load the window, send what is due, return)"""
+        token = bus.subscribe([APPOINTMENTS_TOPIC], self.on_change)
+        try:
+            with self.app.app_context():
+                get_backend()  # starts the cross-worker listener, if configured
+                if self.channel is None:
+                    self.channel = get_channel()
+            while True:
+                with self.app.app_context():
+                    now = get_utc_now()
+                    loaded = self.load_window(now)
+                    if loaded:
+                        self.log(f"Loaded {loaded} appointments (window until {self.loaded_until:%Y-%m-%d %H:%M} UTC)")
+                    while (sent := self.fire_due(now)):
+                        self.log(f"Sent {sent} reminders")
+                if once:
+                    return
+                next_fire = self.queue.next_fire_time()
+                wait = SLIDE_SECONDS
+                if next_fire is not None:
+                    wait = min(wait, max(0.0, (next_fire - get_utc_now()).total_seconds()))
+                self.queue.changed.clear()
+                self.queue.changed.wait(wait)
+        finally:
+            bus.unsubscribe(token)
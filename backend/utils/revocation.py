@@ -0,0 +1,173 @@
+"""
+Revoked JWTs (logout, refresh-token rotation)
+
+Every authenticated request asks whether its token was revoked, so the answer must
+not cost a database round trip. Each worker keeps a Bloom filter of the revoked jtis
+in front of the revoked_tokens table (the shared store):
+
+- not in the filter (almost every request): not revoked, answered from memory
+- in the filter: revoked, or one of ~0.1% false positives; confirmed against the
+  table once and the answer cached
+
+Revocations made in this process are added to the filter immediately. The others
+reach it through the 'revocations' event (instant with EVENTS_BACKEND=postgres) and
+an incremental load of recent rows every REVOCATION_SYNC_SECONDS, which is also the
+longest a revoked token can still be used on another worker. Bloom filters cannot
+forget, so the filter is rebuilt from the unexpired rows once a day or when it holds
+REVOCATION_CAPACITY entries.
+"""
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from models import db, RevokedToken, get_utc_now
+from utils.events import bus, publish
+
+REVOCATIONS_TOPIC = 'revocations'
+# Rows committed late can carry an older revoked_at than the last sync saw
+SYNC_OVERLAP = timedelta(minutes=1)
+REBUILD_SECONDS = 24 * 3600
+
+class BloomFilter:
+    """Fixed-size set of strings with false positives but no false negatives"""
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+class RevocationList:
+    """Per-process view of revoked_tokens (see the module docstring)"""
+
+    max_confirmed = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._filter = None
+        self._confirmed = {}      # jti -> revoked? for filter hits checked against the table
+        self._synced_from = None  # revoked_at of the newest row loaded
+        self._next_sync = 0.0
+        self._built_at = 0.0
+
+    def _rebuild(self):
+        now = get_utc_now()
+        rows = db.session.query(RevokedToken.jti, RevokedToken.revoked_at).filter(
+            RevokedToken.expires_at > now
+        ).all()
+        capacity = current_app.config.get('REVOCATION_CAPACITY', 100000)
+        bloom = BloomFilter(max(capacity, 2 * len(rows)))
+        for jti, _ in rows:
+            bloom.add(jti)
+        with self._lock:
+            self._filter = bloom
+            self._confirmed.clear()
+            self._synced_from = max((revoked_at for _, revoked_at in rows), default=now)
+            self._built_at = time.monotonic()
+
+    def _load_recent(self):
+        rows = db.session.query(RevokedToken.jti, RevokedToken.revoked_at).filter(
+            RevokedToken.revoked_at >= self._synced_from - SYNC_OVERLAP
+        ).all()
+        for jti, revoked_at in rows:
+            self.add(jti)
+            self._synced_from = max(self._synced_from, revoked_at)
+
+    def sync(self, force=False):
+        """Load revocations from the table if the sync interval has passed"""
+        if not force and time.monotonic() < self._next_sync:
+            return
+        if not self._sync_lock.acquire(blocking=self._filter is None):
+            return  # another thread is syncing; the current filter is good enough meanwhile
+        try:
+            if not force and self._filter is not None and time.monotonic() < self._next_sync:
+                return  # synced by the thread we waited for
+            if self._filter is None or time.monotonic() - self._built_at > REBUILD_SECONDS or \
+                    self._filter.count >= current_app.config.get('REVOCATION_CAPACITY', 100000):
+                self._rebuild()
+            else:
+                self._load_recent()
+            self._next_sync = time.monotonic() + current_app.config.get('REVOCATION_SYNC_SECONDS', 5)
+        finally:
+            self._sync_lock.release()
+
+    def add(self, jti):
+        """Record a revocation in this process's filter"""
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+            self._confirmed.pop(jti, None)
+
+    def is_revoked(self, jti):
+        self.sync()
+        if jti not in self._filter:
+            return False
+        with self._lock:
+            revoked = self._confirmed.get(jti)
+        if revoked is None:
+            revoked = db.session.get(RevokedToken, jti) is not None
+            with self._lock:
+                if len(self._confirmed) >= self.max_confirmed:
+                    self._confirmed.clear()
+                self._confirmed[jti] = revoked
+        return revoked
+
+revocations = RevocationList()
+
+def _on_revoked(topic, payload):
+    revocations.add(payload['jti'])
+
+bus.subscribe([REVOCATIONS_TOPIC], _on_revoked)
+
+def is_revoked(jwt_payload):
+    """token_in_blocklist_loader: O(1) from memory unless the filter has a hit"""
+    # Tokens issued before access tokens expired have no exp: they would stay valid
+    # forever (and a revocation row for them could be purged), so none is accepted
+    if not jwt_payload.get('exp'):
+        return True
+    return revocations.is_revoked(jwt_payload['jti'])
+
+def revoke(jwt_payload):
+    """Revoke a decoded token (commits, then tells the other workers)"""
+    expires = jwt_payload.get('exp')
+    if not expires:
+        return  # rejected by is_revoked() anyway
+    expires_at = datetime.fromtimestamp(expires, timezone.utc).replace(tzinfo=None)
+    subject = jwt_payload.get('sub')
+    db.session.merge(RevokedToken(
+        jti=jwt_payload['jti'],
+        token_type=jwt_payload.get('type', 'access'),
+        user_id=int(subject) if str(subject).isdigit() else None,
+        revoked_at=get_utc_now(),
+        expires_at=expires_at
+    ))
+    db.session.commit()
+    revocations.add(jwt_payload['jti'])
+    publish(REVOCATIONS_TOPIC, {'jti': jwt_payload['jti']})
+
+def purge_expired(session=None):
+    """Delete revocations of tokens that have expired anyway; returns the number deleted"""
+    session = session if session is not None else db.session
+    deleted = session.query(RevokedToken).filter(
+        RevokedToken.expires_at < get_utc_now()
+    ).delete(synchronize_session=False)
+    session.commit()
+    return deleted
@@ -0,0 +1,85 @@
+"""
+Compiled opening schedule
+
+Working hours (several intervals per weekday) and date exceptions are compiled into
+minute intervals held in memory, so slot generation never queries the working-hours
+tables. The compiled schedule is a DerivedCache in the 'working_hours' group: the
+admin endpoints invalidate it after committing, and other workers pick changes up
+through the tables' count/max(updated_at) signature.
+"""
+from models import db, WorkingHours, WorkingHoursException
+from utils.cache import DerivedCache, table_signature
+
+def _session(session):
+    return session if session is not None else db.session
+
+def to_minutes(value):
+    """datetime.time -> minutes since midnight"""
+    return value.hour * 60 + value.minute
+
+def merge_intervals(intervals):
+    """Sort (start, end) minute intervals and merge overlapping/adjacent ones"""
+    merged = []
+    for start, end in sorted(intervals):
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return tuple(merged)
+
+class CompiledSchedule:
+    """Opening intervals per weekday plus per-date overrides, in minutes since midnight"""
+
+    def __init__(self, weekly, exceptions):
+        """
+        Args:
+            weekly: dict of day_of_week -> tuple of (start_minute, end_minute)
+            exceptions: dict of date -> tuple of intervals (empty tuple = closed)
+        """
+        self.weekly = weekly
+        self.exceptions = exceptions
+
+    def intervals_for(self, date):
+        """Opening intervals for a date, e.g. ((540, 720), (780, 1080)) for 9-12 and 13-18"""
+        if date in self.exceptions:
+            return self.exceptions[date]
+        return self.weekly.get(date.weekday(), ())
+
+    def is_open(self, date):
+        return bool(self.intervals_for(date))
+
+    def open_minutes(self, date):
+        """Minutes the business is open on a date"""
+        return sum(end - start for start, end in self.intervals_for(date))
+
+def compile_schedule(session=None):
+    """Build a CompiledSchedule from the working hours and exception tables"""
+    session = _session(session)
+
+    weekly = {}
+    for row in session.query(WorkingHours).filter_by(is_available=True):
+        weekly.setdefault(row.day_of_week, []).append((to_minutes(row.start_time), to_minutes(row.end_time)))
+
+    closed, special = set(), {}
+    for row in session.query(WorkingHoursException):
+        if row.is_closed or row.start_time is None or row.end_time is None:
+            closed.add(row.date)
+        else:
+            special.setdefault(row.date, []).append((to_minutes(row.start_time), to_minutes(row.end_time)))
+
+    exceptions = {day: merge_intervals(intervals) for day, intervals in special.items()}
+    exceptions.update({day: () for day in closed})
+    return CompiledSchedule(
+        {day: merge_intervals(intervals) for day, intervals in weekly.items()}, exceptions
+    )
+
+def _signature(session=None):
+    return table_signature(WorkingHours, session), table_signature(WorkingHoursException, session)
+
+schedule_cache = DerivedCache('working_hours', compile_schedule, signature=_signature)
+
+def get_schedule(session=None):
+    """Current compiled schedule (rebuilt only after working-hours changes)"""
+    return schedule_cache.get(_session(session))
@@ -0,0 +1,169 @@
+"""
+Server-side search over the services catalogue
+
+Matching uses a prebuilt index: the GIN tsvector index on PostgreSQL, or an
+in-process inverted index (token -> service ids, with prefix lookup over the sorted
+vocabulary) elsewhere. Either way matching yields lightweight candidates
+(id, price, duration, created_at, score); range filters, facets, sorting and
+pagination run on those, and only the requested page is loaded as full rows.
+"""
+import bisect
+import math
+import re
+from collections import defaultdict
+from models import db, Service, service_search_vector
+from utils.cache import DerivedCache, table_signature
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# Field weights for relevance in the in-process index
+FIELD_WEIGHTS = (('name', 3.0), ('address', 1.5), ('description', 1.0))
+
+PRICE_BUCKETS = [(0, 25), (25, 50), (50, 100), (100, 200), (200, None)]
+DURATION_BUCKETS = [(0, 30), (30, 60), (60, 120), (120, None)]
+
+SORTS = {
+    'relevance': (lambda c: (-c.score, -c.created_ts), False),
+    'price_asc': (lambda c: (c.price, c.id), False),
+    'price_desc': (lambda c: (c.price, c.id), True),
+    'duration': (lambda c: (c.duration, c.id), False),
+    'newest': (lambda c: (c.created_ts, c.id), True),
+}
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+class Candidate:
+    """Search hit with just the columns needed to filter, facet and sort"""
+    __slots__ = ('id', 'price', 'duration', 'created_ts', 'score')
+
+    def __init__(self, id, price, duration, created_at, score=0.0):
+        self.id = id
+        self.price = float(price) if price is not None else 0.0
+        self.duration = duration
+        self.created_ts = created_at.timestamp() if created_at else 0.0
+        self.score = score
+
+    def with_score(self, score):
+        hit = Candidate(self.id, self.price, self.duration, None, score)
+        hit.created_ts = self.created_ts
+        return hit
+
+class ServiceIndex:
+    """In-process inverted index over name, description and address"""
+
+    def __init__(self, rows):
+        self.documents = {}
+        self.postings = defaultdict(dict)
+        for row in rows:
+            self.documents[row.id] = Candidate(row.id, row.price, row.duration_minutes, row.created_at)
+            for field, weight in FIELD_WEIGHTS:
+                for token in tokenize(getattr(row, field)):
+                    self.postings[token][row.id] = self.postings[token].get(row.id, 0.0) + weight
+        self.vocabulary = sorted(self.postings)
+
+    def _expand(self, term):
+        """Vocabulary tokens starting with `term` (so 'hair' also finds 'haircut')"""
+        position = bisect.bisect_left(self.vocabulary, term)
+        while position < len(self.vocabulary) and self.vocabulary[position].startswith(term):
+            yield self.vocabulary[position]
+            position += 1
+
+    def search(self, terms):
+        """Candidates matching every term, scored by weighted term frequency x idf"""
+        if not terms:
+            return [doc.with_score(0.0) for doc in self.documents.values()]
+
+        total = len(self.documents) or 1
+        scores = None
+        for term in terms:
+            term_scores = defaultdict(float)
+            for token in self._expand(term):
+                posting = self.postings[token]
+                idf = math.log(1 + total / len(posting))
+                for service_id, weight in posting.items():
+                    term_scores[service_id] += weight * idf
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {sid: score + term_scores[sid] for sid, score in scores.items() if sid in term_scores}
+            if not scores:
+                return []
+
+        return [self.documents[service_id].with_score(score) for service_id, score in scores.items()]
+
+def _build_index():
+    return ServiceIndex(db.session.query(
+        Service.id, Service.name, Service.description, Service.address,
+        Service.price, Service.duration_minutes, Service.created_at
+    ))
+
+service_index = DerivedCache('services', _build_index, signature=lambda: table_signature(Service))
+
+def _postgres_candidates(terms):
+    """Match through the GIN index; prefix query so partial words match as they do in-process"""
+    columns = [Service.id, Service.price, Service.duration_minutes, Service.created_at]
+    if not terms:
+        return [Candidate(*row) for row in db.session.query(*columns)]
+
+    tsquery = db.func.to_tsquery('english', ' & '.join(f'{term}:*' for term in terms))
+    vector = service_search_vector()
+    rows = db.session.query(*columns, db.func.ts_rank(vector, tsquery)).filter(vector.op('@@')(tsquery))
+    return [Candidate(*row) for row in rows]
+
+def _in_range(value, low, high):
+    return (low is None or value >= low) and (high is None or value <= high)
+
+def _facet(values, buckets):
+    counts = []
+    for low, high in buckets:
+        count = sum(1 for value in values if value >= low and (high is None or value < high))
+        counts.append({'min': low, 'max': high, 'count': count})
+    return counts
+
+def search_services(query='', min_price=None, max_price=None, min_duration=None, max_duration=None,
+                    sort=None, page=1, per_page=20):
+    """
+    Search the catalogue
+
+    Args:
+        query: free text matched against name, description and address (prefix match per word)
+        min_price/max_price, min_duration/max_duration: inclusive range filters (None = open)
+        sort: one of SORTS (default: relevance with a query, newest without)
+        page, per_page: 1-based pagination
+
+    Returns:
+        Dict with the page of services, totals and facet counts
+    """
+    terms = tokenize(query)
+    if db.session.get_bind().dialect.name == 'postgresql':
+        candidates = _postgres_candidates(terms)
+    else:
+        candidates = service_index.get().search(terms)
+
+    # Facets describe the text matches; each facet ignores its own range filter
+    price_matches = [c for c in candidates if _in_range(c.duration, min_duration, max_duration)]
+    duration_matches = [c for c in candidates if _in_range(c.price, min_price, max_price)]
+    filtered = [c for c in price_matches if _in_range(c.price, min_price, max_price)]
+
+    sort = sort or ('relevance' if terms else 'newest')
+    key, reverse = SORTS[sort]
+    filtered.sort(key=key, reverse=reverse)
+
+    total = len(filtered)
+    start = (page - 1) * per_page
+    page_ids = [c.id for c in filtered[start:start + per_page]]
+    services = {s.id: s for s in Service.query.filter(Service.id.in_(page_ids))} if page_ids else {}
+
+    return {
+        'services': [services[sid].to_dict() for sid in page_ids if sid in services],
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'pages': math.ceil(total / per_page) if total else 0,
+        'sort': sort,
+        'facets': {
+            'price': _facet([c.price for c in price_matches], PRICE_BUCKETS),
+            'duration_minutes': _facet([c.duration for c in duration_matches], DURATION_BUCKETS)
+        }
+    }
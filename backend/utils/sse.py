@@ -0,0 +1,45 @@
+"""
+Helpers shared by the server-sent events endpoints (Flask and ASGI)
+
+A stream subscribes to the occupancy topics of the UTC dates a local day can
+overlap, sends the day's slots once ('snapshot') and then only what changed
+('delta': slots added and removed) after each committed booking change.
+"""
+import json
+from datetime import timedelta
+from utils.events import date_topic
+
+# Browsers reconnect after this many milliseconds when a stream ends
+RETRY_MS = 3000
+
+def day_topics(day, tenant_id):
+    """Topics that can affect a local date's slots (its UTC span is within day-1..day+1)"""
+    return [date_topic(day + timedelta(days=offset), tenant_id) for offset in (-1, 0, 1)]
+
+def sse_message(event, data, event_id=None):
+    """Format one server-sent event"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+def sse_retry():
+    return f'retry: {RETRY_MS}\n\n'
+
+def sse_keepalive():
+    # Comment line: keeps proxies from closing an idle connection, ignored by EventSource
+    return ': keepalive\n\n'
+
+def diff_slots(previous, latest):
+    """
+    Delta between two {epoch_minute: serialized slot} dicts
+
+    Returns:
+        Dict with the 'added' and 'removed' serialized slots, in time order
+    """
+    return {
+        'added': [latest[minute] for minute in sorted(latest.keys() - previous.keys())],
+        'removed': [previous[minute] for minute in sorted(previous.keys() - latest.keys())]
+    }
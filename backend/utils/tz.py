@@ -0,0 +1,140 @@
+"""
+Timezones for the scheduling engine
+
+Appointments and occupancy bitmaps are stored in UTC; working hours are local
+wall-clock times of the service's location. Slot computation therefore runs in
+integer UTC minutes since the epoch ("epoch minutes"): each local day's opening
+intervals are mapped to UTC once, through a per-(timezone, date) offset table that
+records where the UTC offset changes during that day (DST transitions), and the
+result is converted back to local time only when a slot is serialized.
+
+Local times that do not exist (the hour skipped when clocks go forward) or exist
+twice (the hour repeated when they go back) resolve like zoneinfo with fold=0:
+skipped times are shifted forward, repeated times take the first occurrence.
+"""
+import bisect
+import math
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+MINUTES_PER_DAY = 24 * 60
+EPOCH = datetime(1970, 1, 1)
+EPOCH_DATE = EPOCH.date()
+
+def default_timezone():
+    """Timezone for services without one (DEFAULT_TIMEZONE)"""
+    from flask import current_app, has_app_context
+    if has_app_context():
+        return current_app.config.get('DEFAULT_TIMEZONE', 'UTC')
+    from config import Config
+    return Config.DEFAULT_TIMEZONE
+
+@lru_cache(maxsize=None)
+def get_zone(name):
+    """ZoneInfo for an IANA name (raises ZoneInfoNotFoundError / ValueError if unknown)"""
+    return ZoneInfo(name)
+
+def is_valid_timezone(name):
+    if not isinstance(name, str) or not name.strip():
+        return False
+    try:
+        get_zone(name.strip())
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+    return True
+
+def epoch_minute(value):
+    """Naive UTC datetime -> epoch minute (partial minutes round down)"""
+    return int((value - EPOCH).total_seconds() // 60)
+
+def epoch_minute_ceil(value):
+    """Naive UTC datetime -> epoch minute (partial minutes round up)"""
+    return math.ceil((value - EPOCH).total_seconds() / 60)
+
+def from_epoch_minute(minute):
+    """Epoch minute -> naive UTC datetime"""
+    return EPOCH + timedelta(minutes=minute)
+
+def date_epoch_minute(day):
+    """Epoch minute of UTC midnight on a date"""
+    return (day - EPOCH_DATE).days * MINUTES_PER_DAY
+
+def epoch_minute_date(minute):
+    """UTC date containing an epoch minute"""
+    return EPOCH_DATE + timedelta(days=minute // MINUTES_PER_DAY)
+
+def _offset_minutes(zone, day, minute):
+    local = datetime(day.year, day.month, day.day) + timedelta(minutes=minute)
+    return int(local.replace(tzinfo=zone).utcoffset().total_seconds() // 60)
+
+@lru_cache(maxsize=8192)
+def day_offsets(tz_name, day):
+    """
+    UTC offsets in effect during a local day
+
+    Offsets are sampled every hour and the exact minute of any change is found by
+    bisection, so a day costs ~25 zone lookups (and is then cached).
+
+    Returns:
+        Tuple of (local_start_minute, offset_minutes) pairs, sorted, first one at minute 0
+    """
+    zone = get_zone(tz_name)
+    samples = [min(hour * 60, MINUTES_PER_DAY - 1) for hour in range(25)]
+    offsets = [_offset_minutes(zone, day, minute) for minute in samples]
+
+    table = [(0, offsets[0])]
+    for (low, low_offset), (high, high_offset) in zip(zip(samples, offsets), zip(samples[1:], offsets[1:])):
+        if low_offset == high_offset:
+            continue
+        # First minute in (low, high] with the new offset
+        while high - low > 1:
+            middle = (low + high) // 2
+            if _offset_minutes(zone, day, middle) == low_offset:
+                low = middle
+            else:
+                high = middle
+        table.append((high, high_offset))
+    return tuple(table)
+
+def local_to_epoch(tz_name, day, minute):
+    """Local wall-clock minute of a date -> epoch minute"""
+    table = day_offsets(tz_name, day)
+    position = bisect.bisect_right(table, (minute, float('inf'))) - 1
+    return date_epoch_minute(day) + minute - table[position][1]
+
+def utc_windows(tz_name, day, intervals):
+    """
+    Map a local day's opening intervals (minutes since local midnight) to epoch minutes
+
+    Returns:
+        Tuple of (open_epoch_minute, close_epoch_minute) pairs; empty intervals are dropped
+    """
+    windows = []
+    for start, end in intervals:
+        open_minute, close_minute = local_to_epoch(tz_name, day, start), local_to_epoch(tz_name, day, end)
+        if close_minute > open_minute:
+            windows.append((open_minute, close_minute))
+    return tuple(windows)
+
+def local_today(tz_name):
+    """Current date at the given timezone"""
+    return datetime.now(get_zone(tz_name)).date()
+
+def to_local(minute, tz_name):
+    """Epoch minute -> aware datetime in the given timezone"""
+    return from_epoch_minute(minute).replace(tzinfo=timezone.utc).astimezone(get_zone(tz_name))
+
+def to_utc_naive(value, tz_name):
+    """
+    Normalize a parsed request datetime to naive UTC (the storage format)
+
+    Aware values are converted; naive values are wall-clock time at tz_name.
+    """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=get_zone(tz_name))
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def format_local(value, tz_name, fmt='%Y-%m-%d at %H:%M'):
+    """Naive UTC datetime -> formatted local wall-clock time (for messages)"""
+    return value.replace(tzinfo=timezone.utc).astimezone(get_zone(tz_name)).strftime(fmt)
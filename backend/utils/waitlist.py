@@ -0,0 +1,186 @@
+"""
+Waitlist matching and slot reallocation
+
+Each (service, local date) is a queue of WaitlistEntry rows served first come, first
+served; the ix_waitlist_queue index (service_id, date, status, created_at) keeps a
+bucket's waiting entries in queue order, so finding the next waiter reads the head
+of one small index range instead of scanning the table. On PostgreSQL the head row
+is locked with SKIP LOCKED so two concurrent cancellations never hand their slots to
+the same waiter.
+
+reallocate_slot() runs inside the transaction that freed the slot (cancel, move or
+delete): the waiter is either booked straight away (auto_book) or offered the slot
+for WAITLIST_OFFER_MINUTES, and the caller queues the returned notifications in the
+outbox (utils/outbox.py) so they are sent only if the transaction commits.
+
+Offers that lapse unanswered are swept by the outbox worker (expire_offers()): the
+entry goes back to waiting at its original position and the slot is passed on to
+the next waiter in the same transaction.
+"""
+from datetime import time, timedelta, timezone
+from models import db, Appointment, WaitlistEntry, get_utc_now
+from utils import occupancy, tz
+from utils.notifications import Notification
+from utils.outbox import enqueue_notifications
+from utils.tenancy import tenant_scope
+
+def _session(session):
+    return session if session is not None else db.session
+
+def _offer_minutes():
+    from flask import current_app, has_app_context
+    return current_app.config.get('WAITLIST_OFFER_MINUTES', 30) if has_app_context() else 30
+
+def _local(value, tz_name):
+    """Naive UTC datetime -> aware local datetime"""
+    return value.replace(tzinfo=timezone.utc).astimezone(tz.get_zone(tz_name))
+
+def next_waiter(service, start, end, session=None, skip=None):
+    """
+    Head of the service's queue for the local date of `start` whose window holds [start, end)
+
+    `skip` is the id of an entry to pass over (the one that just let this slot lapse).
+    """
+    session = _session(session)
+    local_start, local_end = _local(start, service.tz_name), _local(end, service.tz_name)
+    # A slot running past local midnight only fits an entry open until closing
+    end_of_slot = local_end.time() if local_end.date() == local_start.date() else time.max
+
+    query = session.query(WaitlistEntry).filter(
+        WaitlistEntry.service_id == service.id,
+        WaitlistEntry.date == local_start.date(),
+        WaitlistEntry.status == 'waiting',
+        db.or_(WaitlistEntry.window_start.is_(None), WaitlistEntry.window_start <= local_start.time()),
+        db.or_(WaitlistEntry.window_end.is_(None), WaitlistEntry.window_end >= end_of_slot)
+    ).order_by(WaitlistEntry.created_at, WaitlistEntry.id)
+    if skip is not None:
+        query = query.filter(WaitlistEntry.id != skip)
+    if session.get_bind().dialect.name == 'postgresql':
+        query = query.with_for_update(skip_locked=True)
+    return query.first()
+
+def _book(entry, service, start, end, session):
+    appointment = Appointment(
+        user_id=entry.user_id,
+        service_id=service.id,
+        start_time=start,
+        end_time=end,
+        status='confirmed'
+    )
+    session.add(appointment)
+    session.flush()
+    occupancy.book_interval(start, end, session)
+    entry.status = 'booked'
+    entry.offered_start = start
+    entry.appointment_id = appointment.id
+    return appointment
+
+def _describe(service, start):
+    return f"{service.name} on {_local(start, service.tz_name).strftime('%Y-%m-%d at %H:%M')}"
+
+def reallocate_slot(service, start, end, session=None, skip=None):
+    """
+    Hand a slot freed by a cancellation/move/deletion to the next eligible waiter
+
+    Call after the change that freed it has been flushed and the occupancy refreshed,
+    before commit.
+
+    Args:
+        service: Service the freed appointment was for
+        start, end: naive UTC interval of the freed appointment
+        session: optional SQLAlchemy session (defaults to db.session)
+        skip: optional id of an entry not to hand the slot to
+
+    Returns:
+        List of Notification to queue with outbox.enqueue_notifications()
+    """
+    session = _session(session)
+    if start < get_utc_now():
+        return []
+    if not occupancy.is_interval_free(start, end, session, for_update=True):
+        return []
+
+    entry = next_waiter(service, start, end, session, skip)
+    if entry is None:
+        return []
+
+    data = {'waitlist_entry_id': entry.id, 'service_id': service.id, 'start_time': start.isoformat()}
+    if entry.auto_book:
+        appointment = _book(entry, service, start, end, session)
+        return [Notification(
+            entry.user.email, 'waitlist_booked', 'A waitlisted slot was booked for you',
+            f"You are booked for {_describe(service, start)}.",
+            dict(data, appointment_id=appointment.id)
+        )]
+
+    entry.status = 'offered'
+    entry.offered_start = start
+    entry.offer_expires_at = get_utc_now() + timedelta(minutes=_offer_minutes())
+    return [Notification(
+        entry.user.email, 'waitlist_offer', 'A slot you are waiting for is free',
+        f"{_describe(service, start)} is available. Accept within {_offer_minutes()} minutes to book it.",
+        dict(data, offer_expires_at=entry.offer_expires_at.isoformat())
+    )]
+
+def accept_offer(entry, session=None):
+    """
+    Book the slot offered to a waitlist entry (call before commit)
+
+    If the slot was taken in the meantime the entry goes back to waiting.
+
+    Returns:
+        (Appointment or None, error message or None)
+    """
+    session = _session(session)
+    if entry.status != 'offered' or entry.offered_start is None:
+        return None, 'There is no open offer for this waitlist entry'
+    now = get_utc_now()
+    if entry.offer_expires_at is not None and entry.offer_expires_at < now:
+        return None, 'This offer has expired'
+
+    service = entry.service
+    start = entry.offered_start
+    end = start + timedelta(minutes=service.duration_minutes)
+    if start < now or not occupancy.is_interval_free(start, end, session, for_update=True):
+        entry.status = 'waiting'
+        entry.offered_start = None
+        entry.offer_expires_at = None
+        return None, 'The offered slot is no longer available; you are back on the waitlist'
+
+    return _book(entry, service, start, end, session), None
+
+def expire_offers(batch_size=100, session=None):
+    """
+    Put entries whose offer lapsed back in the queue and hand their slots on (commits)
+
+    Each slot goes to the next waiter other than the one that let it lapse, in the same
+    transaction as the requeue; runs for every tenant, each entry under its own.
+
+    Returns:
+        Number of offers expired
+    """
+    session = _session(session)
+    expired = 0
+    while True:
+        query = session.query(WaitlistEntry).filter(
+            WaitlistEntry.status == 'offered',
+            WaitlistEntry.offer_expires_at < get_utc_now()
+        ).order_by(WaitlistEntry.offer_expires_at).limit(batch_size)
+        if session.get_bind().dialect.name == 'postgresql':
+            query = query.with_for_update(skip_locked=True)
+        entries = query.all()
+        for entry in entries:
+            with tenant_scope(entry.tenant_id):
+                service = entry.service
+                start = entry.offered_start
+                entry.status = 'waiting'
+                entry.offered_start = None
+                entry.offer_expires_at = None
+                session.flush()
+                enqueue_notifications(reallocate_slot(
+                    service, start, start + timedelta(minutes=service.duration_minutes), session, skip=entry.id
+                ), session)
+        session.commit()
+        expired += len(entries)
+        if len(entries) < batch_size:
+            return expired
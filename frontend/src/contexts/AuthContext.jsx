@@ -25,6 +25,7 @@ export const AuthProvider = ({ children }) => {
         api.defaults.headers.common['Authorization'] = `Bearer ${token}`
       } catch (error) {
         localStorage.removeItem('token')
+        localStorage.removeItem('refresh_token')
         localStorage.removeItem('user')
       }
     }
@@ -34,9 +35,10 @@ export const AuthProvider = ({ children }) => {
   const login = async (email, password) => {
     try {
       const response = await api.post('/auth/login', { email, password })
-      const { access_token, user } = response.data
+      const { access_token, refresh_token, user } = response.data
       
       localStorage.setItem('token', access_token)
+      localStorage.setItem('refresh_token', refresh_token)
       localStorage.setItem('user', JSON.stringify(user))
       api.defaults.headers.common['Authorization'] = `Bearer ${access_token}`
       
@@ -68,9 +70,10 @@ export const AuthProvider = ({ children }) => {
   const register = async (email, password, role = 'client') => {
     try {
       const response = await api.post('/auth/register', { email, password, role })
-      const { access_token, user } = response.data
+      const { access_token, refresh_token, user } = response.data
       
       localStorage.setItem('token', access_token)
+      localStorage.setItem('refresh_token', refresh_token)
       localStorage.setItem('user', JSON.stringify(user))
       api.defaults.headers.common['Authorization'] = `Bearer ${access_token}`
       
@@ -100,7 +103,13 @@ export const AuthProvider = ({ children }) => {
   }
 
   const logout = () => {
+    // Revoke both tokens server-side; the local session ends either way
+    const refreshToken = localStorage.getItem('refresh_token')
+    if (localStorage.getItem('token')) {
+      api.post('/auth/logout', { refresh_token: refreshToken }).catch(() => {})
+    }
     localStorage.removeItem('token')
+    localStorage.removeItem('refresh_token')
     localStorage.removeItem('user')
     delete api.defaults.headers.common['Authorization']
     setUser(null)
@@ -85,6 +85,28 @@ const MyAppointments = () => {
     }
   }
 
+  const handleSubscribe = async () => {
+    try {
+      const response = await api.get('/calendar/feed-url')
+      await navigator.clipboard.writeText(response.data.url)
+      toast.success('Calendar feed URL copied - add it to your calendar app as a subscription')
+    } catch (error) {
+      const errorMsg = error.response?.data?.error || 'Failed to get calendar feed URL'
+      toast.error(errorMsg)
+    }
+  }
+
+  const handleResetFeed = async () => {
+    try {
+      const response = await api.post('/calendar/feed-url/rotate')
+      await navigator.clipboard.writeText(response.data.url)
+      toast.success('New calendar feed URL copied - previously shared links no longer work')
+    } catch (error) {
+      const errorMsg = error.response?.data?.error || 'Failed to reset calendar feed URL'
+      toast.error(errorMsg)
+    }
+  }
+
   const formatDateTime = (dateString) => {
     const date = new Date(dateString)
     return date.toLocaleString('en-US', {
@@ -120,12 +142,27 @@ const MyAppointments = () => {
           <h1>My Appointments</h1>
           <p className="page-subtitle">Manage your booked appointments</p>
         </div>
-        <button
-          onClick={() => navigate('/book')}
-          className="btn btn-primary"
-        >
-          + Book New Appointment
-        </button>
+        <div className="page-header-actions">
+          <button
+            onClick={handleSubscribe}
+            className="btn btn-secondary"
+          >
+            Subscribe in Calendar
+          </button>
+          <button
+            onClick={handleResetFeed}
+            className="btn btn-secondary"
+            title="Revoke previously shared calendar links"
+          >
+            Reset Calendar Link
+          </button>
+          <button
+            onClick={() => navigate('/book')}
+            className="btn btn-primary"
+          >
+            + Book New Appointment
+          </button>
+        </div>
       </div>
 
       <div className="status-filters">
@@ -255,6 +255,7 @@ const AdminAppointments = () => {
                         <option value="confirmed">Confirmed</option>
                         <option value="cancelled">Cancelled</option>
                         <option value="completed">Completed</option>
+                        <option value="no_show">No-show</option>
                       </select>
                     </td>
                   </tr>
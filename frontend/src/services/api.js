@@ -4,10 +4,14 @@ const API_BASE_URL = import.meta.env.VITE_API_URL
   ? `${import.meta.env.VITE_API_URL}/api` 
   : '/api'
 
+// On a multi-tenant backend each deployment of the frontend names its business
+const TENANT = import.meta.env.VITE_TENANT
+
 const api = axios.create({
   baseURL: API_BASE_URL,
   headers: {
-    'Content-Type': 'application/json'
+    'Content-Type': 'application/json',
+    ...(TENANT ? { 'X-Tenant': TENANT } : {})
   }
 })
 
@@ -30,13 +34,49 @@ api.interceptors.request.use(
   }
 )
 
+// Access tokens are short-lived: renew them with the refresh token once, then retry.
+// Concurrent requests that expire together share a single refresh call.
+let refreshPromise = null
+
+const refreshAccessToken = () => {
+  const refreshToken = localStorage.getItem('refresh_token')
+  if (!refreshToken) {
+    return Promise.reject(new Error('No refresh token'))
+  }
+  if (!refreshPromise) {
+    refreshPromise = axios.post(`${API_BASE_URL}/auth/refresh`, null, {
+      headers: { Authorization: `Bearer ${refreshToken}` }
+    }).then((response) => {
+      const { access_token, refresh_token } = response.data
+      localStorage.setItem('token', access_token)
+      localStorage.setItem('refresh_token', refresh_token)
+      api.defaults.headers.common['Authorization'] = `Bearer ${access_token}`
+      return access_token
+    }).finally(() => {
+      refreshPromise = null
+    })
+  }
+  return refreshPromise
+}
+
 api.interceptors.response.use(
   (response) => response,
-  (error) => {
+  async (error) => {
     const status = error.response?.status
     const url = error.config?.url || ''
     const errorData = error.response?.data || {}
     
+    if (status === 401 && errorData?.code === 'TOKEN_EXPIRED' && error.config && !error.config._retried) {
+      try {
+        const accessToken = await refreshAccessToken()
+        error.config._retried = true
+        error.config.headers.Authorization = `Bearer ${accessToken}`
+        return api(error.config)
+      } catch (refreshError) {
+        // Fall through: the session is over
+      }
+    }
+    
     // NEVER logout on booking/appointments endpoints - these are user actions
     // Only logout on actual authentication failures (expired/invalid token)
     const isBookingEndpoint = url.includes('/appointments') || url.includes('/availability')
@@ -54,6 +94,7 @@ api.interceptors.response.use(
       // Don't logout if it's a booking endpoint - just show error
       if (isAuthError && !isBookingEndpoint && !window.location.pathname.includes('/login')) {
         localStorage.removeItem('token')
+        localStorage.removeItem('refresh_token')
         localStorage.removeItem('user')
         delete api.defaults.headers.common['Authorization']
         window.location.href = '/login'